@@ -58,14 +58,40 @@
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
-import seaborn as sns
+
+from bikeshare import bytes_per_row, load_bike
+from bikeshare.correlation import rolling_corr
+from bikeshare.cube import build_cube, cube_path, rollup, save_cube
+from bikeshare.figures import REPORT_RC, draw
+from bikeshare.load import data_version
+from bikeshare.query import QueryIndex
+from bikeshare.report import ReportData
+from bikeshare.stats import NUMERICAL_COLUMNS, stream_stats
+from bikeshare.timeindex import HourlyIndex
+
+
+# Confidence intervals of the means in the point and bar plots:
+# 't' or 'normal' (analytic, from the cube) or 'bootstrap' (resampled rows)
+ci_method = 't'
+
+# Relationship plots (In[28]-In[31]): 'binned' draws a density grid with a
+# closed-form least-squares line, 'scatter' the original seaborn regplot
+relationship_mode = 'binned'
+
+# Per-stage timings and memory: run with BIKESHARE_PROFILE=trace.jsonl set (and
+# BIKESHARE_PROFILE_MEMORY=1 for allocation peaks), then summarize the hot spots
+# with  python -m bikeshare profile trace.jsonl --flame trace.folded
 
 
 # In[2]:
 
 
 # Importing data
-bike = pd.read_csv('london_merged.csv')
+# load_bike parses with explicit dtypes, applies the renaming and mappings below
+# and keeps a columnar snapshot in .bikeshare_cache, so later runs skip parsing;
+# validate='strict' stops here if a row has an unknown code, an implausible
+# measurement, a repeated timestamp or a wrong weekend flag (bikeshare.validate)
+bike = load_bike('london_merged.csv', validate='strict')
 
 
 # In[3]:
@@ -99,8 +125,8 @@ bike.info()
 # In[7]:
 
 
-# Value counts of the column weather_code
-bike.weather_code.value_counts()
+# Value counts of the column weather
+bike.weather.value_counts()
 
 
 # In[8]:
@@ -113,84 +139,41 @@ bike.season.value_counts()
 # In[9]:
 
 
-# Renaming the columns
-new_cols_dict = {
-    'timestamp':'time',
-    'cnt':'count', 
-    't1':'temp_real_C',
-    't2':'temp_feels_like_C',
-    'hum':'humidity_percent',
-    'wind_speed':'wind_speed_kph',
-    'weather_code':'weather',
-    'is_holiday':'is_holiday',
-    'is_weekend':'is_weekend',
-    'season':'season'
-}
-
-bike.rename(new_cols_dict, axis=1, inplace=True)
-
-
-# In[10]:
-
-
-# Converting humididty into percentage 
-bike.humidity_percent=bike.humidity_percent/100
-
-
-# In[11]:
-
-
-# Renaming the seasons
-season_dict = {
-    '0.0':'spring',
-    '1.0':'summer',
-    '2.0':'autumn',
-    '3.0':'winter'
-}
-bike.season = bike.season.astype('str')
-bike.season = bike.season.map(season_dict)
-
+# Renaming the columns, converting humidity into a fraction, renaming the
+# seasons and weather codes (straight to categorical codes) and formatting
+# 'time' are done by load_bike; see COLUMN_NAMES, SEASONS and WEATHER in
+# bikeshare/prepare.py
+bike.dtypes
 
-# In[12]:
-
-
-# Renaming the weather
-weather_dict = {
-    '1.0':'Clear',
-    '2.0':'Scattered clouds',
-    '3.0':'Broken clouds',
-    '4.0':'Cloudy',
-    '7.0':'Rain',
-    '10.0':'Rain with thunderstorm',
-    '26.0':'Snowfall'
-}
-bike.weather = bike.weather.astype('str')
-bike.weather = bike.weather.map(weather_dict)
 
+# In[15]:
 
-# In[13]:
 
+# Extracting data from the column time
+# year, month, dayofweek and hour are derived by load_bike in one pass over the
+# epoch seconds (calendar_parts in bikeshare/prepare.py)
+bike[['time', 'year', 'month', 'dayofweek', 'hour']].head()
 
-# Converting 'season' and 'weather' to categorical
-bike['season'] = bike['season'].astype('category')
-bike['weather'] = bike['weather'].astype('category')
 
+# In[15b]:
 
-# In[14]:
 
+# Opt-in compact layout: int8 flags and calendar parts, float32 measurements
+bike_compact = load_bike('london_merged.csv', compact=True)
+print(f'Bytes per row: {bytes_per_row(bike):.1f} -> {bytes_per_row(bike_compact):.1f}')
 
-# Format 'time'
-bike['time'] = pd.to_datetime(bike['time'])
 
+# In[15c]:
 
-# In[15]:
 
-
-# Extracting data from the column time 
-bike['year'] = bike['time'].dt.year
-bike['month'] = bike['time'].dt.month
-bike['dayofweek'] = bike['time'].dt.dayofweek
-bike['hour'] = bike['time'].dt.hour
+# Missing hours, a binary-searched time range and 24h / 7 day moving averages
+hourly = HourlyIndex(bike)
+print(hourly.gap_report())
+summer_2016_weekdays = hourly.select('2016-06-01', '2016-09-01', weekdays=True)
+print(f'Summer 2016 weekdays: {len(summer_2016_weekdays)} hours, '
+      f'mean count {summer_2016_weekdays["count"].mean():.0f}')
+moving = pd.DataFrame({'24h': hourly.rolling('count', '24h'), '7 days': hourly.rolling('count', '7D')})
+moving.tail()
 
 
 # In[16]:
@@ -233,26 +216,18 @@ bike.describe()
 # In[49]:
 
 
-# Setting font size
-plt.rc('font', size=14)
-plt.rc('axes', labelsize=14, titlesize=15)
-plt.rc('legend', fontsize=14)
-plt.rc('xtick', labelsize=10)
-plt.rc('ytick', labelsize=10)
-
-# Numerical columns in the London bike share dataset
-numerical_columns = ['count', 'temp_real_C', 'temp_feels_like_C', 'humidity_percent', 'wind_speed_kph']
+# Setting font size (REPORT_RC: the sizes previously set with plt.rc)
+plt.rcParams.update(REPORT_RC)
 
-# Plotting histograms
-plt.figure(figsize=(20, 15))
-for i, column in enumerate(numerical_columns, 1):
-    plt.subplot(3, 2, i)
-    sns.histplot(data=bike, x=column, bins=20, color='orange', edgecolor='black', linewidth=3)
-    plt.xlabel(column)
-    plt.ylabel('Frequency')
-    plt.title(f'Histogram of {column}')
+# Every figure of the report is a named job in bikeshare/figures.py, so the
+# same figures can be rendered headlessly in parallel with
+#   python -m bikeshare.figures london_merged.csv --out figures --format png svg
+# which also writes the summary tables and reuses unchanged tables and figures
+# from a content-addressed cache (.bikeshare_cache/results)
+report = ReportData('london_merged.csv', ci_method=ci_method, relationship_mode=relationship_mode)
 
-plt.tight_layout()
+# Plotting histograms of the numerical columns
+draw('histograms', report)
 plt.show()
 
 
@@ -273,7 +248,18 @@ plt.show()
 
 
 #Correlation 
-bike.corr()
+bike.corr(numeric_only=True)
+
+
+# In[18b]:
+
+
+# Streaming statistics: the CSV is read in chunks and only one-pass accumulators
+# are kept, so this also works on years of raw data that do not fit in memory
+stats = stream_stats('london_merged.csv')
+print('Largest difference from the in-memory corr():',
+      (stats.corr() - bike[NUMERICAL_COLUMNS].corr()).abs().max().max())
+stats.describe()
 
 
 # These are the correlation coefficients between different variables in your dataset. Correlation coefficients range from -1 to 1, where:
@@ -313,11 +299,7 @@ bike.corr()
 
 
 #Correlation Heatmap
-corr_matrix = bike[['count', 'temp_real_C', 'month', 'dayofweek', 'hour', 'temp_feels_like_C', 'humidity_percent', 'wind_speed_kph']].corr()
-plt.figure(figsize = (10, 6))
-sns.heatmap(corr_matrix, annot = True, cmap = 'Spectral', linewidths = .5)
-plt.title('Correlation Heatmap')
-plt.xticks(rotation = 45)
+draw('heatmap', report)
 plt.show()
 
 
@@ -329,16 +311,36 @@ plt.show()
 # There is a weak positive correlation between hour and count (0.32), indicating that certain hours of the day are associated with higher bike shares counts.
 # There is a weak positive correlation between wind speed and count (0.116295), indicating that a slight tendency for bike shares to increase with higher wind speeds.
 
+# In[40b]:
+
+
+# The same correlations per season, and how the correlations with count move
+# over a rolling 30-day window (bikeshare/correlation.py)
+draw('heatmap_by_season', report)
+plt.show()
+monthly_corr = rolling_corr(bike, '30D')
+monthly_corr.xs('count', level=1)[['temp_real_C', 'humidity_percent', 'hour', 'wind_speed_kph']].plot(figsize=(15, 6))
+plt.title('Correlation with count over the previous 30 days')
+plt.ylabel('Correlation')
+plt.show()
+
+
+# In[19]:
+
+
+# Count cube: n, sum and sum of squares of 'count' for every combination of
+# year, month, dayofweek, hour, season, weather, is_holiday and is_weekend.
+# The charts and tables below are roll-ups of the cube instead of full rescans.
+cube = build_cube(bike)
+save_cube(cube, cube_path('london_merged.csv'))
+rollup(cube, 'year')
+
+
 # In[20]:
 
 
 #Bike Shares by Year
-plt.figure(figsize=(10, 6))
-sns.barplot(x='year', y='count', data=bike, estimator=sum, ci=None)
-plt.title('Bike Shares by Year')
-plt.xlabel('Year')
-plt.ylabel('Count of Bike Shares')
-plt.xticks(rotation=45)
+draw('by_year', report)
 plt.show()
 
 
@@ -348,13 +350,7 @@ plt.show()
 
 
 #Bike Shares by Hour
-plt.figure(figsize=(10, 6))
-sns.barplot(x='hour', y='count', data=bike, estimator=sum, ci=None)
-sns.lineplot(x='hour', y='count', data=bike, marker='x', linestyle='-', color='black', estimator=sum)
-plt.title('Total Bike Shares by Hour')
-plt.xlabel('Hour')
-plt.ylabel('Total No. of Bike Shares')
-plt.xticks(rotation=45)
+draw('by_hour', report)
 plt.show()
 
 
@@ -374,13 +370,7 @@ plt.show()
 
 
 #Bike Shares by Week
-plt.figure(figsize=(10, 6))
-sns.barplot(x='dayofweek', y='count', data=bike, estimator=sum, ci=None, color='orange')
-sns.lineplot(x='dayofweek', y='count', data=bike, estimator=sum, ci=None, color='black')
-plt.title('Total Bike Rentals by Day of Week')
-plt.xlabel('Day of Week')
-plt.ylabel('Total No. of Bike Rentals')
-plt.xticks(rotation=45)
+draw('by_dayofweek', report)
 plt.show()
 
 
@@ -397,10 +387,7 @@ plt.show()
 
 
 #Weekend and weekday
-plt.figure(dpi=150)
-bike.is_weekend.value_counts().plot(kind="pie", autopct='%1.1f%%')
-plt.ylabel("")
-plt.title("Weekend vs. Weekday Bike Shares")
+draw('weekend_pie', report)
 plt.show()
 
 
@@ -412,12 +399,8 @@ plt.show()
 
 
 #Set of plots using hour
-fig, axs = plt.subplots(nrows=4,ncols=1,figsize=(12,10), dpi=100)
-sns.pointplot(data=bike, x="hour", y="count", ax=axs[0])
-sns.pointplot(data=bike, x="hour", y="count", ax=axs[1], hue="is_holiday")
-sns.pointplot(data=bike, x="hour", y="count", ax=axs[2], hue="is_weekend")
-sns.pointplot(data=bike, x="hour", y="count", ax=axs[3], hue="season")
-plt.tight_layout()
+draw('hour_points', report)
+plt.show()
 
 
 # These plots provides a detailed breakdown of the average number of bike shares for each hour, categorized by holiday status, weekend status, and season. Here's an overview of the key insights from the data:
@@ -445,16 +428,20 @@ plt.tight_layout()
 # 
 # These insights can help in understanding the overall patterns of bike share usage, which can be valuable for resource allocation, marketing strategies, and operational planning for bike share services.
 
+# In[25b]:
+
+
+# The same kind of question through the cached query API: mean bike shares by
+# hour on summer weekends in clear or lightly clouded weather
+queries = QueryIndex.from_bike(bike, data_version('london_merged.csv'))
+queries.query('hour', season='summer', is_weekend=1, weather=['Clear', 'Scattered clouds'])[['n', 'mean']].T
+
+
 # In[26]:
 
 
 #Bike Shares by Weather conditions
-plt.figure(figsize=(10, 6))
-sns.barplot(x='weather', y='count', data=bike, estimator=sum, ci=None)
-plt.title('Bike Shares by Weather Condition')
-plt.xlabel('Weather Condition')
-plt.ylabel('Count of Bike Shares')
-plt.xticks(rotation=45)
+draw('by_weather', report)
 plt.show()
 
 
@@ -474,12 +461,7 @@ plt.show()
 
 
 #Bike Shares by Season
-plt.figure(figsize=(10, 6))
-sns.barplot(x='season', y='count', data=bike)
-plt.title('Bike Shares by Season')
-plt.xlabel('Season')
-plt.ylabel('Count of Bike Shares')
-plt.xticks(rotation = 45)
+draw('by_season', report)
 plt.show()
 
 
@@ -489,11 +471,7 @@ plt.show()
 
 
 #Temperature vs. No of Bike Shares
-plt.figure(figsize = (10, 6))
-sns.regplot(x = 'temp_real_C', y = 'count', data = bike, scatter_kws = {'alpha':0.1}, line_kws = {'color': 'red'})
-plt.title('Temperature vs. Bike Shares')
-plt.xlabel('Real Temperature (°C)')
-plt.ylabel('Count of Bike Shares')
+draw('temp_real', report)
 plt.show()
 
 
@@ -503,11 +481,7 @@ plt.show()
 
 
 #Feels like Temp vs. No of Bike Shares
-plt.figure(figsize = (10, 6))
-sns.regplot(x = 'temp_feels_like_C', y = 'count', data = bike, scatter_kws = {'alpha':0.1}, line_kws = {'color': 'red'})
-plt.title('Feels like Temp vs. Bike Shares')
-plt.xlabel('Feels like Temperature (°C)')
-plt.ylabel('Count of Bike Shares')
+draw('temp_feels_like', report)
 plt.show()
 
 
@@ -517,11 +491,7 @@ plt.show()
 
 
 #Humidity vs. No of Bike Shares
-plt.figure(figsize = (10, 6))
-sns.regplot(x = 'humidity_percent', y = 'count', data = bike, scatter_kws = {'alpha':0.1}, line_kws = {'color': 'red'})
-plt.title('Humidity vs. Bike Shares')
-plt.xlabel('Humidity')
-plt.ylabel('Count of Bike Shares')
+draw('humidity', report)
 plt.show()
 
 
@@ -531,11 +501,7 @@ plt.show()
 
 
 #Plot of Wind Speed vs. No of Bike Shares
-plt.figure(figsize = (10, 6))
-sns.regplot(x = 'wind_speed_kph', y = 'count', data = bike, scatter_kws = {'alpha':0.1}, line_kws = {'color': 'red'})
-plt.title('Wind Speed vs. Bike Shares')
-plt.xlabel('Wind Speed (°C)')
-plt.ylabel('Count of Bike Shares')
+draw('wind_speed', report)
 plt.show()
 
 
@@ -545,10 +511,8 @@ plt.show()
 
 
 #Set of plots using season
-fig, axs = plt.subplots(nrows=2,ncols=1,figsize=(12,6), dpi=100)
-sns.pointplot(data=bike, x="dayofweek", y="count", ax=axs[0])
-sns.pointplot(data=bike, x="dayofweek", y="count", ax=axs[1], hue="season")
-plt.tight_layout()
+draw('dayofweek_points', report)
+plt.show()
 
 
 # The graph follows the same pattern in each season. That indicated that the bike share increases throughout the week and dropping on the weekends the only difference the the difference in count between season. As people use less bikes in the colder months.
@@ -557,11 +521,57 @@ plt.tight_layout()
 
 
 #No of bike Shares by season and weather condition 
-sns.catplot(data=bike, x="weather", col="season", kind="count", height=7, aspect=1.5, col_wrap=2)
+draw('season_weather', report)
+plt.show()
 
 
 # As expected the count is decreasing in cold and wet weather and increasing in sunny weather.
 
+# In[33b]:
+
+
+# Hourly forecasts of count from the same factors: ridge regression on the
+# hour, day, season, weather and flag effects plus the measurements, trained on
+# everything before October 2016 and scored on the hours after it
+from bikeshare.forecast import DemandModel
+
+held_out = bike['time'] >= '2016-10-01'
+forecaster = DemandModel().fit(bike[~held_out])
+print(forecaster.score(bike[held_out]))
+plt.figure(figsize=(12, 5))
+last_week = bike[held_out].tail(24 * 7)
+plt.plot(last_week['time'], last_week['count'], label='count')
+plt.plot(last_week['time'], forecaster.predict(last_week), label='forecast')
+plt.title('Forecast vs. Bike Shares, Last Week')
+plt.legend()
+plt.show()
+
+
+# In[33c]:
+
+
+# Hours far from the usual count of the same hour, day, season and holiday
+# flag, scored in time order against the hours before them
+from bikeshare.anomaly import replay
+
+detector, scores = replay(bike)
+unusual = bike.loc[scores['anomaly'], ['time', 'count']].join(scores[['expected', 'z']])
+print(unusual.reindex(unusual['z'].abs().sort_values(ascending=False).index).head(10))
+
+
+# In[33d]:
+
+
+# What-if grid for the recommendations: move part of the weekday rush-hour
+# hires to the middle of the day (hourly pricing) and promote Clear hours,
+# then compare the fleet needed for 99% of the hours
+from bikeshare.scenario import Scenarios, scenario_grid
+
+scenarios = Scenarios(bike)
+what_if = scenarios.evaluate(scenario_grid(np.linspace(0, 0.3, 7), weather={'Clear': [0, 0.05, 0.1]}))
+print(what_if.pivot(index='peak_shift', columns='weather=Clear', values='fleet'))
+
+
 # Bike Share Analysis Report
 # 
 # Introduction:
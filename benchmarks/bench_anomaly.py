@@ -0,0 +1,81 @@
+"""Anomaly detector throughput in events per second, streaming and batch.
+
+On ``--events`` synthetic prepared hours:
+
+- ``batch``: ``AnomalyDetector.score`` over all of them in one call,
+- ``micro_batch``: the same events in calls of ``--micro-batch`` hours,
+- ``stream_key``: ``observe_key`` per event (keys precomputed), the inline
+  cost once the ingest path knows the key,
+- ``stream``: ``observe`` per event from a timestamp, count and flags,
+
+and the streamed z-scores and flags are checked against the batch ones.
+
+    python -m benchmarks.bench_anomaly --events 1e7 --stream-events 1e6 --out anomaly.json
+"""
+import argparse
+import sys
+import time
+
+import numpy as np
+
+from bikeshare.anomaly import AnomalyDetector, baseline_keys
+from bikeshare.prepare import prepare_bike
+from bikeshare.synthetic import synthetic_raw
+
+from .common import write_results
+
+
+def timed(function):
+    start = time.perf_counter()
+    result = function()
+    return result, time.perf_counter() - start
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--events', type=float, default=1e7)
+    parser.add_argument('--stream-events', type=float, default=1e6, help='events fed one by one')
+    parser.add_argument('--micro-batch', type=int, default=1000)
+    parser.add_argument('--threshold', type=float, default=4.0)
+    parser.add_argument('--out', default='-', help='JSON result file (default: stdout)')
+    args = parser.parse_args(argv)
+    events, streamed = int(args.events), int(min(args.stream_events, args.events))
+    bike = prepare_bike(synthetic_raw(events), compact=True)[['time', 'count', 'hour', 'dayofweek', 'season',
+                                                              'is_holiday']]
+    results = []
+
+    def record(stage, n, seconds, **extra):
+        results.append({'stage': stage, 'events': n, 'seconds': seconds, 'events_per_second': n / seconds, **extra})
+        print(f'{stage:12s} {n:>12,d} events {seconds:8.3f} s {n / seconds / 1e6:8.3f} M events/s', file=sys.stderr)
+
+    batch, seconds = timed(lambda: AnomalyDetector(args.threshold).score(bike))
+    record('batch', events, seconds, anomalies=int(batch['anomaly'].sum()))
+
+    detector = AnomalyDetector(args.threshold)
+    step = args.micro_batch
+    _, seconds = timed(lambda: [detector.score(bike.iloc[i:i + step]) for i in range(0, events, step)])
+    record('micro_batch', events, seconds, batch=step)
+
+    head = bike.iloc[:streamed]
+    keys = baseline_keys(head).tolist()
+    counts = head['count'].to_numpy(dtype=np.float64).tolist()
+    detector = AnomalyDetector(args.threshold)
+    scored, seconds = timed(lambda: [detector.observe_key(k, c) for k, c in zip(keys, counts)])
+    record('stream_key', streamed, seconds)
+    z = np.array([s[0] for s in scored])
+    expected = batch.iloc[:streamed]
+    mismatched = int(np.sum(np.array([s[1] for s in scored]) != expected['anomaly'].to_numpy()))
+    results.append({'stage': 'check', 'events': streamed, 'flag_mismatches': mismatched,
+                    'max_abs_z_difference': float(np.nanmax(np.abs(z - expected['z'].to_numpy()), initial=0))})
+
+    rows = list(zip(head['time'].dt.to_pydatetime(), counts, head['is_holiday'].tolist(),
+                    head['season'].astype(str).tolist()))
+    detector = AnomalyDetector(args.threshold)
+    _, seconds = timed(lambda: [detector.observe(t, c, h, s) for t, c, h, s in rows])
+    record('stream', streamed, seconds)
+    write_results(args.out, 'anomaly', results)
+    return 1 if mismatched else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,102 @@
+"""Cross-backend check and timing of the load/prepare/group-sum stages.
+
+For each size a london_merged-shaped CSV is generated (not timed), then the
+same group sums (with and without filters) are computed by every backend of
+``bikeshare.backends``: pandas (parse + prepare through ``load_bike``, then
+from its snapshot) and arrow at each ``--threads`` count. Every answer is
+compared with the pandas one: counts and integer sums must be equal and
+float sums agree to ``--rtol``. Exits 1 on any difference.
+
+    python -m benchmarks.bench_backends --sizes 1e6,1e7 --threads 1,4 --out backends.json
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+
+import numpy as np
+from pandas.testing import assert_frame_equal
+
+from bikeshare.backends import available_backends, get_backend
+from bikeshare.synthetic import write_synthetic_csv
+
+from .common import measure, parse_sizes, write_results
+
+QUERIES = [
+    ('hour', ['count'], None),
+    (['season', 'weather'], ['count', 'temp_real_C'], None),
+    (['year', 'dayofweek'], ['count'], {'season': 'summer', 'is_weekend': 1}),
+    (['month'], ['count', 'humidity_percent'], {'hour': [7, 8, 17, 18], 'weather': ['Clear', 'Rain']}),
+]
+
+
+def query_name(by, filters):
+    name = '+'.join([by] if isinstance(by, str) else by)
+    return name + (' where ' + ','.join(sorted(filters)) if filters else '')
+
+
+def max_relative_error(expected, got):
+    worst = 0.0
+    for column in expected.columns:
+        a, b = expected[column].to_numpy(np.float64), got[column].to_numpy(np.float64)
+        worst = max(worst, float(np.max(np.abs(a - b) / np.maximum(np.abs(a), 1), initial=0)))
+    return worst
+
+
+def run_size(rows, workdir, threads, rtol):
+    path = os.path.join(workdir, f'bike_{rows}.csv')
+    write_synthetic_csv(path, rows)
+    engines = [('pandas', get_backend('pandas', cache_dir=os.path.join(workdir, 'cache')))]
+    if 'arrow' in available_backends():
+        engines += [(f'arrow/{n}', get_backend('arrow', threads=n)) for n in threads]
+    results, failures = [], 0
+    for by, columns, filters in QUERIES:
+        expected = None
+        for label, backend in engines:
+            frame, timings = measure(backend.group_sums, path, by, columns, filters, memory=False)
+            result = {'rows': rows, 'stage': query_name(by, filters), 'backend': label, 'groups': len(frame),
+                      'rows_per_second': rows / timings['seconds'], **timings}
+            if expected is None:
+                expected = frame
+            else:
+                try:
+                    assert_frame_equal(expected, frame, check_exact=False, rtol=rtol)
+                    result['max_relative_error'] = max_relative_error(expected, frame)
+                except AssertionError as e:
+                    failures += 1
+                    result['mismatch'] = str(e).splitlines()[0]
+            results.append(result)
+            print(f'{rows:>12,d} {label:9s} {result["stage"]:36s} {timings["seconds"]:8.3f} s '
+                  f'cpu {timings["cpu_seconds"]:8.3f} s' + (' MISMATCH' if 'mismatch' in result else ''),
+                  file=sys.stderr)
+    os.remove(path)
+    return results, failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=parse_sizes, default=parse_sizes('1e5,1e6'))
+    parser.add_argument('--threads', type=parse_sizes, default=parse_sizes(f'1,{os.cpu_count() or 1}'),
+                        help='thread counts of the arrow backend')
+    parser.add_argument('--rtol', type=float, default=1e-12, help='relative tolerance of float sums')
+    parser.add_argument('--workdir', help='directory for the generated CSV files')
+    parser.add_argument('--out', default='-', help='JSON result file (default: stdout)')
+    args = parser.parse_args(argv)
+    threads = sorted(set(args.threads))
+    workdir = args.workdir or tempfile.mkdtemp(prefix='bikeshare-backends-')
+    results, failures = [], 0
+    try:
+        for rows in args.sizes:
+            size_results, size_failures = run_size(rows, workdir, threads, args.rtol)
+            results.extend(size_results)
+            failures += size_failures
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+    write_results(args.out, 'backends', results, cpu_count=os.cpu_count(), failures=failures)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,59 @@
+"""Cold-start time of the stats-only command line path.
+
+Runs ``python -m bikeshare stats`` in fresh interpreters (after one warm-up
+run that writes the snapshot) and reports wall-clock percentiles.
+
+    python -m benchmarks.bench_coldstart --runs 20 --target 0.3 --out coldstart.json
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from .common import write_results
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run_once(path, extra=()):
+    start = time.perf_counter()
+    subprocess.run([sys.executable, '-m', 'bikeshare', 'stats', path, *extra],
+                   cwd=ROOT, check=True, stdout=subprocess.DEVNULL)
+    return time.perf_counter() - start
+
+
+def run_once_python():
+    start = time.perf_counter()
+    subprocess.run([sys.executable, '-c', 'pass'], check=True)
+    return time.perf_counter() - start
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('path', nargs='?', default=os.path.join(ROOT, 'london_merged.csv'))
+    parser.add_argument('--runs', type=int, default=20)
+    parser.add_argument('--target', type=float, default=0.3, help='median wall time to stay under, in seconds')
+    parser.add_argument('--out', default='-')
+    args = parser.parse_args(argv)
+    run_once(args.path)
+    baseline = [run_once_python() for _ in range(max(3, args.runs // 4))]
+    times = sorted(run_once(args.path) for _ in range(args.runs))
+    median = statistics.median(times)
+    results = [{
+        'stage': 'stats_cli',
+        'runs': args.runs,
+        'seconds': median,
+        'p90_seconds': times[int(0.9 * (len(times) - 1))],
+        'min_seconds': times[0],
+        'interpreter_seconds': statistics.median(baseline),
+    }]
+    write_results(args.out, 'coldstart', results, target_seconds=args.target)
+    print(f'stats CLI median {median * 1000:.0f} ms (bare interpreter {results[0]["interpreter_seconds"] * 1000:.0f} ms, '
+          f'target {args.target * 1000:.0f} ms)', file=sys.stderr)
+    return 0 if median <= args.target else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,126 @@
+"""Column store benchmark: opening memory-mapped prepared data at any size.
+
+For each size a column store of synthetic prepared rows is written chunk by
+chunk (timed, but outside the read stages), then:
+
+- ``open``: read the schema and map every column,
+- ``to_frame``: build the DataFrame over the maps,
+- ``scan``: sum ``count`` (reads every page of one column),
+- ``shared``: ``--processes`` processes open the store and scan it at once;
+  their proportional set size (Linux) shows the pages being shared,
+- ``npz_load``: for comparison, load the same rows from an ``.npz`` snapshot
+  (only up to ``--npz-max-rows``).
+
+    python -m benchmarks.bench_colstore --sizes 1e6,1e7,1e8 --out colstore.json
+"""
+import argparse
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from bikeshare.colstore import ColumnStore, write_column_store
+from bikeshare.load import frame_to_arrays
+from bikeshare.prepare import prepare_bike
+from bikeshare.synthetic import iter_synthetic
+
+from .common import measure, parse_sizes, write_results
+
+
+def _prepared_chunks(rows, compact, chunksize=1_000_000):
+    for raw in iter_synthetic(rows, chunksize):
+        yield frame_to_arrays(prepare_bike(raw, compact=compact))
+
+
+def _memory_kb():
+    # Rss and Pss of this process, in kB, from /proc (None elsewhere)
+    try:
+        with open('/proc/self/smaps_rollup') as f:
+            fields = dict(line.split()[:2] for line in f if line.split()[0] in ('Rss:', 'Pss:'))
+        return {'rss_kb': int(fields['Rss:']), 'pss_kb': int(fields['Pss:'])}
+    except OSError:
+        return None
+
+
+def _open_and_scan(directory, barrier):
+    store = ColumnStore(directory)
+    total = float(store['count'].sum(dtype=np.float64))
+    # Wait until every process has scanned, so Pss is measured with all mappings live
+    barrier.wait()
+    return total, _memory_kb()
+
+
+def _shared(directory, processes):
+    start = time.perf_counter()
+    with multiprocessing.Manager() as manager, ProcessPoolExecutor(processes) as pool:
+        barrier = manager.Barrier(processes)
+        results = list(pool.map(_open_and_scan, [directory] * processes, [barrier] * processes))
+    seconds = time.perf_counter() - start
+    memory = [m for _, m in results if m]
+    timings = {'seconds': seconds, 'processes': processes}
+    if memory:
+        timings['mean_rss_kb'] = sum(m['rss_kb'] for m in memory) / len(memory)
+        timings['mean_pss_kb'] = sum(m['pss_kb'] for m in memory) / len(memory)
+    return timings
+
+
+def run_size(rows, workdir, processes, compact, npz_max_rows):
+    directory = os.path.join(workdir, f'store_{rows}')
+    stages = []
+
+    def record(name, timings):
+        stages.append({'rows': rows, 'stage': name, **timings})
+        print(f'{rows:>12,d} {name:10s} {timings["seconds"]:9.4f} s', file=sys.stderr)
+
+    start = time.perf_counter()
+    write_column_store(directory, _prepared_chunks(rows, compact), rows)
+    record('write', {'seconds': time.perf_counter() - start,
+                     'bytes': sum(os.path.getsize(os.path.join(directory, f)) for f in os.listdir(directory))})
+    store, timings = measure(ColumnStore, directory, memory=False)
+    record('open', timings)
+    _, timings = measure(store.to_frame, memory=False)
+    record('to_frame', timings)
+    _, timings = measure(store['count'].sum, dtype=np.float64, memory=False)
+    record('scan', timings)
+    del store
+    record('shared', _shared(directory, processes))
+    if rows <= npz_max_rows:
+        target = os.path.join(workdir, f'snapshot_{rows}.npz')
+        np.savez(target, **{name: np.asarray(values) for name, values in
+                            ColumnStore(directory).arrays().items()})
+        _, timings = measure(lambda: dict(np.load(target, allow_pickle=False)), memory=False)
+        record('npz_load', timings)
+        os.remove(target)
+    shutil.rmtree(directory)
+    return stages
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=parse_sizes, default=parse_sizes('1e6,1e7'),
+                        help='comma separated row counts, e.g. 1e6,1e7,1e8')
+    parser.add_argument('--processes', type=int, default=4, help='processes in the shared stage')
+    parser.add_argument('--full', action='store_true', help='float64 layout instead of the compact one')
+    parser.add_argument('--npz-max-rows', type=float, default=1e7)
+    parser.add_argument('--workdir', help='directory for the stores (needs ~40 bytes per row)')
+    parser.add_argument('--out', default='-', help='JSON result file (default: stdout)')
+    args = parser.parse_args(argv)
+    workdir = args.workdir or tempfile.mkdtemp(prefix='bikeshare-colstore-')
+    try:
+        results = []
+        for rows in args.sizes:
+            results.extend(run_size(rows, workdir, args.processes, not args.full, args.npz_max_rows))
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+    write_results(args.out, 'colstore', results, compact=not args.full)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,81 @@
+"""Demand forecast benchmark: training time, prediction latency and batch throughput.
+
+Trains ``DemandModel`` on ``--rows`` synthetic prepared rows (the statistics
+pass and the solve timed separately) and scores a held-out tail. Then:
+
+- ``single``: one hour given as a dict of scalars, ``--calls`` times,
+- ``batch_<size>``: hours given as a dict of column arrays (categorical
+  season/weather), for each of ``--batches``; the batch of 1 is the fixed
+  per-call overhead.
+
+    python -m benchmarks.bench_forecast --rows 1e7 --batches 1,1000,10000,100000 --out forecast.json
+"""
+import argparse
+import sys
+import time
+
+import numpy as np
+
+from bikeshare.forecast import CELL_DIMENSIONS, NUMERIC_FEATURES, DemandModel
+from bikeshare.prepare import prepare_bike
+from bikeshare.synthetic import synthetic_raw
+
+from .bench_query import percentiles
+from .common import measure, parse_sizes, write_results
+
+FEATURES = list(CELL_DIMENSIONS) + NUMERIC_FEATURES
+
+
+def latencies(function, argument, calls):
+    seconds = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        function(argument)
+        seconds.append(time.perf_counter() - start)
+    return seconds
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=float, default=1e7)
+    parser.add_argument('--holdout', type=float, default=0.1, help='fraction of rows scored, not trained on')
+    parser.add_argument('--batches', type=parse_sizes, default=parse_sizes('1,1000,10000,100000'))
+    parser.add_argument('--calls', type=int, default=2000, help='timed calls per latency stage')
+    parser.add_argument('--alpha', type=float, default=1.0)
+    parser.add_argument('--target-overhead', type=float, default=0.001,
+                        help='p99 seconds allowed for a batch of one')
+    parser.add_argument('--out', default='-', help='JSON result file (default: stdout)')
+    args = parser.parse_args(argv)
+    rows = int(args.rows)
+    bike = prepare_bike(synthetic_raw(rows), compact=True)[FEATURES + ['count']]
+    split = int(rows * (1 - args.holdout))
+    train, test = bike.iloc[:split], bike.iloc[split:]
+
+    model = DemandModel(args.alpha)
+    _, stats_timings = measure(model.partial_fit, train, memory=False)
+    _, solve_timings = measure(model.solve, memory=False)
+    results = [
+        {'stage': 'train_stats', 'rows': split, 'rows_per_second': split / stats_timings['seconds'], **stats_timings},
+        {'stage': 'train_solve', 'features': len(model.feature_names) + len(NUMERIC_FEATURES) + 1, **solve_timings},
+        {'stage': 'holdout', 'train_rmse': model.train_rmse, **model.score(test)},
+    ]
+    one = {name: test[name].iloc[0] for name in FEATURES}
+    one['season'], one['weather'] = str(one['season']), str(one['weather'])
+    results.append({'stage': 'single', 'calls': args.calls, **percentiles(latencies(model.predict, one, args.calls))})
+    for size in args.batches:
+        batch = {name: test[name].to_numpy()[:size] if name not in ('season', 'weather') else test[name].array[:size]
+                 for name in FEATURES}
+        calls = max(5, min(args.calls, int(2e7 // max(size, 1))))
+        seconds = latencies(model.predict, batch, calls)
+        results.append({'stage': f'batch_{size}', 'batch': size, 'calls': calls,
+                        'rows_per_second': size / float(np.median(seconds)), **percentiles(seconds)})
+    for result in results:
+        print(' '.join(f'{k}={v:.6g}' if isinstance(v, float) else f'{k}={v}' for k, v in result.items()),
+              file=sys.stderr)
+    write_results(args.out, 'forecast', results, target_overhead_seconds=args.target_overhead)
+    overhead = [r['p99_seconds'] for r in results if r['stage'] == 'batch_1']
+    return 0 if not overhead or overhead[0] <= args.target_overhead else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,79 @@
+"""Journey ingestion benchmark: hourly counts from synthetic TfL journey extracts.
+
+Writes ``max(--files)`` synthetic journey files of ``--hours`` hours each (not
+timed), then counts the journeys per hour over the first 1, 2, 4, ... files
+with each number of workers. Reports journeys per second, the peak traced
+memory of the parent (which only holds the merged counts) and the peak RSS of
+the worker processes, which should not grow with the number of files.
+
+    python -m benchmarks.bench_ingest --files 1,2,4 --workers 1,2 --out ingest.json
+"""
+import argparse
+import os
+import resource
+import shutil
+import sys
+import tempfile
+
+from bikeshare.journeys import hourly_counts
+from bikeshare.synthetic import synthetic_raw, write_synthetic_journeys
+
+from .common import measure, parse_sizes, write_results
+
+
+def children_max_rss_bytes():
+    rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+
+def write_files(workdir, n_files, hours):
+    paths = []
+    for i in range(n_files):
+        raw = synthetic_raw(hours, offset=i * hours)
+        paths.append(write_synthetic_journeys(os.path.join(workdir, f'journeys_{i}.csv'), raw))
+    return paths
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--files', type=parse_sizes, default=parse_sizes('1,2,4'))
+    parser.add_argument('--workers', type=parse_sizes, default=parse_sizes('1,2'))
+    parser.add_argument('--hours', type=int, default=2000, help='hours per file (about 1,000 journeys each)')
+    parser.add_argument('--chunksize', type=int, default=100_000)
+    parser.add_argument('--no-memory', action='store_true', help='skip the tracemalloc runs')
+    parser.add_argument('--workdir', help='directory for the generated journey files')
+    parser.add_argument('--out', default='-', help='JSON result file (default: stdout)')
+    args = parser.parse_args(argv)
+    workdir = args.workdir or tempfile.mkdtemp(prefix='bikeshare-ingest-')
+    try:
+        paths = write_files(workdir, max(args.files), args.hours)
+        results = []
+        for n_files in args.files:
+            for workers in args.workers:
+                counts, timings = measure(hourly_counts, paths[:n_files], workers, args.chunksize,
+                                          memory=not args.no_memory)
+                journeys = int(counts['cnt'].sum())
+                result = {
+                    'files': n_files,
+                    'workers': workers,
+                    'stage': 'hourly_counts',
+                    'journeys': journeys,
+                    'bytes': sum(os.path.getsize(p) for p in paths[:n_files]),
+                    'journeys_per_second': journeys / timings['seconds'],
+                    'children_max_rss_bytes': children_max_rss_bytes(),
+                    **timings,
+                }
+                results.append(result)
+                print(f'{n_files:3d} files {workers:2d} workers {journeys:>12,d} journeys '
+                      f'{timings["seconds"]:8.2f} s {result["journeys_per_second"] / 1e6:6.2f} M/s'
+                      + (f' parent peak {timings["peak_bytes"] / 1e6:6.1f} MB' if 'peak_bytes' in timings else ''),
+                      file=sys.stderr)
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+    write_results(args.out, 'ingest', results, cpu_count=os.cpu_count())
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
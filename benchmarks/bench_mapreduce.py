@@ -0,0 +1,121 @@
+"""Multi-file map-reduce: scaling over worker counts, worker memory and exactness of the merge.
+
+Writes ``--files`` london_merged-shaped CSVs of ``--rows`` rows each (not
+timed; the first is twice as large, so the largest-file bound on worker
+memory is visible), split over two cities, then runs ``map_reduce`` from
+the CSVs (no snapshots) with each of ``--workers`` processes and reports
+the wall time, the speedup over the fewest workers and the largest worker RSS
+next to the in-memory size of the largest file.
+
+The merged aggregates are compared with ``Aggregates`` built in one pass
+over all rows: row, cube and histogram counts and the sums of ``count``
+must be equal, means and co-moments agree to ``--rtol``. Exits 1 otherwise.
+
+    python -m benchmarks.bench_mapreduce --files 8 --rows 1e6 --workers 1,2,4 --out mapreduce.json
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from bikeshare.cube import DIMENSIONS, merge_cubes
+from bikeshare.load import load_bike
+from bikeshare.mapreduce import Aggregates, map_reduce
+from bikeshare.prepare import bytes_per_row
+from bikeshare.synthetic import write_synthetic_csv
+
+from .common import parse_sizes, write_results
+
+
+def differences(merged, single, rtol):
+    """Names of the aggregates that differ between the merged and one-pass results."""
+    failed = []
+    if merged.rows != single.rows or merged.stats.n != single.stats.n:
+        failed.append('rows')
+    cube_a = merged.cube.sort_values(DIMENSIONS, ignore_index=True)
+    cube_b = merge_cubes(single.cube).sort_values(DIMENSIONS, ignore_index=True)
+    for measure in ('n', 'sum', 'sumsq'):
+        if len(cube_a) != len(cube_b) or not np.array_equal(cube_a[measure].to_numpy(), cube_b[measure].to_numpy()):
+            failed.append(f'cube.{measure}')
+    for name, counts in single.histograms.items():
+        if not np.array_equal(merged.histograms[name], counts):
+            failed.append(f'histogram.{name}')
+    for name in ('mean', 'comoment'):
+        a, b = getattr(merged.stats, name), getattr(single.stats, name)
+        if not np.allclose(a, b, rtol=rtol, atol=rtol * np.abs(b).max()):
+            failed.append(f'stats.{name}')
+    for name in ('min', 'max'):
+        if not np.array_equal(getattr(merged.stats, name), getattr(single.stats, name)):
+            failed.append(f'stats.{name}')
+    return failed
+
+
+def write_files(workdir, count, rows):
+    """``{city: [paths]}`` of ``count`` files over two cities, each file starting a year after the one before."""
+    files = {}
+    for i in range(count):
+        path = os.path.join(workdir, f'city{i % 2}_{i}.csv')
+        write_synthetic_csv(path, rows * (2 if i == 0 else 1), seed=i,
+                            start=str(np.datetime64('2015-01-04T00') + np.timedelta64(i * 8766, 'h')))
+        files.setdefault(f'city{i % 2}', []).append(path)
+    return files
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--files', type=int, default=8)
+    parser.add_argument('--rows', type=float, default=1e6, help='rows per file (the first file has twice as many)')
+    parser.add_argument('--workers', type=parse_sizes, default=parse_sizes(f'1,{os.cpu_count() or 1}'))
+    parser.add_argument('--rtol', type=float, default=1e-12)
+    parser.add_argument('--workdir', help='directory for the generated CSV files')
+    parser.add_argument('--out', default='-', help='JSON result file (default: stdout)')
+    args = parser.parse_args(argv)
+    rows = int(args.rows)
+    workdir = args.workdir or tempfile.mkdtemp(prefix='bikeshare-mapreduce-')
+    results, failures = [], 0
+    try:
+        # Written in another process, so generating them does not raise this process's peak RSS
+        with ProcessPoolExecutor(1) as pool:
+            files = pool.submit(write_files, workdir, args.files, rows).result()
+
+        # Most workers first: the pools fork from this process before the in-process run has grown it
+        merged = []
+        for workers in sorted(set(args.workers), reverse=True):
+            start = time.perf_counter()
+            cities, combined, timings = map_reduce(files, workers, use_cache=False)
+            seconds = time.perf_counter() - start
+            merged.append(combined)
+            results.append({'stage': 'map_reduce', 'workers': workers, 'files': len(timings), 'rows': combined.rows,
+                            'seconds': seconds, 'rows_per_second': combined.rows / seconds,
+                            'max_worker_rss_bytes': max(timing['max_rss_bytes'] for timing in timings)})
+
+        # The one-pass reference, after the timed runs
+        frames = [load_bike(path, use_cache=False) for paths in files.values() for path in paths]
+        largest = max(len(frame) * bytes_per_row(frame) for frame in frames)
+        single = Aggregates.from_frame(pd.concat(frames, ignore_index=True))
+        del frames
+        baseline = results[-1]['seconds']
+        for result, combined in zip(results, merged):
+            result['speedup'] = baseline / result['seconds']
+            result['largest_file_bytes'] = int(largest)
+            result['mismatches'] = differences(combined, single, args.rtol)
+            failures += bool(result['mismatches'])
+            print(f'{result["workers"]:3d} workers: {result["seconds"]:8.2f} s, speedup {result["speedup"]:5.2f}, '
+                  f'worker RSS {result["max_worker_rss_bytes"] / 2**20:7.0f} MiB '
+                  f'(largest file {largest / 2**20:.0f} MiB in memory)'
+                  + (f', MISMATCH {result["mismatches"]}' if result['mismatches'] else ''), file=sys.stderr)
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+    write_results(args.out, 'mapreduce', results, cpu_count=os.cpu_count(), failures=failures)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
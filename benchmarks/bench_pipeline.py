@@ -0,0 +1,115 @@
+"""Scaling benchmark of the analysis pipeline on synthetic data.
+
+For each size a london_merged-shaped CSV is generated (not timed), then
+load, feature preparation, describe/corr, group aggregations, CI computation
+and figure rendering are timed and their peak memory measured separately.
+
+    python -m benchmarks.bench_pipeline --sizes 1e4,1e5,1e6 --out bench.json
+    python -m benchmarks.bench_pipeline --sizes 1e4,1e5 --compare bench.json
+"""
+import argparse
+import contextlib
+import os
+import shutil
+import sys
+import tempfile
+
+import matplotlib
+
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt  # noqa: E402
+
+from bikeshare.ci import group_ci  # noqa: E402
+from bikeshare.correlation import group_corr, rolling_corr  # noqa: E402
+from bikeshare.cube import build_cube, rollup  # noqa: E402
+from bikeshare.figures import draw  # noqa: E402
+from bikeshare.load import load_bike, read_bike_csv  # noqa: E402
+from bikeshare.prepare import prepare_bike  # noqa: E402
+from bikeshare.report import ReportData  # noqa: E402
+from bikeshare.stats import HEATMAP_COLUMNS, NUMERICAL_COLUMNS, StreamingStats, stream_stats  # noqa: E402
+from bikeshare.synthetic import write_synthetic_csv  # noqa: E402
+
+from .common import compare, max_rss_bytes, measure, parse_sizes, write_results  # noqa: E402
+
+# Figures rendered by the 'render' stage (one of each kind of chart)
+RENDERED_FIGURES = ['by_hour', 'hour_points', 'temp_real', 'heatmap']
+
+
+def _render(data):
+    # Keep the regression fit lines printed by the figures out of the JSON on stdout
+    with contextlib.redirect_stdout(sys.stderr):
+        for name in RENDERED_FIGURES:
+            plt.close(draw(name, data))
+
+
+def run_size(rows, workdir, memory=True, bootstrap_max_rows=1_000_000, render_max_rows=10_000_000):
+    """Benchmark every stage on ``rows`` synthetic rows; returns one dict per stage."""
+    path = write_synthetic_csv(os.path.join(workdir, f'synthetic_{rows}.csv'), rows)
+    cache_dir = os.path.join(workdir, 'cache')
+    stages = []
+
+    def stage(name, function, *args, **kwargs):
+        result, timings = measure(function, *args, memory=memory, **kwargs)
+        stages.append({'rows': rows, 'stage': name, **timings})
+        print(f'{rows:>12,d} {name:24s} {timings["seconds"]:9.3f} s'
+              + (f' {timings["peak_bytes"] / 1e6:10.1f} MB' if 'peak_bytes' in timings else ''),
+              file=sys.stderr)
+        return result
+
+    raw = stage('load_csv', read_bike_csv, path)
+    bike = stage('prepare', prepare_bike, raw)
+    del raw
+    stage('load_bike_cold', lambda: (shutil.rmtree(cache_dir, ignore_errors=True), load_bike(path, cache_dir))[1])
+    stage('load_bike_snapshot', load_bike, path, cache_dir)
+    stage('prepare_compact', lambda: prepare_bike(read_bike_csv(path), compact=True))
+    stage('describe_pandas', lambda: bike[NUMERICAL_COLUMNS].describe())
+    stage('corr_pandas', lambda: bike[NUMERICAL_COLUMNS].corr())
+    stage('stats_in_memory', lambda: StreamingStats(NUMERICAL_COLUMNS).update(bike).corr())
+    stage('stats_streaming', stream_stats, path)
+    stage('corr_by_month', group_corr, bike, ['year', 'month'])
+    stage('corr_by_month_pandas', lambda: bike.groupby(['year', 'month'], observed=True)[HEATMAP_COLUMNS].corr())
+    stage('corr_rolling_30d', rolling_corr, bike, '30D')
+    cube = stage('build_cube', build_cube, bike)
+    stage('rollups', lambda: [rollup(cube, by) for by in
+                              ['year', 'hour', 'dayofweek', 'weather', 'season', ['hour', 'season']]])
+    stage('groupby_pandas', lambda: [bike.groupby(by, observed=True)['count'].sum() for by in
+                                     ['year', 'hour', 'dayofweek', 'weather', 'season', ['hour', 'season']]])
+    stage('ci_t', group_ci, bike, ['hour', 'season'], 't', cube=cube)
+    if rows <= bootstrap_max_rows:
+        stage('ci_bootstrap', group_ci, bike, ['hour', 'season'], 'bootstrap', n_boot=1000, seed=0)
+    if rows <= render_max_rows:
+        stage('render', _render, ReportData(path, bike=bike))
+    os.remove(path)
+    return stages
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=parse_sizes, default=parse_sizes('1e4,1e5,1e6'),
+                        help='comma separated row counts, e.g. 1e4,1e5,1e6,1e7,1e8')
+    parser.add_argument('--out', default='-', help='JSON result file (default: stdout)')
+    parser.add_argument('--no-memory', action='store_true', help='skip the tracemalloc runs')
+    parser.add_argument('--workdir', help='directory for the generated CSV files')
+    parser.add_argument('--compare', help='baseline JSON to check for regressions')
+    parser.add_argument('--tolerance', type=float, default=0.25)
+    args = parser.parse_args(argv)
+    workdir = args.workdir or tempfile.mkdtemp(prefix='bikeshare-bench-')
+    try:
+        results = []
+        for rows in args.sizes:
+            results.extend(run_size(rows, workdir, memory=not args.no_memory))
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+    write_results(args.out, 'pipeline', results, max_rss_bytes=max_rss_bytes())
+    if args.compare:
+        regressions = compare(results, args.compare, args.tolerance)
+        for r in regressions:
+            print(f'REGRESSION {r["rows"]:,d} {r["stage"]}: {r["baseline"]:.3f} s -> {r["current"]:.3f} s',
+                  file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
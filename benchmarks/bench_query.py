@@ -0,0 +1,111 @@
+"""Dashboard query latency: filter-and-group queries on synthetic data.
+
+Builds the cube and ``QueryIndex`` of ``--rows`` synthetic rows, then replays
+``--queries`` random queries drawn from ``--distinct`` distinct ones (mean
+count by hour, or by hour and one other column, filtered on a random mix of
+season, weather, is_weekend and is_holiday). Latency percentiles are reported
+without the cache (every query computed) and with it, and a sample of the
+queries is checked against a pandas boolean filter + groupby.
+
+    python -m benchmarks.bench_query --rows 1e7 --target-p99 0.005 --out query.json
+"""
+import argparse
+import random
+import sys
+import time
+
+import numpy as np
+
+from bikeshare.prepare import SEASONS, WEATHER, prepare_bike
+from bikeshare.query import QueryIndex
+from bikeshare.synthetic import synthetic_raw
+
+from .common import measure, write_results
+
+FILTER_VALUES = {
+    'season': list(SEASONS.values()),
+    'weather': list(WEATHER.values()),
+    'is_weekend': [0, 1],
+    'is_holiday': [0, 1],
+}
+GROUPS = [['hour'], ['hour', 'season'], ['hour', 'is_weekend'], ['hour', 'weather']]
+
+
+def random_query(rng):
+    filters = {}
+    for name, values in FILTER_VALUES.items():
+        if rng.random() < 0.5:
+            k = 1 if name.startswith('is_') else rng.randint(1, 2)
+            picked = rng.sample(values, k)
+            filters[name] = picked[0] if k == 1 else picked
+    return rng.choice(GROUPS), filters
+
+
+def percentiles(seconds):
+    seconds = np.sort(np.asarray(seconds))
+    return {'p50_seconds': float(np.percentile(seconds, 50)), 'p95_seconds': float(np.percentile(seconds, 95)),
+            'p99_seconds': float(np.percentile(seconds, 99)), 'max_seconds': float(seconds[-1])}
+
+
+def replay(index, workload):
+    latencies = []
+    for by, filters in workload:
+        start = time.perf_counter()
+        index.query(by, **filters)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def check(bike, index, queries):
+    worst = 0.0
+    for by, filters in queries:
+        keep = np.ones(len(bike), dtype=bool)
+        for name, value in filters.items():
+            keep &= bike[name].isin(value if isinstance(value, list) else [value]).to_numpy()
+        expected = bike[keep].groupby(by, observed=True)['count'].mean()
+        got = index.query(by, **filters)['mean']
+        if not got.index.equals(expected.index):
+            raise AssertionError(f'groups differ for {by} {filters}')
+        worst = max(worst, float(np.max(np.abs(got.to_numpy() - expected.to_numpy()), initial=0)))
+    return worst
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=float, default=1e7)
+    parser.add_argument('--queries', type=int, default=5000)
+    parser.add_argument('--distinct', type=int, default=300)
+    parser.add_argument('--cache-size', type=int, default=256)
+    parser.add_argument('--check', type=int, default=20, help='queries checked against pandas')
+    parser.add_argument('--target-p99', type=float, default=0.005)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', default='-', help='JSON result file (default: stdout)')
+    args = parser.parse_args(argv)
+    rows = int(args.rows)
+    rng = random.Random(args.seed)
+
+    bike = prepare_bike(synthetic_raw(rows), compact=True)
+    index, timings = measure(QueryIndex.from_bike, bike, 'bench', args.cache_size, memory=False)
+    results = [{'rows': rows, 'stage': 'build_index', 'cells': index.cells, **timings}]
+    distinct = [random_query(rng) for _ in range(args.distinct)]
+    workload = [rng.choice(distinct) for _ in range(args.queries)]
+
+    uncached = QueryIndex(index.cube, 'bench', cache_size=0)
+    results.append({'rows': rows, 'stage': 'query_uncached', 'queries': len(workload),
+                    **percentiles(replay(uncached, workload))})
+    latencies = replay(index, workload)
+    results.append({'rows': rows, 'stage': 'query_cached', 'queries': len(workload),
+                    'hit_rate': index.cache.hits / max(1, index.cache.hits + index.cache.misses),
+                    **percentiles(latencies)})
+    results.append({'rows': rows, 'stage': 'check', 'queries': args.check,
+                    'max_abs_error': check(bike, index, distinct[:args.check])})
+    for result in results:
+        print(' '.join(f'{k}={v:.6g}' if isinstance(v, float) else f'{k}={v}' for k, v in result.items()),
+              file=sys.stderr)
+    write_results(args.out, 'query', results, target_p99_seconds=args.target_p99)
+    worst_p99 = max(r['p99_seconds'] for r in results if 'p99_seconds' in r)
+    return 0 if worst_p99 <= args.target_p99 else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,72 @@
+"""What-if grid throughput: scenarios per second, vectorized and per scenario.
+
+Builds grids of about each of ``--scenarios`` sizes over peak shift, the
+Clear and Rain demand changes and the winter demand change, and evaluates
+them over the history of ``--path``:
+
+- ``grid``: ``Scenarios.evaluate`` with each of ``--workers`` processes,
+- ``loop``: the first ``--loop`` scenarios evaluated one call each, the
+  Python-loop-per-scenario baseline; its results are checked against the
+  grid's (exit 1 on a difference).
+
+    python -m benchmarks.bench_scenarios --scenarios 100,1000,10000 --workers 1,4 --out scenarios.json
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+from bikeshare.load import load_bike
+from bikeshare.scenario import Scenarios, scenario_grid
+
+from .common import parse_sizes, write_results
+
+
+def grid_of(size):
+    # Roughly ``size`` scenarios: 5 winter changes x 4 rain changes x n peak shifts x n Clear changes
+    n = max(1, int(round(np.sqrt(size / 20))))
+    return scenario_grid(np.linspace(0, 0.5, n), weather={'Clear': np.linspace(-0.2, 0.3, n),
+                                                          'Rain': np.linspace(-0.3, 0, 4)},
+                         season={'winter': np.linspace(-0.3, 0.1, 5)})
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--path', default='london_merged.csv')
+    parser.add_argument('--scenarios', type=parse_sizes, default=parse_sizes('100,1000,10000'))
+    parser.add_argument('--workers', type=parse_sizes, default=parse_sizes(f'1,{os.cpu_count() or 1}'))
+    parser.add_argument('--loop', type=int, default=200, help='scenarios evaluated one by one')
+    parser.add_argument('--out', default='-', help='JSON result file (default: stdout)')
+    args = parser.parse_args(argv)
+    scenarios = Scenarios(load_bike(args.path))
+    results, failures = [], 0
+
+    def record(stage, size, seconds, **extra):
+        results.append({'stage': stage, 'scenarios': size, 'hours': len(scenarios.count), 'seconds': seconds,
+                        'scenarios_per_second': size / seconds, **extra})
+        print(f'{stage:10s} {size:>8,d} scenarios {seconds:8.3f} s {size / seconds:12,.0f} scenarios/s',
+              file=sys.stderr)
+
+    for size in args.scenarios:
+        grid = grid_of(size)
+        for workers in sorted(set(args.workers)):
+            start = time.perf_counter()
+            frame = scenarios.evaluate(grid, workers=workers)
+            record('grid', len(grid), time.perf_counter() - start, workers=workers)
+
+    loop = grid.iloc[:args.loop]
+    start = time.perf_counter()
+    rows = [scenarios.evaluate(loop.iloc[[i]]) for i in range(len(loop))]
+    record('loop', len(loop), time.perf_counter() - start)
+    one_by_one = np.vstack([row.to_numpy() for row in rows])
+    if not np.allclose(one_by_one, frame.iloc[:len(loop)].to_numpy(), rtol=1e-12, atol=0):
+        failures += 1
+        print('loop and grid results differ', file=sys.stderr)
+    write_results(args.out, 'scenarios', results, cpu_count=os.cpu_count(), failures=failures)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
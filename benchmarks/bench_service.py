@@ -0,0 +1,153 @@
+"""Load test of the HTTP service: requests per second and latency percentiles.
+
+Starts ``python -m bikeshare serve`` on a free local port (or uses ``--url``),
+then ``--connections`` keep-alive clients send ``--requests`` requests in all
+for each stage:
+
+- ``first_figures``: every figure once, so the first requests render,
+- ``json``: report tables and random dashboard queries,
+- ``figures``: PNGs that are now rendered,
+- ``not_modified``: the same mix, revalidated with ``If-None-Match`` (304s).
+
+    python -m benchmarks.bench_service london_merged.csv --connections 16 --requests 5000 --out service.json
+"""
+import argparse
+import asyncio
+import os
+import random
+import re
+import subprocess
+import sys
+import threading
+import time
+from urllib.parse import urlencode, urlsplit
+
+from bikeshare.figures import FIGURES
+from bikeshare.report import TABLES
+
+from .bench_query import percentiles, random_query
+from .common import write_results
+
+
+async def fetch(reader, writer, target, headers=()):
+    request = [f'GET {target} HTTP/1.1', 'Host: bench'] + [f'{k}: {v}' for k, v in headers]
+    writer.write(('\r\n'.join(request) + '\r\n\r\n').encode('latin-1'))
+    head = (await reader.readuntil(b'\r\n\r\n')).decode('latin-1').split('\r\n')
+    fields = {}
+    for line in head[1:]:
+        name, _, value = line.partition(':')
+        if name:
+            fields[name.strip().lower()] = value.strip()
+    body = await reader.readexactly(int(fields.get('content-length', 0)))
+    return int(head[0].split(' ')[1]), fields.get('etag'), body
+
+
+async def run_stage(host, port, targets, connections, etags=None):
+    """Send ``targets`` over ``connections`` connections; returns the latencies and statuses."""
+    queue = list(reversed(targets))
+    latencies, statuses = [], {}
+
+    async def client():
+        reader, writer = await asyncio.open_connection(host, port)
+        try:
+            while queue:
+                target = queue.pop()
+                headers = [('If-None-Match', etags[target])] if etags and target in etags else []
+                start = time.perf_counter()
+                status, _, _ = await fetch(reader, writer, target, headers)
+                latencies.append(time.perf_counter() - start)
+                statuses[status] = statuses.get(status, 0) + 1
+        finally:
+            writer.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(min(connections, len(targets)))))
+    return latencies, statuses, time.perf_counter() - start
+
+
+async def collect_etags(host, port, targets):
+    reader, writer = await asyncio.open_connection(host, port)
+    etags = {}
+    for target in targets:
+        _, etag, _ = await fetch(reader, writer, target)
+        etags[target] = etag
+    writer.close()
+    return etags
+
+
+def query_target(rng):
+    by, filters = random_query(rng)
+    params = [('by', name) for name in by]
+    for name, value in filters.items():
+        params.extend((name, v) for v in (value if isinstance(value, list) else [value]))
+    return '/query?' + urlencode(params)
+
+
+async def load_test(host, port, connections, requests, seed=0):
+    rng = random.Random(seed)
+    figure_targets = [f'/figures/{name}.png' for name in sorted(FIGURES)]
+    json_targets = [f'/tables/{name}' for name in sorted(TABLES)] + [query_target(rng) for _ in range(200)]
+    results = []
+
+    async def stage(name, targets, etags=None):
+        latencies, statuses, seconds = await run_stage(host, port, targets, connections, etags)
+        result = {'stage': name, 'requests': len(latencies), 'connections': connections, 'seconds': seconds,
+                  'requests_per_second': len(latencies) / seconds,
+                  'statuses': {str(k): v for k, v in sorted(statuses.items())}, **percentiles(latencies)}
+        results.append(result)
+        print(f'{name:14s} {len(latencies):7d} requests {result["requests_per_second"]:9.1f} req/s '
+              f'p50 {result["p50_seconds"] * 1e3:8.2f} ms p99 {result["p99_seconds"] * 1e3:8.2f} ms '
+              f'{result["statuses"]}', file=sys.stderr)
+
+    await stage('first_figures', figure_targets)
+    await stage('json', [rng.choice(json_targets) for _ in range(requests)])
+    await stage('figures', [rng.choice(figure_targets) for _ in range(requests)])
+    mix = json_targets + figure_targets
+    etags = await collect_etags(host, port, mix)
+    await stage('not_modified', [rng.choice(mix) for _ in range(requests)], etags)
+    return results
+
+
+def start_server(path, workers):
+    command = [sys.executable, '-m', 'bikeshare', 'serve', path, '--port', '0']
+    if workers:
+        command += ['--workers', str(workers)]
+    process = subprocess.Popen(command, stderr=subprocess.PIPE, text=True,
+                               cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    for line in process.stderr:
+        match = re.search(r'on (http://\S+)', line)
+        if match:
+            # Keep draining stderr so the service never blocks on a full pipe
+            threading.Thread(target=process.stderr.read, daemon=True).start()
+            return process, match.group(1)
+    process.wait()
+    raise RuntimeError(f'the service exited with status {process.returncode}')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('path', nargs='?', default='london_merged.csv')
+    parser.add_argument('--url', help='test a running service instead of starting one')
+    parser.add_argument('--workers', type=int, help='render processes of the started service')
+    parser.add_argument('--connections', type=int, default=16)
+    parser.add_argument('--requests', type=int, default=2000, help='requests per stage')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', default='-', help='JSON result file (default: stdout)')
+    args = parser.parse_args(argv)
+    process = None
+    url = args.url
+    if url is None:
+        process, url = start_server(os.path.abspath(args.path), args.workers)
+    try:
+        address = urlsplit(url)
+        results = asyncio.run(load_test(address.hostname, address.port, args.connections, args.requests, args.seed))
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+    write_results(args.out, 'service', results, url=url)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
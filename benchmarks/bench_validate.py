@@ -0,0 +1,112 @@
+"""Overhead of the schema checks against the load they run in.
+
+For each size a london_merged-shaped CSV is generated (not timed) and then:
+
+- ``load_csv``: ``load_bike`` from the CSV (parse + prepare), no snapshot,
+- ``load_snapshot``: ``load_bike`` from its snapshot,
+- ``check``: ``check_bike`` on the loaded frame, reported as a fraction of
+  both loads (``--target`` is the allowed fraction of the CSV load).
+
+Past 30 years of hours the synthetic timestamps start over a second later
+(see ``bikeshare.synthetic``), so the larger sizes also time the unsorted
+duplicate search. A ``--check-rows`` frame with violations injected at known
+rows checks that every rule finds exactly those rows (exit 1 otherwise).
+
+    python -m benchmarks.bench_validate --sizes 1e6,1e7 --out validate.json
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from bikeshare.load import load_bike
+from bikeshare.prepare import prepare_bike
+from bikeshare.synthetic import synthetic_raw, write_synthetic_csv
+from bikeshare.validate import RULES, check_bike
+
+from .common import measure, parse_sizes, write_results
+
+# Raw column, value and the rule it breaks
+INJECTED = [
+    ('season', 9.0, 'season_code'),
+    ('weather_code', 5.0, 'weather_code'),
+    ('cnt', -1, 'count_range'),
+    ('t1', 99.0, 'temp_real_C_range'),
+    ('t2', np.nan, 'temp_feels_like_C_range'),
+    ('hum', 101.0, 'humidity_percent_range'),
+    ('wind_speed', -2.0, 'wind_speed_kph_range'),
+    ('is_holiday', 0.5, 'is_holiday_flag'),
+    ('is_weekend', np.nan, 'is_weekend_flag'),
+]
+
+
+def injected_mismatches(rows, per_rule=7):
+    """Rules whose violations differ from the rows they were injected at."""
+    raw = synthetic_raw(rows)
+    rng = np.random.default_rng(1)
+    # Even rows only, so the row before each one is left intact
+    positions = 2 * rng.choice(rows // 2, (len(INJECTED) + 3, per_rule), replace=False)
+    expected = {rule: np.empty(0, dtype=np.int64) for rule in RULES}
+    for (column, value, rule), at in zip(INJECTED, positions):
+        raw.loc[at, column] = value
+        expected[rule] = np.sort(at)
+    weekend, missing, duplicate = positions[len(INJECTED):]
+    raw.loc[weekend, 'is_weekend'] = 1 - raw.loc[weekend, 'is_weekend']
+    expected['is_weekend_mismatch'] = np.sort(weekend)
+    raw.loc[missing, 'timestamp'] = pd.NaT
+    expected['time_missing'] = np.sort(missing)
+    # Each copies the timestamp (and weekend flag) of the row before it, and is the later of the two
+    duplicate = duplicate[duplicate > 0]
+    for column in ('timestamp', 'is_weekend'):
+        raw.loc[duplicate, column] = raw[column].to_numpy()[duplicate - 1]
+    expected['time_duplicate'] = np.sort(duplicate)
+    report = check_bike(prepare_bike(raw))
+    return [rule for rule in RULES if not np.array_equal(report.violations[rule], expected[rule])]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=parse_sizes, default=parse_sizes('1e5,1e6'))
+    parser.add_argument('--check-rows', type=int, default=100_000)
+    parser.add_argument('--target', type=float, default=0.1, help='allowed check time / CSV load time')
+    parser.add_argument('--workdir', help='directory for the generated CSV files')
+    parser.add_argument('--out', default='-', help='JSON result file (default: stdout)')
+    args = parser.parse_args(argv)
+    mismatched = injected_mismatches(args.check_rows)
+    results = [{'stage': 'injected', 'rows': args.check_rows, 'mismatched_rules': mismatched}]
+    workdir = args.workdir or tempfile.mkdtemp(prefix='bikeshare-validate-')
+    try:
+        for rows in args.sizes:
+            path = write_synthetic_csv(os.path.join(workdir, f'bike_{rows}.csv'), rows)
+            cache_dir = os.path.join(workdir, 'cache')
+            _, csv = measure(load_bike, path, cache_dir, memory=False)
+            bike, snapshot = measure(load_bike, path, cache_dir, memory=False)
+            report, check = measure(check_bike, bike, memory=False)
+            result = {'stage': 'check', 'rows': rows, 'load_csv_seconds': csv['seconds'],
+                      'load_snapshot_seconds': snapshot['seconds'], 'check_seconds': check['seconds'],
+                      'fraction_of_csv_load': check['seconds'] / csv['seconds'],
+                      'fraction_of_snapshot_load': check['seconds'] / snapshot['seconds'],
+                      'invalid_rows': int(report.invalid.size)}
+            results.append(result)
+            print(f'{rows:>12,d} rows: csv load {csv["seconds"]:8.3f} s, snapshot load {snapshot["seconds"]:7.3f} s, '
+                  f'check {check["seconds"]:7.3f} s ({result["fraction_of_csv_load"]:.1%} of the csv load)',
+                  file=sys.stderr)
+            del bike
+            os.remove(path)
+            shutil.rmtree(cache_dir, ignore_errors=True)
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+    over = [r['rows'] for r in results[1:] if r['fraction_of_csv_load'] > args.target]
+    write_results(args.out, 'validate', results, target_fraction=args.target)
+    if mismatched:
+        print(f'rules finding other rows than injected: {mismatched}', file=sys.stderr)
+    return 1 if mismatched or over else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,88 @@
+"""Shared helpers of the benchmark scripts: measuring stages and writing JSON results."""
+import datetime
+import gc
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+
+def parse_sizes(text):
+    """'1e4,1e5,1e6' -> [10000, 100000, 1000000]."""
+    return [int(float(part)) for part in text.split(',') if part]
+
+
+def measure(function, *args, memory=True, **kwargs):
+    """Run ``function`` and return ``(result, timings)``.
+
+    Wall-clock and CPU time come from a plain run; when ``memory`` is set the
+    function is run a second time under tracemalloc for its peak allocation,
+    so tracing does not distort the timings.
+    """
+    gc.collect()
+    wall, cpu = time.perf_counter(), time.process_time()
+    result = function(*args, **kwargs)
+    timings = {'seconds': time.perf_counter() - wall, 'cpu_seconds': time.process_time() - cpu}
+    if memory:
+        del result
+        gc.collect()
+        tracemalloc.start()
+        result = function(*args, **kwargs)
+        timings['peak_bytes'] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return result, timings
+
+
+def max_rss_bytes():
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+
+def environment():
+    """Machine and library versions recorded with every result file."""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        commit = ''
+    return {
+        'date': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        'commit': commit,
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+    }
+
+
+def write_results(path, suite, results, **extra):
+    """Write ``results`` (a list of dicts) as ``{'suite', 'environment', 'results'}`` JSON."""
+    payload = {'suite': suite, 'environment': environment(), **extra, 'results': results}
+    if path == '-':
+        json.dump(payload, sys.stdout, indent=2)
+        print()
+    else:
+        with open(path, 'w') as f:
+            json.dump(payload, f, indent=2)
+    return payload
+
+
+def compare(results, baseline_path, tolerance=0.25, metric='seconds', key=('rows', 'stage')):
+    """Entries of ``results`` slower than the baseline file by more than ``tolerance``."""
+    with open(baseline_path) as f:
+        baseline = {tuple(r[k] for k in key): r for r in json.load(f)['results']}
+    regressions = []
+    for result in results:
+        before = baseline.get(tuple(result[k] for k in key))
+        if before and metric in before and result[metric] > before[metric] * (1 + tolerance):
+            regressions.append({**{k: result[k] for k in key}, 'baseline': before[metric],
+                                'current': result[metric], 'metric': metric})
+    return regressions
@@ -0,0 +1,24 @@
+"""Helpers for the London bike share analysis.
+
+The package follows the stages of the report: ``load`` and ``prepare`` turn
+london_merged.csv into the prepared frame, ``stats``, ``cube``, ``aggregate``
+and ``report`` compute the summaries, and ``plots``/``figures`` draw them.
+Importing the package is cheap: the names below are imported on first use,
+and matplotlib/seaborn only when a plot stage runs.
+"""
+import importlib
+
+_EXPORTS = {
+    'load_bike': 'load',
+    'read_bike_csv': 'load',
+    'prepare_bike': 'prepare',
+    'compact_bike': 'prepare',
+    'bytes_per_row': 'prepare',
+}
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    if name in _EXPORTS:
+        return getattr(importlib.import_module(f'.{_EXPORTS[name]}', __name__), name)
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
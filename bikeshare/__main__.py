@@ -0,0 +1,107 @@
+"""Command-line entry point.
+
+    python -m bikeshare stats london_merged.csv > summary.json
+    python -m bikeshare stats london_merged.csv --group hour --group season --no-corr
+    python -m bikeshare figures london_merged.csv --out figures --format png svg
+    python -m bikeshare ingest journeys/*.csv --weather weather.csv --out merged.csv
+    python -m bikeshare serve london_merged.csv --port 8000
+    python -m bikeshare profile trace.jsonl --flame trace.folded
+    python -m bikeshare validate london_merged.csv
+    python -m bikeshare mapreduce london=london_merged.csv paris=paris/*.csv --out cities.json
+
+``stats`` only imports NumPy when the snapshot of the CSV is up to date;
+``figures`` runs the plot stage (see ``bikeshare.figures``); ``ingest`` builds
+the hourly table from raw journey extracts (see ``bikeshare.journeys``);
+``serve`` answers HTTP requests for the tables and figures (see ``bikeshare.service``);
+``profile`` summarizes a stage trace recorded with BIKESHARE_PROFILE (see ``bikeshare.instrument``);
+``validate`` reports the rows breaking the schema rules (see ``bikeshare.validate``);
+``mapreduce`` aggregates many files per city in a process pool (see ``bikeshare.mapreduce``).
+"""
+import argparse
+import json
+import sys
+import time
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else list(argv)
+    if argv[:1] == ['figures']:
+        from .figures import main as figures_main
+        return figures_main(argv[1:])
+
+    if argv[:1] == ['ingest']:
+        return ingest_main(argv[1:])
+
+    if argv[:1] == ['serve']:
+        from .service import main as serve_main
+        return serve_main(argv[1:])
+
+    if argv[:1] == ['profile']:
+        from .instrument import main as profile_main
+        return profile_main(argv[1:])
+
+    if argv[:1] == ['validate']:
+        from .validate import main as validate_main
+        return validate_main(argv[1:])
+
+    if argv[:1] == ['mapreduce']:
+        from .mapreduce import main as mapreduce_main
+        return mapreduce_main(argv[1:])
+
+    from .aggregate import GROUPS, load_columns, summary
+
+    parser = argparse.ArgumentParser(prog='python -m bikeshare', description='London bike share analysis.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('figures', help='render the report figures (see --help of that command)')
+    commands.add_parser('ingest', help='hourly table from journey extracts (see --help of that command)')
+    commands.add_parser('serve', help='HTTP service for the tables and figures (see --help of that command)')
+    commands.add_parser('profile', help='summarize a stage trace (see --help of that command)')
+    commands.add_parser('validate', help='check the data against the schema rules (see --help of that command)')
+    commands.add_parser('mapreduce', help='aggregates of many files per city (see --help of that command)')
+    stats = commands.add_parser('stats', help='summary statistics and group sums as JSON')
+    stats.add_argument('path', nargs='?', default='london_merged.csv')
+    stats.add_argument('--cache-dir')
+    stats.add_argument('--group', action='append', choices=GROUPS,
+                       help='group sums to include (repeatable, default: all)')
+    stats.add_argument('--no-corr', action='store_true', help='leave out the correlation matrix')
+    stats.add_argument('--indent', type=int, default=None)
+    stats.add_argument('--timing', action='store_true', help='report the time spent on stderr')
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    arrays = load_columns(args.path, args.cache_dir)
+    result = summary(arrays, groups=args.group or GROUPS, corr=not args.no_corr)
+    json.dump(result, sys.stdout, indent=args.indent)
+    sys.stdout.write('\n')
+    if args.timing:
+        loaded = sorted(name for name in ('pandas', 'matplotlib', 'seaborn') if name in sys.modules)
+        print(f'stats: {time.perf_counter() - start:.3f} s after imports; '
+              f'heavy modules loaded: {", ".join(loaded) or "none"}', file=sys.stderr)
+    return 0
+
+
+def ingest_main(argv):
+    from .journeys import ingest_journeys, write_merged_csv
+
+    parser = argparse.ArgumentParser(prog='python -m bikeshare ingest',
+                                     description='Hourly london_merged.csv table from TfL journey extracts.')
+    parser.add_argument('paths', nargs='+', help='journey extract CSV files')
+    parser.add_argument('--weather', required=True, help='hourly weather table (london_merged.csv layout)')
+    parser.add_argument('--out', default='-', help='output CSV (default: stdout)')
+    parser.add_argument('--workers', type=int, default=None, help='processes (default: one per CPU)')
+    parser.add_argument('--chunksize', type=int, default=100_000, help='journey rows read at a time')
+    parser.add_argument('--zero-hours', action='store_true', help='keep hours without journeys with cnt 0')
+    parser.add_argument('--holiday', action='append', default=[],
+                        help='holiday date (repeatable), when the weather table has no is_holiday')
+    args = parser.parse_args(argv)
+    start = time.perf_counter()
+    merged = ingest_journeys(args.paths, args.weather, workers=args.workers, chunksize=args.chunksize,
+                             holidays=args.holiday, zero_hours=args.zero_hours)
+    write_merged_csv(merged, sys.stdout if args.out == '-' else args.out)
+    print(f'ingest: {int(merged["cnt"].sum()):,d} journeys in {len(merged):,d} hours '
+          f'from {len(args.paths)} files in {time.perf_counter() - start:.1f} s', file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,70 @@
+"""Stats-only aggregate stage: summary statistics and group sums as plain data.
+
+Works on the column arrays of the snapshot written by ``load_bike`` and needs
+NumPy only, so a batch job asking for numbers does not import pandas,
+matplotlib or seaborn. The output of ``summary`` is JSON serialisable.
+"""
+import math
+
+import numpy as np
+
+from .instrument import staged
+from .snapshot import read_snapshot_arrays, snapshot_path
+from .stats import NUMERICAL_COLUMNS, StreamingStats
+
+# Columns the group sums are reported for
+GROUPS = ['year', 'month', 'dayofweek', 'hour', 'season', 'weather', 'is_holiday', 'is_weekend']
+
+
+def load_columns(path='london_merged.csv', cache_dir=None):
+    """Column arrays of the prepared data.
+
+    Falls back to ``load_bike`` (and so to pandas) only when the snapshot is
+    missing or stale, which also refreshes it for the next call.
+    """
+    target = snapshot_path(path, cache_dir)
+    arrays = read_snapshot_arrays(path, target)
+    if arrays is None:
+        from .load import load_bike
+        load_bike(path, cache_dir)
+        arrays = read_snapshot_arrays(path, target)
+    return arrays
+
+
+def _number(value):
+    value = float(value)
+    return None if math.isnan(value) or math.isinf(value) else value
+
+
+def group_sums(arrays, by):
+    """``{label: {'n', 'sum', 'mean'}}`` of ``count`` for each value of the column ``by``."""
+    values = arrays[by]
+    if '__categories__' + by in arrays:
+        labels = [str(label) for label in arrays['__categories__' + by]]
+        codes = values.astype(np.int64)
+    else:
+        levels, codes = np.unique(values, return_inverse=True)
+        labels = [str(level.item()) for level in levels]
+    keep = codes >= 0
+    n = np.bincount(codes[keep], minlength=len(labels))
+    total = np.bincount(codes[keep], weights=arrays['count'][keep], minlength=len(labels))
+    return {label: {'n': int(n[i]), 'sum': _number(total[i]), 'mean': _number(total[i] / n[i]) if n[i] else None}
+            for i, label in enumerate(labels) if n[i]}
+
+
+@staged('summary')
+def summary(arrays, columns=NUMERICAL_COLUMNS, groups=GROUPS, corr=True):
+    """``describe()``, ``corr()`` and group sums of the prepared columns as nested dicts."""
+    stats = StreamingStats(columns, seed=0).update(arrays)
+    index, rows = stats.describe_rows()
+    result = {
+        'rows': int(len(arrays['count'])),
+        'describe': {column: {label: _number(rows[i, j]) for i, label in enumerate(index)}
+                     for j, column in enumerate(columns)},
+    }
+    if corr:
+        matrix = stats.corr_matrix()
+        result['corr'] = {a: {b: _number(matrix[i, j]) for j, b in enumerate(columns)}
+                          for i, a in enumerate(columns)}
+    result['groups'] = {by: group_sums(arrays, by) for by in groups}
+    return result
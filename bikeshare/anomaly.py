@@ -0,0 +1,187 @@
+"""Online anomaly detection of hourly counts against a seasonal baseline.
+
+The baseline of an hour is the running mean and variance of ``count`` over
+the earlier hours with the same hour of day, day of week, season and holiday
+flag (``KEY_DIMENSIONS``, 1,344 keys, the patterns of In[25] and In[32]).
+Each key keeps Welford's ``n``, ``mean`` and ``m2``, so an update costs O(1)
+time and the state is three arrays of 1,344 numbers.
+
+An hour is scored *before* it updates its key: ``z = (count - mean) / std``
+with ``std`` floored at ``min_std``, and flagged when ``|z| > threshold``,
+its key has at least ``min_count`` earlier hours and the detector has seen at
+least ``warmup`` hours in all. Every hour, flagged or not, then joins the
+baseline, so the streaming (``observe``) and batch (``score``) modes agree.
+
+``score`` replays any number of hours in one vectorized pass: the hours are
+sorted by key (stable, so time order is kept within a key), and the mean and
+variance before each hour come from cumulative sums within its key, merged
+with the detector's current state.
+"""
+import math
+
+import numpy as np
+import pandas as pd
+
+from .instrument import staged
+from .prepare import MONTH_SEASON, SEASONS
+
+KEY_DIMENSIONS = {'hour': 24, 'dayofweek': 7, 'season': len(SEASONS), 'is_holiday': 2}
+N_KEYS = int(np.prod(tuple(KEY_DIMENSIONS.values())))
+SEASON_CODES = {label: code for code, label in SEASONS.items()}
+
+
+def baseline_keys(hours):
+    """Key of each hour of a prepared frame (or dict of arrays); -1 where the season is unknown."""
+    season = hours['season']
+    if isinstance(getattr(season, 'dtype', None), pd.CategoricalDtype):
+        season = pd.Categorical(season, categories=list(SEASONS.values())).codes
+    else:
+        season = pd.Categorical(np.atleast_1d(season), categories=list(SEASONS.values())).codes
+    season = np.asarray(season, dtype=np.int64)
+    coords = [np.asarray(hours['hour'], dtype=np.int64), np.asarray(hours['dayofweek'], dtype=np.int64),
+              np.maximum(season, 0), (np.asarray(hours['is_holiday']) == 1).astype(np.int64)]
+    keys = np.ravel_multi_index(coords, tuple(KEY_DIMENSIONS.values()))
+    return np.where(season < 0, -1, keys)
+
+
+class AnomalyDetector:
+    """Per-key running mean and variance of ``count``, scoring hours as they arrive."""
+
+    def __init__(self, threshold=4.0, min_count=8, warmup=24 * 7, min_std=1.0):
+        self.threshold = threshold
+        self.min_count = min_count
+        self.warmup = warmup
+        self.min_std = min_std
+        self.seen = 0
+        # Python lists: per-event updates on them are several times faster than on NumPy scalars
+        self._n = [0] * N_KEYS
+        self._mean = [0.0] * N_KEYS
+        self._m2 = [0.0] * N_KEYS
+
+    def state(self):
+        """``n``, ``mean`` and ``std`` of every key as a frame indexed by ``KEY_DIMENSIONS``."""
+        n = np.array(self._n, dtype=np.float64)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            std = np.sqrt(np.array(self._m2) / (n - 1))
+        index = pd.MultiIndex.from_product([range(levels) for levels in KEY_DIMENSIONS.values()],
+                                           names=list(KEY_DIMENSIONS))
+        frame = pd.DataFrame({'n': n.astype(np.int64), 'mean': np.where(n > 0, self._mean, np.nan),
+                              'std': np.where(n > 1, std, np.nan)}, index=index)
+        frame.index = frame.index.set_levels(list(SEASONS.values()), level='season')
+        return frame
+
+    def observe(self, time, count, is_holiday=0, season=None):
+        """Score one hour, then add it to the baseline; returns ``(z, is_anomaly)``.
+
+        ``time`` is a ``datetime``/``Timestamp``; ``season`` (a label) defaults
+        to the meteorological season of its month. ``z`` is NaN while the key
+        has fewer than two earlier hours. A missing or infinite ``count`` is
+        not scored and leaves the baseline unchanged, as in ``score``.
+        """
+        season_code = MONTH_SEASON[time.month - 1] if season is None else SEASON_CODES[season]
+        key = ((time.hour * 7 + time.weekday()) * 4 + season_code) * 2 + (is_holiday == 1)
+        return self.observe_key(key, count)
+
+    def observe_key(self, key, count):
+        """``observe`` for a precomputed ``baseline_keys`` key.
+
+        Like ``score``, an hour without a key (-1, unknown season) or with a
+        missing or infinite count is not scored and leaves the state unchanged.
+        """
+        if not 0 <= key < N_KEYS or not math.isfinite(count):
+            return float('nan'), False
+        n = self._n[key]
+        mean = self._mean[key]
+        if n > 1:
+            std = max((self._m2[key] / (n - 1)) ** 0.5, self.min_std)
+            z = (count - mean) / std
+            anomaly = n >= self.min_count and self.seen >= self.warmup and abs(z) > self.threshold
+        else:
+            z, anomaly = float('nan'), False
+        n += 1
+        delta = count - mean
+        mean += delta / n
+        self._n[key] = n
+        self._mean[key] = mean
+        self._m2[key] += delta * (count - mean)
+        self.seen += 1
+        return z, anomaly
+
+    @staged('anomaly_score')
+    def score(self, hours, update=True):
+        """Score a batch of hours in time order, vectorized; returns a frame like ``hours``' rows.
+
+        Columns: ``expected`` (the baseline mean), ``std``, ``n`` (earlier
+        hours of the key), ``z`` and ``anomaly``. Hours with an unknown
+        season or a missing or infinite count are not scored and do not update the baseline. With
+        ``update=False`` every hour is scored against the current state only.
+        """
+        keys = baseline_keys(hours)
+        x = np.asarray(hours['count'], dtype=np.float64)
+        valid = (keys >= 0) & np.isfinite(x)
+        position = np.cumsum(valid) - valid + self.seen
+        n0 = np.array(self._n, dtype=np.float64)
+        mean0 = np.array(self._mean)
+        m20 = np.array(self._m2)
+
+        rows = np.flatnonzero(valid)
+        # Keys fit in int16, where a stable argsort is a radix sort
+        order = np.argsort(keys[rows].astype(np.int16), kind='stable')
+        target = rows[order]
+        xs = x[target]
+        per_key = np.bincount(keys[target], minlength=N_KEYS)
+        first = np.cumsum(per_key) - per_key
+        na, mean_a, m2_a = (np.repeat(a, per_key) for a in (n0, mean0, m20))
+        if update and len(xs):
+            # Sums over the earlier hours of the key in this batch, shifted by its first value for accuracy
+            shift = np.repeat(xs[np.minimum(first, len(xs) - 1)], per_key)
+            d = xs - shift
+            c1 = np.cumsum(d) - d
+            c2 = np.cumsum(d * d) - d * d
+            s1 = c1 - np.repeat(c1[np.minimum(first, len(xs) - 1)], per_key)
+            s2 = c2 - np.repeat(c2[np.minimum(first, len(xs) - 1)], per_key)
+            nb = np.arange(len(xs), dtype=np.float64) - np.repeat(first, per_key)
+            # Merge with the detector state: mean and squared deviations of state + earlier batch hours
+            n = na + nb
+            with np.errstate(invalid='ignore', divide='ignore'):
+                mean = (na * mean_a + nb * shift + s1) / n
+            e = mean - shift
+            m2 = m2_a + na * (mean_a - mean) ** 2 + np.maximum(s2 - 2 * e * s1 + nb * e * e, 0)
+        else:
+            n, mean, m2 = na, mean_a, m2_a
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            std = np.where(n > 1, np.sqrt(m2 / (n - 1)), np.nan)
+            z = np.where(n > 1, (xs - mean) / np.maximum(std, self.min_std), np.nan)
+        out = {name: np.full(len(x), np.nan) for name in ('expected', 'std', 'z')}
+        out['n'] = np.zeros(len(x), dtype=np.int64)
+        out['expected'][target] = np.where(n > 0, mean, np.nan)
+        out['std'][target] = std
+        out['z'][target] = z
+        out['n'][target] = n
+        with np.errstate(invalid='ignore'):
+            out['anomaly'] = ((out['n'] >= self.min_count) & (position >= self.warmup)
+                              & (np.abs(out['z']) > self.threshold))
+
+        if update and len(xs):
+            # Fold the last hour of each key into its merged state
+            last = (first + per_key - 1)[per_key > 0]
+            merged = n[last] > 0
+            mean_l = np.where(merged, mean[last], 0.0)
+            delta = xs[last] - mean_l
+            ln = n[last] + 1
+            lk = np.flatnonzero(per_key)
+            n0[lk] = ln
+            mean0[lk] = mean_l + delta / ln
+            m20[lk] = np.where(merged, m2[last], 0.0) + delta * (xs[last] - mean0[lk])
+            self._n = n0.astype(np.int64).tolist()
+            self._mean = mean0.tolist()
+            self._m2 = m20.tolist()
+            self.seen += len(rows)
+        return pd.DataFrame(out, index=getattr(hours, 'index', None))
+
+
+def replay(bike, **kwargs):
+    """Score the whole history of a prepared frame (sorted by time) with a new detector."""
+    detector = AnomalyDetector(**kwargs)
+    return detector, detector.score(bike)
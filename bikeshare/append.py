@@ -0,0 +1,211 @@
+"""Incremental append of new hourly observations.
+
+An ``HourlyStore`` keeps the prepared rows as a list of snapshot segments,
+together with the count cube and the ``StreamingStats`` accumulators built
+from them. ``append`` prepares only the new rows, writes them as a new
+segment and folds them into the cube and the accumulators, so an hourly
+refresh costs time in proportion to the new rows (plus the size of the cube),
+not to the whole history.
+
+Every file is written to a temporary name and moved into place, and files
+are never rewritten under a name the manifest points to: every save writes
+``cube-<generation>.npz`` under a new generation number. ``manifest.json`` is replaced last and is the commit
+point, so a crash leaves the previous state intact. Each append records its
+batch id (by default a hash of the rows), and appending a batch already in
+the manifest does nothing, so a retry after a failure is safe.
+
+The statistics accumulators, with their quantile sample the largest file of
+the store, are only written by ``flush`` (every ``STATS_FLUSH_SEGMENTS``
+appends, on ``consolidate`` and on request); opening the store folds in the
+segments appended since. Usage, e.g. from an hourly job::
+
+    store = HourlyStore.create('london.store', load_bike('london_merged.csv'))  # once
+    store = HourlyStore('london.store')
+    store.append('latest_hour.csv')            # or a read_bike_csv frame
+    data = store.report_data()                 # ReportData for build_tables / the figure jobs
+    tables = build_tables(data, cache=cache, version=store.version)
+"""
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from .cube import build_cube, load_cube, merge_cubes
+from .load import arrays_to_frame, cache_path, frame_to_arrays, read_bike_csv
+from .prepare import prepare_bike
+from .stats import NUMERICAL_COLUMNS, StreamingStats
+
+# Appends between two writes of the statistics accumulators
+STATS_FLUSH_SEGMENTS = 24
+# Batch ids remembered for idempotent retries
+BATCH_HISTORY = 1000
+
+
+def store_path(path, cache_dir=None):
+    """Default store directory for the CSV ``path``."""
+    return cache_path(path, '.store', cache_dir)
+
+
+def _epoch_ns(times):
+    return np.asarray(times, dtype='datetime64[ns]').astype(np.int64)
+
+
+def check_new_times(times, last_time=None):
+    """Raise ValueError unless ``times`` are strictly increasing and after ``last_time`` (ns)."""
+    ns = _epoch_ns(times)
+    steps = np.diff(ns)
+    if (steps == 0).any():
+        duplicate = pd.Timestamp(ns[1:][steps == 0][0])
+        raise ValueError(f'duplicate timestamp {duplicate} in the new rows')
+    if (steps < 0).any():
+        position = int(np.flatnonzero(steps < 0)[0]) + 1
+        raise ValueError(f'new rows are out of order at {pd.Timestamp(ns[position])}')
+    if last_time is not None and len(ns) and ns[0] <= last_time:
+        raise ValueError(f'new rows start at {pd.Timestamp(ns[0])}, '
+                         f'not after the stored data ({pd.Timestamp(last_time)})')
+
+
+def batch_id(rows):
+    """Content hash of a frame of raw rows, the default batch id of ``HourlyStore.append``."""
+    hashes = pd.util.hash_pandas_object(rows, index=False).to_numpy()
+    return hashlib.blake2b(hashes.tobytes(), digest_size=16).hexdigest()
+
+
+class HourlyStore:
+    """Prepared rows, count cube and statistics accumulators kept up to date by ``append``."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        with open(self._file('manifest.json')) as f:
+            self.manifest = json.load(f)
+        self.cube = load_cube(self._file(self.manifest.get('cube', 'cube.npz')))
+        with np.load(self._file(self.manifest.get('stats', 'stats.npz')), allow_pickle=False) as arrays:
+            self.stats = StreamingStats.from_arrays(dict(arrays))
+        # Segments appended after the last flush of the accumulators
+        covered = self.manifest.get('stats_segments', len(self.manifest['segments']))
+        for name in self.manifest['segments'][covered:]:
+            self.stats.update(self._read_segment(name))
+
+    def _file(self, name):
+        return os.path.join(self.directory, name)
+
+    def _write_atomic(self, name, arrays):
+        # Written under a temporary name and moved into place, so a reader never sees a partial file
+        tmp = self._file(name + '.tmp')
+        with open(tmp, 'wb') as f:
+            np.savez(f, **arrays)
+        os.replace(tmp, self._file(name))
+
+    def _read_segment(self, name):
+        with np.load(self._file(name), allow_pickle=False) as arrays:
+            return arrays_to_frame(dict(arrays))
+
+    @classmethod
+    def create(cls, directory, bike):
+        """Start a store from a prepared frame (e.g. ``load_bike``)."""
+        check_new_times(bike['time'])
+        os.makedirs(directory, exist_ok=True)
+        store = cls.__new__(cls)
+        store.directory = directory
+        store.manifest = {'segments': [], 'rows': 0, 'last_time': None, 'version': 0, 'batches': []}
+        store.cube = build_cube(bike)
+        store.stats = StreamingStats(NUMERICAL_COLUMNS).update(bike)
+        store._write_segment(bike)
+        store._save(flush=True)
+        return store
+
+    @property
+    def version(self):
+        """Counter bumped by every append, usable as a data version."""
+        return self.manifest['version']
+
+    def _write_segment(self, bike):
+        # Segment numbers keep increasing, also across ``consolidate``
+        number = self.manifest.get('next_segment', len(self.manifest['segments']))
+        name = f'segment-{number:06d}.npz'
+        self._write_atomic(name, frame_to_arrays(bike))
+        self.manifest['next_segment'] = number + 1
+        self.manifest['segments'].append(name)
+        self.manifest['rows'] += len(bike)
+        if len(bike):
+            self.manifest['last_time'] = int(_epoch_ns(bike['time'])[-1])
+
+    def _save(self, flush=False):
+        # New files under new names first, then the manifest pointing to them, then the old files go
+        generation = self.manifest.get('generation', 0) + 1
+        self.manifest['generation'] = generation
+        old = {self.manifest.get('cube', 'cube.npz')}
+        self.manifest['cube'] = f'cube-{generation:06d}.npz'
+        self._write_atomic(self.manifest['cube'], frame_to_arrays(self.cube))
+        unflushed = len(self.manifest['segments']) - self.manifest.get('stats_segments', 0)
+        if flush or unflushed >= STATS_FLUSH_SEGMENTS:
+            old.add(self.manifest.get('stats', 'stats.npz'))
+            self.manifest['stats'] = f'stats-{generation:06d}.npz'
+            self.manifest['stats_segments'] = len(self.manifest['segments'])
+            self._write_atomic(self.manifest['stats'], self.stats.to_arrays())
+        tmp = self._file('manifest.json.tmp')
+        with open(tmp, 'w') as f:
+            json.dump(self.manifest, f)
+        os.replace(tmp, self._file('manifest.json'))
+        for name in old - {self.manifest['cube'], self.manifest['stats']}:
+            if os.path.exists(self._file(name)):
+                os.remove(self._file(name))
+
+    def flush(self):
+        """Write the statistics accumulators now, so opening the store replays no segment."""
+        if self.manifest.get('stats_segments') != len(self.manifest['segments']):
+            self._save(flush=True)
+
+    def append(self, rows, batch=None):
+        """Add new raw rows (a ``read_bike_csv`` frame or a CSV path) and return them prepared.
+
+        Rows must be in time order, without duplicates and strictly after the
+        stored data; otherwise ValueError is raised and nothing is changed.
+        ``batch`` identifies the rows (default: ``batch_id(rows)``); a batch
+        already appended is skipped and returns None.
+        """
+        if isinstance(rows, (str, os.PathLike)):
+            rows = read_bike_csv(rows)
+        batch = batch_id(rows) if batch is None else str(batch)
+        if batch in self.manifest.get('batches', []):
+            return None
+        check_new_times(rows['timestamp'], self.manifest['last_time'])
+        if not len(rows):
+            return prepare_bike(rows)
+        new = prepare_bike(rows.reset_index(drop=True))
+        self._write_segment(new)
+        self.cube = merge_cubes(self.cube, build_cube(new))
+        self.stats.update(new)
+        self.manifest['version'] += 1
+        self.manifest['batches'] = (self.manifest.get('batches', []) + [batch])[-BATCH_HISTORY:]
+        self._save()
+        return new
+
+    def load(self):
+        """All prepared rows as one frame."""
+        frames = [self._read_segment(name) for name in self.manifest['segments']]
+        return pd.concat(frames, ignore_index=True)
+
+    def report_data(self, **options):
+        """``ReportData`` of the stored rows, reusing the stored cube and accumulators.
+
+        ``options`` go to ``ReportData`` (``ci_method``, ``relationship_mode``).
+        """
+        from .report import ReportData
+
+        data = ReportData(self.directory, bike=self.load(), **options)
+        data._cube = self.cube
+        data._stats = StreamingStats.from_arrays(self.stats.to_arrays())
+        return data
+
+    def consolidate(self):
+        """Rewrite all segments as one (e.g. nightly, after many hourly appends)."""
+        bike = self.load()
+        old = self.manifest['segments']
+        self.manifest.update(segments=[], rows=0)
+        self._write_segment(bike)
+        self._save(flush=True)
+        for name in old:
+            os.remove(self._file(name))
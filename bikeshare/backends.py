@@ -0,0 +1,301 @@
+"""Load, prepare and group-sum stages behind interchangeable dataframe backends.
+
+Every backend has the same four methods:
+
+- ``load_prepared(path, compact=False)``: the parse and prepare stages of one
+  file, as the pandas frame of ``prepare_bike`` (what ``load_bike`` snapshots),
+- ``read(paths, columns=None, filters=None)``: the prepared columns of one or
+  more london_merged.csv style files, as the backend's own frame type,
+- ``group_sums(paths, by, columns=('count',), filters=None)``: the number of
+  rows (``n``) and the sums of ``columns`` per group of ``by``, as a pandas
+  frame in a backend-independent layout (see ``normalize_sums``),
+- ``to_pandas(frame)``.
+
+``filters`` are ``{column: value or [values]}`` on the prepared columns,
+e.g. ``{'season': 'summer', 'hour': [7, 8, 9]}``.
+
+``'pandas'`` is the eager path of the report: ``load_bike`` (with its
+snapshot) per file, then boolean filters and ``groupby``. ``'arrow'`` is a
+lazy pyarrow engine: it scans the CSV files as one dataset, reads only the
+raw columns the request needs, pushes the filters on raw columns (season and
+weather codes, flags, measurements) into the scan, and prepares and
+aggregates record batches on a thread pool (Arrow compute releases the GIL),
+so memory is bounded by the batches in flight. Which one is faster depends
+on the size, the query and the cores: measure with ``bench_backends``.
+
+The stages of the package pick their backend with a ``backend`` argument
+(``load_bike``, ``ReportData``, ``open_bike_store``, ``map_reduce``) or a
+``--backend`` option of the commands; left unset, it is read from the
+``BIKESHARE_BACKEND`` environment variable, then ``DEFAULT_BACKEND``. The
+snapshot and column store hold the same frame whichever backend built them.
+"""
+import importlib.util
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from .instrument import staged
+from .load import RAW_DTYPES, TIMESTAMP_FORMAT, load_bike, read_bike_csv
+from .prepare import CALENDAR_COLUMNS, COLUMN_NAMES, SEASONS, WEATHER, compact_bike, prepare_bike
+
+DEFAULT_BACKEND = 'pandas'
+# Environment variable naming the backend of the stages not given one
+BACKEND_ENV = 'BIKESHARE_BACKEND'
+
+# Prepared categorical columns and the raw codes behind their labels
+CODE_MAPPINGS = {'season': SEASONS, 'weather': WEATHER}
+# Raw CSV column each prepared column is computed from
+RAW_COLUMN = {prepared: raw for raw, prepared in COLUMN_NAMES.items()}
+RAW_COLUMN.update({name: 'timestamp' for name in CALENDAR_COLUMNS})
+# Bytes of CSV parsed per record batch by the arrow backend
+ARROW_BLOCK_SIZE = 16 << 20
+
+
+def _as_list(value):
+    return list(value) if isinstance(value, (list, tuple, set, frozenset)) else [value]
+
+
+def _check_columns(names):
+    unknown = set(names) - set(RAW_COLUMN)
+    if unknown:
+        raise ValueError(f'unknown columns: {sorted(unknown)}; choose from {sorted(RAW_COLUMN)}')
+
+
+def normalize_sums(frame, by):
+    """Put a frame of group keys, ``n`` and sums in the common layout.
+
+    Groups sorted by key (categorical keys in the order of ``SEASONS`` /
+    ``WEATHER``), keys as the index, groups with a missing key dropped.
+    """
+    frame = frame.dropna(subset=by)
+    for name in by:
+        if name in CODE_MAPPINGS:
+            frame[name] = pd.Categorical(frame[name].astype(str), categories=list(CODE_MAPPINGS[name].values()))
+        else:
+            frame[name] = frame[name].astype(np.int64)
+    frame = frame.sort_values(by).set_index(by)
+    return frame[['n'] + [c for c in frame.columns if c != 'n']]
+
+
+class PandasBackend:
+    """Eager pandas backend: the prepared frames of ``load_bike``."""
+
+    name = 'pandas'
+
+    def __init__(self, cache_dir=None):
+        self.cache_dir = cache_dir
+
+    def load_prepared(self, path, compact=False):
+        return prepare_bike(read_bike_csv(path), compact=compact)
+
+    def read(self, paths, columns=None, filters=None):
+        frames = []
+        for path in _as_list(paths):
+            bike = load_bike(path, self.cache_dir)
+            for name, value in (filters or {}).items():
+                bike = bike[bike[name].isin(_as_list(value))]
+            frames.append(bike if columns is None else bike[list(columns)])
+        return frames[0] if len(frames) == 1 else pd.concat(frames, ignore_index=True)
+
+    @staged('group_sums:pandas')
+    def group_sums(self, paths, by, columns=('count',), filters=None):
+        by = _as_list(by)
+        _check_columns(by + list(columns) + list(filters or {}))
+        bike = self.read(paths, by + list(columns), filters)
+        groups = bike.groupby(by, observed=True, sort=False)
+        sums = groups[list(columns)].sum()
+        sums.insert(0, 'n', groups.size())
+        return normalize_sums(sums.reset_index(), by)
+
+    def to_pandas(self, frame):
+        return frame
+
+
+class ArrowBackend:
+    """Lazy pyarrow backend: projected, filtered, multi-threaded batch scans.
+
+    ``threads`` defaults to ``pyarrow.cpu_count()``.
+    """
+
+    name = 'arrow'
+
+    def __init__(self, threads=None, block_size=ARROW_BLOCK_SIZE):
+        import pyarrow as pa
+
+        self.threads = threads or pa.cpu_count()
+        self.block_size = block_size
+
+    def _dataset(self, paths):
+        import pyarrow as pa
+        import pyarrow.csv as pacsv
+        import pyarrow.dataset as ds
+
+        types = {name: pa.int64() if dtype == 'int64' else pa.float64() for name, dtype in RAW_DTYPES.items()}
+        types['timestamp'] = pa.timestamp('s')
+        file_format = ds.CsvFileFormat(
+            read_options=pacsv.ReadOptions(block_size=self.block_size),
+            convert_options=pacsv.ConvertOptions(column_types=types, timestamp_parsers=[TIMESTAMP_FORMAT]))
+        return ds.dataset([os.fspath(p) for p in _as_list(paths)], format=file_format)
+
+    def _scan(self, paths, columns, filters):
+        # Raw columns to read, the filter pushed into the scan, and the filters left for after prepare
+        import pyarrow.dataset as ds
+
+        raw = sorted({RAW_COLUMN[name] for name in list(columns) + list(filters)})
+        pushed, remaining = None, {}
+        for name, value in filters.items():
+            values = _as_list(value)
+            if name in CODE_MAPPINGS:
+                codes = {label: code for code, label in CODE_MAPPINGS[name].items()}
+                values = [float(codes[v]) for v in values if v in codes]
+            elif name in CALENDAR_COLUMNS or name == 'humidity_percent':
+                remaining[name] = values
+                continue
+            expression = ds.field(RAW_COLUMN[name]).isin(values)
+            pushed = expression if pushed is None else pushed & expression
+        scanner = self._dataset(paths).scanner(columns=raw, filter=pushed, use_threads=True)
+        return scanner, remaining
+
+    def _batches(self, paths, columns, filters, function):
+        # function(prepared batch) over the scanned batches, at most 2 per thread in flight, in order
+        scanner, remaining = self._scan(paths, columns, filters)
+        pending = []
+        with ThreadPoolExecutor(self.threads) as pool:
+            for batch in scanner.to_batches():
+                if batch.num_rows:
+                    pending.append(pool.submit(self._prepare_and_apply, batch, columns, remaining, function))
+                while len(pending) >= 2 * self.threads or (pending and pending[0].done()):
+                    yield pending.pop(0).result()
+            for future in pending:
+                yield future.result()
+
+    @staticmethod
+    def _prepare_and_apply(batch, columns, remaining, function):
+        import pyarrow as pa
+        import pyarrow.compute as pc
+
+        table = prepare_arrow(batch, set(columns) | set(remaining))
+        if remaining:
+            keep = None
+            for name, values in remaining.items():
+                mask = pc.is_in(table[name], value_set=pa.array(values, table.schema.field(name).type))
+                keep = mask if keep is None else pc.and_(keep, mask)
+            table = table.filter(keep)
+        return function(table.select(list(columns)))
+
+    @staged('load_prepared:arrow')
+    def load_prepared(self, path, compact=False):
+        bike = self.to_pandas(self.read(path))
+        # The resolution pandas parses timestamps to (it differs between pandas versions)
+        parsed = pd.to_datetime(pd.Series(['2015-01-04 00:00:00']), format=TIMESTAMP_FORMAT)
+        bike['time'] = bike['time'].astype(parsed.dtype)
+        for name, mapping in CODE_MAPPINGS.items():
+            # Every label as a category, as map_codes leaves them, even where a file lacks some
+            bike[name] = pd.Categorical(bike[name].astype(object), categories=list(mapping.values()))
+        return compact_bike(bike) if compact else bike
+
+    def read(self, paths, columns=None, filters=None):
+        import pyarrow as pa
+
+        columns = list(RAW_COLUMN) if columns is None else list(columns)
+        filters = filters or {}
+        _check_columns(columns + list(filters))
+        tables = list(self._batches(paths, columns, filters, lambda table: table))
+        if not tables:
+            return prepare_arrow(self._dataset(paths).schema.empty_table(), set(columns)).select(columns)
+        return pa.concat_tables(tables)
+
+    @staged('group_sums:arrow')
+    def group_sums(self, paths, by, columns=('count',), filters=None):
+        import pyarrow as pa
+        import pyarrow.compute as pc
+
+        by = _as_list(by)
+        columns = list(columns)
+        filters = filters or {}
+        _check_columns(by + columns + list(filters))
+        # Group on the int8 codes of categorical keys, so partials from different batches line up
+        sum_options = pc.ScalarAggregateOptions(min_count=0)
+
+        def partial(table):
+            for name in by:
+                if name in CODE_MAPPINGS:
+                    table = table.set_column(table.schema.get_field_index(name), name,
+                                             table[name].combine_chunks().indices)
+            return table.group_by(by, use_threads=False).aggregate(
+                [(c, 'sum', sum_options) for c in columns] + [([], 'count_all')])
+
+        partials = list(self._batches(paths, by + columns, filters, partial))
+        names = [f'{c}_sum' for c in columns] + ['count_all']
+        if partials:
+            merged = (pa.concat_tables(partials).group_by(by, use_threads=False)
+                      .aggregate([(name, 'sum', sum_options) for name in names]))
+            frame = merged.to_pandas()
+            frame.columns = [c[:-len('_sum')] if c.endswith('_sum') else c for c in frame.columns]
+        else:
+            frame = pd.DataFrame({name: [] for name in by + [c + '_sum' for c in columns] + ['count_all']})
+        frame = frame.rename(columns={c + '_sum': c for c in columns} | {'count_all': 'n'})
+        for name in by:
+            if name in CODE_MAPPINGS:
+                labels = np.array(list(CODE_MAPPINGS[name].values()), dtype=object)
+                codes = frame[name].to_numpy(dtype=np.float64, na_value=np.nan)
+                frame[name] = np.where(np.isnan(codes), None, labels[np.nan_to_num(codes, nan=0).astype(int)])
+        frame['n'] = frame['n'].astype(np.int64)
+        return normalize_sums(frame, by)
+
+    def to_pandas(self, frame):
+        return frame.to_pandas()
+
+
+def prepare_arrow(raw, columns=None):
+    """``prepare_bike`` on an Arrow table or record batch of raw columns, with Arrow compute.
+
+    Only the prepared ``columns`` whose raw column is present are computed
+    (all of them by default); season and weather become dictionary arrays
+    with the ``SEASONS`` / ``WEATHER`` labels, unknown codes null.
+    """
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    names = set(raw.schema.names)
+    wanted = [name for name in RAW_COLUMN if (columns is None or name in columns) and RAW_COLUMN[name] in names]
+    arrays = {}
+    for name in wanted:
+        values = raw.column(RAW_COLUMN[name])
+        if name == 'humidity_percent':
+            values = pc.divide(values, 100.0)
+        elif name in CODE_MAPPINGS:
+            mapping = CODE_MAPPINGS[name]
+            positions = pc.index_in(values, value_set=pa.array(list(mapping), pa.float64()))
+            if isinstance(positions, pa.ChunkedArray):
+                positions = positions.combine_chunks()
+            values = pa.DictionaryArray.from_arrays(pc.cast(positions, pa.int8()),
+                                                    pa.array(list(mapping.values())))
+        elif name in CALENDAR_COLUMNS:
+            values = {'year': pc.year, 'month': pc.month, 'dayofweek': pc.day_of_week, 'hour': pc.hour}[name](values)
+        arrays[name] = values
+    return pa.table(arrays)
+
+
+# Backend name -> class
+BACKENDS = {'pandas': PandasBackend, 'arrow': ArrowBackend}
+
+
+def available_backends():
+    """Names of the backends whose libraries are installed."""
+    return [name for name in BACKENDS if name != 'arrow' or importlib.util.find_spec('pyarrow')]
+
+
+def backend_name(name=None):
+    """``name``, else the ``BIKESHARE_BACKEND`` environment variable, else ``DEFAULT_BACKEND``."""
+    return name or os.environ.get(BACKEND_ENV) or DEFAULT_BACKEND
+
+
+def get_backend(name=None, **kwargs):
+    """Instance of the backend ``name`` (see ``backend_name``; ``kwargs`` go to its constructor)."""
+    name = backend_name(name)
+    if name not in BACKENDS:
+        raise ValueError(f'unknown backend {name!r}; choose from {sorted(BACKENDS)}')
+    return BACKENDS[name](**kwargs)
@@ -0,0 +1,190 @@
+"""Content-addressed cache of computed tables and rendered figures.
+
+Every artifact is stored under a key made of the input data version, the
+artifact name, its parameters (columns, estimator, hue, bins, ...) and the
+source code of the function that produces it together with every
+``bikeshare`` function, class and module it reaches through its globals
+(``rollup``, ``pointplot_ci``, ``plots``, ...). Changing a parameter, a job
+or one of its helpers therefore only misses the artifacts it affects.
+
+The data version is the hash of the whole CSV, on purpose: every table and
+figure of the report aggregates all rows, so any appended or edited row
+changes all of them and keying on the rows each one reads would not save a
+recomputation. Entries are evicted least-recently-used once the cache grows
+beyond ``max_bytes``.
+"""
+import hashlib
+import inspect
+import json
+import os
+import pickle
+import sys
+import time
+import types
+from collections import Counter
+
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+
+def _source(obj):
+    try:
+        return inspect.getsource(obj)
+    except (OSError, TypeError):
+        return getattr(obj, '__qualname__', repr(obj))
+
+
+def _is_local(obj):
+    # Functions, classes and modules of this package, the ones whose edits must change the keys
+    name = obj.__name__ if isinstance(obj, types.ModuleType) else getattr(obj, '__module__', None)
+    package = __name__.rpartition('.')[0]
+    return isinstance(name, str) and (name == package or name.startswith(package + '.'))
+
+
+def _code_names(code):
+    # Global names used by a code object and the functions, lambdas and comprehensions nested in it
+    names = set(code.co_names)
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            names |= _code_names(const)
+    return names
+
+
+def _dependencies(obj):
+    """``bikeshare`` functions, classes and modules ``obj`` refers to through its globals."""
+    if isinstance(obj, types.ModuleType):
+        return []
+    if isinstance(obj, type):
+        members = [inspect.unwrap(m) for m in vars(obj).values() if inspect.isfunction(inspect.unwrap(m))]
+        return [dep for member in members for dep in _dependencies(member)]
+    function = inspect.unwrap(obj)
+    code, scope = getattr(function, '__code__', None), getattr(function, '__globals__', {})
+    if code is None:
+        return []
+    found = [scope[name] for name in sorted(_code_names(code)) if name in scope]
+    return [dep for dep in found if (inspect.isfunction(dep) or isinstance(dep, (type, types.ModuleType)))
+            and _is_local(dep)]
+
+
+def source_digest(function):
+    """Hash of the source of ``function`` and of the ``bikeshare`` code it reaches.
+
+    The walk follows global names transitively: functions and classes are
+    hashed by their source (and walked further), modules referred to as a
+    whole (``plots.pointplot_ci``) by the source of the module.
+    """
+    digest = hashlib.blake2b(digest_size=8)
+    seen, pending = set(), [function]
+    while pending:
+        obj = pending.pop()
+        key = id(obj)
+        if key in seen:
+            continue
+        seen.add(key)
+        name = getattr(obj, '__module__', None) or getattr(obj, '__name__', '')
+        qualname = getattr(obj, '__qualname__', '') if not isinstance(obj, types.ModuleType) else ''
+        entries = (name, qualname, _source(sys.modules.get(obj.__name__, obj) if isinstance(obj, types.ModuleType)
+                                           else obj))
+        digest.update(json.dumps(entries).encode())
+        pending.extend(_dependencies(obj))
+    return digest.hexdigest()
+
+
+def artifact_key(data_version, name, params=None, function=None):
+    """Key of one artifact computed from ``data_version`` with ``params``."""
+    parts = [data_version, name, params or {}, source_digest(function) if function else None]
+    payload = json.dumps(parts, sort_keys=True, default=str)
+    return hashlib.blake2b(payload.encode(), digest_size=16).hexdigest()
+
+
+class ResultCache:
+    """LRU cache of pickled tables and raw figure bytes in ``directory``.
+
+    ``hits`` and ``misses`` count lookups per artifact name; ``summary()``
+    formats them for the end of a rebuild.
+    """
+
+    def __init__(self, directory, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = Counter()
+        self.misses = Counter()
+        os.makedirs(directory, exist_ok=True)
+        self._index_path = os.path.join(directory, 'index.json')
+        try:
+            with open(self._index_path) as f:
+                self.index = json.load(f)
+        except (OSError, ValueError):
+            self.index = {}
+
+    def _path(self, key):
+        return os.path.join(self.directory, key)
+
+    def _save_index(self):
+        tmp = f'{self._index_path}.{os.getpid()}.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self.index, f)
+        os.replace(tmp, self._index_path)
+
+    def get_bytes(self, key):
+        """Stored bytes for ``key``, or None."""
+        if key not in self.index:
+            return None
+        try:
+            with open(self._path(key), 'rb') as f:
+                data = f.read()
+        except OSError:
+            del self.index[key]
+            return None
+        self.index[key]['used'] = time.time()
+        return data
+
+    def put_bytes(self, key, data, name=''):
+        # Written next to the entry and swapped in, so a reader never sees part of one
+        tmp = f'{self._path(key)}.{os.getpid()}.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, self._path(key))
+        self.index[key] = {'name': name, 'size': len(data), 'used': time.time()}
+        self._evict()
+
+    def _evict(self):
+        total = sum(entry['size'] for entry in self.index.values())
+        for key in sorted(self.index, key=lambda k: self.index[k]['used']):
+            if total <= self.max_bytes:
+                break
+            total -= self.index.pop(key)['size']
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+
+    def lookup(self, key, name):
+        """``get_bytes`` that also records a hit or a miss for ``name``."""
+        data = self.get_bytes(key)
+        (self.misses if data is None else self.hits)[name] += 1
+        return data
+
+    def compute(self, data_version, name, function, params=None, args=()):
+        """Return ``function(*args, **params)``, from the cache when computed before.
+
+        ``args`` (e.g. the loaded data) are not part of the key: they must be
+        determined by ``data_version``.
+        """
+        key = artifact_key(data_version, name, params, function)
+        data = self.lookup(key, name)
+        if data is not None:
+            return pickle.loads(data)
+        value = function(*args, **(params or {}))
+        self.put_bytes(key, pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL), name)
+        return value
+
+    def flush(self):
+        """Persist the index (access times and entries)."""
+        self._save_index()
+
+    def summary(self):
+        names = sorted(set(self.hits) | set(self.misses))
+        lines = [f'{name:24s} {"hit" if self.hits[name] else "miss"}' for name in names]
+        lines.append(f'{sum(self.hits.values())} hits, {sum(self.misses.values())} misses, '
+                     f'{sum(e["size"] for e in self.index.values()) / 1e6:.1f} MB cached')
+        return '\n'.join(lines)
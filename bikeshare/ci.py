@@ -0,0 +1,104 @@
+"""Confidence intervals of the mean of ``count`` for all groups at once.
+
+Replaces seaborn's per-point bootstrap in the point plots. ``'t'`` and
+``'normal'`` intervals come straight from the group moments in the count cube;
+``'bootstrap'`` resamples every group together with one random index matrix
+per block of resamples.
+"""
+from statistics import NormalDist
+
+import numpy as np
+import pandas as pd
+
+from .cube import build_cube, rollup
+from .instrument import staged
+
+CI_METHODS = ('t', 'normal', 'bootstrap')
+# Number of (resample, row) draws generated at once by the bootstrap
+BOOTSTRAP_BLOCK = 1 << 22
+
+
+def t_quantile(p, df):
+    """Quantile ``p`` of Student's t for an array of degrees of freedom.
+
+    Exact for 1 and 2 degrees of freedom, Cornish-Fisher expansion above
+    (absolute error about 4e-3 at 3 degrees of freedom, below 3e-4 from 5 on).
+    """
+    df = np.asarray(df, dtype=np.float64)
+    z = NormalDist().inv_cdf(p)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        t = (z
+             + (z ** 3 + z) / (4 * df)
+             + (5 * z ** 5 + 16 * z ** 3 + 3 * z) / (96 * df ** 2)
+             + (3 * z ** 7 + 19 * z ** 5 + 17 * z ** 3 - 15 * z) / (384 * df ** 3)
+             + (79 * z ** 9 + 776 * z ** 7 + 1482 * z ** 5 - 1920 * z ** 3 - 945 * z) / (92160 * df ** 4))
+    t = np.where(df == 1, np.tan(np.pi * (p - 0.5)), t)
+    t = np.where(df == 2, (2 * p - 1) / np.sqrt(2 * p * (1 - p)), t)
+    return np.where(df >= 1, t, np.nan)
+
+
+def moment_ci(moments, level=0.95, method='t'):
+    """Add ``lo``/``hi`` columns to a roll-up with ``n``, ``mean`` and ``std`` columns."""
+    p = (1 + level) / 2
+    if method == 't':
+        critical = t_quantile(p, moments['n'] - 1)
+    elif method == 'normal':
+        critical = NormalDist().inv_cdf(p)
+    else:
+        raise ValueError(f'unknown analytic CI method {method!r}')
+    half = critical * moments['std'] / np.sqrt(moments['n'])
+    ci = moments[['n', 'mean', 'std']].copy()
+    ci['lo'] = ci['mean'] - half
+    ci['hi'] = ci['mean'] + half
+    return ci
+
+
+def bootstrap_ci(codes, values, level=0.95, n_boot=1000, seed=None):
+    """Percentile bootstrap of the mean of ``values`` in each group of ``codes``.
+
+    ``codes`` are group numbers 0..G-1 (every group non-empty). Rows are sorted
+    by group once; each block of resamples then draws a single (resamples x rows)
+    matrix of uniform numbers, turns it into indices inside each row's group and
+    sums the groups with ``np.add.reduceat``. Returns ``(mean, lo, hi)`` arrays.
+    """
+    codes = np.asarray(codes)
+    order = np.argsort(codes, kind='stable')
+    values = np.asarray(values, dtype=np.float64)[order]
+    sizes = np.bincount(codes)
+    starts = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+    group = codes[order]
+    row_start = starts[group]
+    row_size = sizes[group]
+    rng = np.random.default_rng(seed)
+    means = np.empty((n_boot, len(sizes)))
+    block = max(1, BOOTSTRAP_BLOCK // max(len(values), 1))
+    for first in range(0, n_boot, block):
+        count = min(block, n_boot - first)
+        index = row_start + (rng.random((count, len(values))) * row_size).astype(np.int64)
+        means[first:first + count] = np.add.reduceat(values[index], starts, axis=1) / sizes
+    alpha = (1 - level) / 2
+    lo, hi = np.quantile(means, [alpha, 1 - alpha], axis=0)
+    return np.bincount(group, weights=values) / sizes, lo, hi
+
+
+@staged('group_ci')
+def group_ci(bike, by, method='t', level=0.95, cube=None, n_boot=1000, seed=None):
+    """Mean of ``count`` with a ``level`` confidence interval for each group of ``by``.
+
+    ``method`` is one of ``CI_METHODS``. Analytic methods read the moments from
+    ``cube`` (built from ``bike`` if not given); ``'bootstrap'`` needs the rows.
+    Returns a frame indexed by ``by`` with ``n``, ``mean``, ``lo`` and ``hi``.
+    """
+    if method not in CI_METHODS:
+        raise ValueError(f'method must be one of {CI_METHODS}, not {method!r}')
+    if method != 'bootstrap':
+        if cube is None:
+            cube = build_cube(bike)
+        return moment_ci(rollup(cube, by), level, method)
+    grouped = bike.groupby(by, observed=True, sort=True)
+    # Rows with a missing key get a NaN group number: -1, so the mask below drops them
+    codes = grouped.ngroup().fillna(-1).to_numpy().astype(np.intp)
+    keep = codes >= 0
+    sizes = grouped.size()
+    mean, lo, hi = bootstrap_ci(codes[keep], bike['count'].to_numpy()[keep], level, n_boot, seed)
+    return pd.DataFrame({'n': sizes.to_numpy(), 'mean': mean, 'lo': lo, 'hi': hi}, index=sizes.index)
@@ -0,0 +1,167 @@
+"""Memory-mapped column store of the prepared data (NumPy only).
+
+A store is a directory with one ``.npy`` file per column (a fixed-width binary
+array behind a small header giving its dtype and length) and ``schema.json``
+with the column order, the categories of the categorical columns, the row
+count and the fingerprint of the source CSV. Readers map the files instead of
+reading them, so any number of processes share one page-cached copy, nothing
+is parsed and opening costs the same at 10^4 or 10^8 rows.
+
+Columns are mapped copy-on-write (``mmap_mode='c'``): a process that modifies
+a column gets private copies of the pages it touches and the files never
+change.
+"""
+import json
+import os
+import shutil
+
+import numpy as np
+
+from .instrument import staged
+from .snapshot import SNAPSHOT_VERSION, cache_path, file_fingerprint, fingerprint_matches
+
+# Bumped whenever the store layout changes (changes to prepare_bike are
+# covered by SNAPSHOT_VERSION, recorded alongside)
+STORE_VERSION = 1
+SCHEMA_FILE = 'schema.json'
+
+
+def store_path(path, cache_dir=None, compact=False):
+    """Where the column store of ``path`` lives."""
+    return cache_path(path, '.compact.columns' if compact else '.columns', cache_dir)
+
+
+def _column_file(directory, name):
+    return os.path.join(directory, name + '.npy')
+
+
+def write_column_store(directory, chunks, rows, fingerprint=None):
+    """Write ``chunks`` of column arrays, ``rows`` rows in all, as a column store.
+
+    Each chunk is a dict in the ``frame_to_arrays`` layout; all chunks must
+    have the same columns, dtypes and categories. The store is built next to
+    ``directory`` and swapped in when complete; processes that still map the
+    old files keep reading them.
+    """
+    tmp = directory + '.tmp'
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    schema = None
+    out = {}
+    start = 0
+    for arrays in chunks:
+        columns = [str(c) for c in arrays['__columns__']]
+        categories = {name: [str(c) for c in arrays['__categories__' + name]]
+                      for name in columns if '__categories__' + name in arrays}
+        if schema is None:
+            schema = {'version': STORE_VERSION, 'prepare_version': SNAPSHOT_VERSION, 'rows': rows, 'columns': columns, 'categories': categories,
+                      'dtypes': {name: arrays[name].dtype.str for name in columns}, 'source': fingerprint}
+            for name in columns:
+                out[name] = np.lib.format.open_memmap(_column_file(tmp, name), mode='w+',
+                                                      dtype=arrays[name].dtype, shape=(rows,))
+        elif columns != schema['columns'] or categories != schema['categories']:
+            raise ValueError('all chunks must have the same columns and categories')
+        n = len(arrays[columns[0]])
+        if start + n > rows:
+            raise ValueError(f'chunks hold more than the {rows} rows announced')
+        for name in columns:
+            out[name][start:start + n] = arrays[name]
+        start += n
+    if schema is None or start != rows:
+        raise ValueError(f'chunks hold {start} rows, not {rows}')
+    for array in out.values():
+        array.flush()
+    out.clear()
+    with open(os.path.join(tmp, SCHEMA_FILE), 'w') as f:
+        json.dump(schema, f, indent=1)
+    if os.path.exists(directory):
+        old = directory + '.old'
+        shutil.rmtree(old, ignore_errors=True)
+        os.replace(directory, old)
+        os.replace(tmp, directory)
+        shutil.rmtree(old)
+    else:
+        os.replace(tmp, directory)
+    return directory
+
+
+def _write_schema(directory, schema):
+    # Best effort: a store in a read-only cache is still usable, it is just hashed on every open
+    tmp = os.path.join(directory, f'{SCHEMA_FILE}.{os.getpid()}.tmp')
+    try:
+        with open(tmp, 'w') as f:
+            json.dump(schema, f, indent=1)
+        os.replace(tmp, os.path.join(directory, SCHEMA_FILE))
+    except OSError:
+        pass
+
+
+class ColumnStore:
+    """Read side of a column store: every column mapped, nothing read yet."""
+
+    def __init__(self, directory, mode='c'):
+        with open(os.path.join(directory, SCHEMA_FILE)) as f:
+            schema = json.load(f)
+        if schema.get('version') != STORE_VERSION:
+            raise ValueError(f'{directory}: column store version {schema.get("version")}, '
+                             f'expected {STORE_VERSION}')
+        self.directory = directory
+        self.schema = schema
+        self.columns = schema['columns']
+        self.categories = schema['categories']
+        # Plain ndarray views of the maps, so np.memmap does not leak into results
+        self._arrays = {name: np.load(_column_file(directory, name), mmap_mode=mode,
+                                      allow_pickle=False).view(np.ndarray)
+                        for name in self.columns}
+
+    def __len__(self):
+        return self.schema['rows']
+
+    def __getitem__(self, name):
+        return self._arrays[name]
+
+    def arrays(self):
+        """The mapped columns in the ``frame_to_arrays`` layout (usable by ``aggregate.summary``)."""
+        arrays = {'__columns__': np.array(self.columns, dtype=str), **self._arrays}
+        for name, categories in self.categories.items():
+            arrays['__categories__' + name] = np.array(categories, dtype=str)
+        return arrays
+
+    def to_frame(self, columns=None):
+        """DataFrame over the mapped columns.
+
+        Numeric and time columns are not copied; categorical columns are
+        rebuilt from their codes, which copies one byte per row.
+        """
+        import pandas as pd
+
+        data = {}
+        for name in columns or self.columns:
+            values = self._arrays[name]
+            if name in self.categories:
+                values = pd.Categorical.from_codes(values, self.categories[name], validate=False)
+            data[name] = values
+        return pd.DataFrame(data, copy=False)
+
+
+@staged('open_bike_store')
+def open_bike_store(path='london_merged.csv', cache_dir=None, compact=False, backend=None):
+    """``ColumnStore`` of the prepared data of ``path``, (re)built from ``load_bike`` when stale."""
+    directory = store_path(path, cache_dir, compact)
+    schema_file = os.path.join(directory, SCHEMA_FILE)
+    if os.path.exists(schema_file):
+        with open(schema_file) as f:
+            schema = json.load(f)
+        source = dict(schema.get('source') or {})
+        if (schema.get('version') == STORE_VERSION and schema.get('prepare_version') == SNAPSHOT_VERSION
+                and source and fingerprint_matches(path, source)):
+            if source != schema['source']:
+                # Touched but unchanged: store the new mtime so the next open skips the hash
+                schema['source'] = source
+                _write_schema(directory, schema)
+            return ColumnStore(directory)
+    from .load import frame_to_arrays, load_bike
+    fingerprint = file_fingerprint(path)
+    bike = load_bike(path, cache_dir, compact=compact, backend=backend)
+    write_column_store(directory, [frame_to_arrays(bike)], len(bike), fingerprint)
+    return ColumnStore(directory)
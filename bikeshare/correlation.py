@@ -0,0 +1,138 @@
+"""Correlation matrices per group and over rolling windows, in one pass.
+
+``groupby(...).corr()`` computes one correlation matrix per group, and a
+rolling 30-day window over years of hourly data means thousands of calls.
+Here every group (or day) is reduced once to its count, column sums and sums
+of cross products with ``np.bincount``; rolling windows are differences of
+the cumulative sums of the daily moments. Columns are centred on their
+overall mean first, which keeps the cumulative sums well conditioned.
+
+The results have the layout of ``groupby(...).corr()``: one row per
+(group, column) and one column per column.
+"""
+import numpy as np
+import pandas as pd
+
+from .instrument import staged
+from .stats import HEATMAP_COLUMNS
+
+# Mean group size from which the cross products are taken one matrix product
+# per group rather than one segmented sum per pair of columns
+SEGMENT_ROWS = 64
+
+
+def _values(bike, columns):
+    # One contiguous row per column, centred on the column mean; plus the
+    # mask of rows without NaN
+    values = np.empty((len(columns), len(bike)))
+    for row, column in zip(values, columns):
+        row[:] = bike[column].to_numpy(dtype=np.float64)
+    keep = ~np.isnan(values).any(axis=0)
+    if keep.all():
+        values -= values.mean(axis=1, keepdims=True)
+    elif keep.any():
+        values -= values[:, keep].mean(axis=1, keepdims=True)
+    return values, keep
+
+
+def group_moments(values, codes, n_groups):
+    """Count, column sums and cross-product sums of the columns of ``values`` per code.
+
+    ``values`` is a (k, n) array, one row per column, and ``codes`` holds the
+    group of each of the n observations in ``range(n_groups)``; returns arrays
+    of shape (g,), (g, k) and (g, k, k). Observations are sorted by group
+    (a no-op for time-ordered groups) so that every group is a contiguous
+    segment.
+    """
+    k = len(values)
+    if len(codes) > 1 and (codes[1:] < codes[:-1]).any():
+        order = np.argsort(codes, kind='stable')
+        values, codes = values[:, order], codes[order]
+    n = np.bincount(codes, minlength=n_groups).astype(np.float64)
+    sums = np.zeros((n_groups, k))
+    cross = np.zeros((n_groups, k, k))
+    present = np.flatnonzero(n)
+    if not len(present):
+        return n, sums, cross
+    ends = np.cumsum(n[present]).astype(np.intp)
+    starts = ends - n[present].astype(np.intp)
+    for i in range(k):
+        sums[present, i] = np.add.reduceat(values[i], starts)
+    if len(codes) >= SEGMENT_ROWS * len(present):
+        # Long segments: one k x k matrix product per group
+        for group, start, end in zip(present, starts, ends):
+            block = values[:, start:end]
+            cross[group] = block @ block.T
+    else:
+        product = np.empty(values.shape[1])
+        for i in range(k):
+            for j in range(i, k):
+                np.multiply(values[i], values[j], out=product)
+                cross[present, i, j] = cross[present, j, i] = np.add.reduceat(product, starts)
+    return n, sums, cross
+
+
+def moments_corr(n, sums, cross, min_periods=2):
+    """Correlation matrices from ``group_moments``; NaN where fewer than ``min_periods`` rows."""
+    with np.errstate(invalid='ignore', divide='ignore'):
+        scatter = cross - sums[:, :, None] * sums[:, None, :] / n[:, None, None]
+        std = np.sqrt(np.diagonal(scatter, axis1=1, axis2=2))
+        corr = np.clip(scatter / (std[:, :, None] * std[:, None, :]), -1, 1)
+    corr[n < max(min_periods, 2)] = np.nan
+    return corr
+
+
+def corr_frame(matrices, keys, columns):
+    """Stack (g, k, k) ``matrices`` into a frame indexed by (key, column)."""
+    if not isinstance(keys, pd.MultiIndex):
+        keys = pd.Index(keys)
+    k = len(columns)
+    levels = keys.to_frame(index=False).loc[np.repeat(np.arange(len(keys)), k)].reset_index(drop=True)
+    levels[None] = np.tile(np.asarray(columns, dtype=object), len(keys))
+    index = pd.MultiIndex.from_frame(levels, names=list(keys.names) + [None])
+    return pd.DataFrame(matrices.reshape(-1, k), index=index, columns=list(columns))
+
+
+@staged('group_corr')
+def group_corr(bike, by, columns=HEATMAP_COLUMNS, min_periods=2):
+    """Correlation matrix of ``columns`` for every group of ``by``, e.g. 'season' or ['year', 'month']."""
+    by = [by] if isinstance(by, str) else list(by)
+    grouped = bike.groupby(by, observed=True, sort=True)
+    # Rows with a missing key get a NaN group number: -1, so the mask below drops them
+    codes = grouped.ngroup().fillna(-1).to_numpy().astype(np.intp)
+    keys = grouped.size().index
+    values, keep = _values(bike, columns)
+    keep &= codes >= 0
+    if not keep.all():
+        values, codes = values[:, keep], codes[keep]
+    moments = group_moments(values, codes, len(keys))
+    return corr_frame(moments_corr(*moments, min_periods), keys, columns)
+
+
+@staged('rolling_corr')
+def rolling_corr(bike, window='30D', columns=HEATMAP_COLUMNS, min_periods=2):
+    """Correlation matrix of ``columns`` over the trailing ``window`` at the end of every day.
+
+    The window is in days of time: the matrix for day d uses the rows of days
+    (d - window, d], however many hours are missing.
+    """
+    width = int(pd.Timedelta(window) / pd.Timedelta('1D'))
+    if width < 1:
+        raise ValueError(f'window must be at least one day, not {window!r}')
+    days = bike['time'].to_numpy().astype('datetime64[D]').astype(np.int64)
+    first = days.min()
+    n_days = int(days.max() - first + 1)
+    values, keep = _values(bike, columns)
+    days -= first
+    if not keep.all():
+        values, days = values[:, keep], days[keep]
+    daily = group_moments(values, days, n_days)
+    upper = np.arange(1, n_days + 1)
+    lower = np.maximum(upper - width, 0)
+    window_moments = []
+    for moment in daily:
+        total = np.concatenate([np.zeros((1,) + moment.shape[1:]), np.cumsum(moment, axis=0)])
+        window_moments.append(total[upper] - total[lower])
+    dates = pd.DatetimeIndex((first + np.arange(n_days)).astype('datetime64[D]').astype('datetime64[s]'),
+                             name='time')
+    return corr_frame(moments_corr(*window_moments, min_periods), dates, columns)
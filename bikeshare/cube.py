@@ -0,0 +1,143 @@
+"""Pre-aggregated count cube behind the group-by charts and tables.
+
+The cube holds, for every observed combination of ``DIMENSIONS``, the number
+of rows (``n``), the sum of ``count`` and the sum of its squares. Any roll-up
+(totals, means, standard deviations by hour, season, ...) is then answered
+from the cube instead of rescanning the rows.
+"""
+import os
+
+import numpy as np
+import pandas as pd
+
+from .instrument import staged
+from .load import arrays_to_frame, cache_path, frame_to_arrays
+
+DIMENSIONS = ['year', 'month', 'dayofweek', 'hour', 'season', 'weather', 'is_holiday', 'is_weekend']
+MEASURES = ['n', 'sum', 'sumsq']
+
+
+def _dimension_codes(bike):
+    """Zero-based integer code, number of levels and label decoder for each dimension."""
+    year = bike['year'].to_numpy().astype(np.int64)
+    first_year = int(year.min()) if len(year) else 0
+    dims = {
+        'year': (year - first_year, int(year.max()) - first_year + 1 if len(year) else 1,
+                 lambda codes: (codes + first_year).astype(np.int16)),
+        'month': (bike['month'].to_numpy().astype(np.int64) - 1, 12,
+                  lambda codes: (codes + 1).astype(np.int8)),
+        'dayofweek': (bike['dayofweek'].to_numpy().astype(np.int64), 7,
+                      lambda codes: codes.astype(np.int8)),
+        'hour': (bike['hour'].to_numpy().astype(np.int64), 24,
+                 lambda codes: codes.astype(np.int8)),
+    }
+    for name in ['season', 'weather']:
+        categories = bike[name].cat.categories
+        codes = bike[name].cat.codes.to_numpy().astype(np.int64)
+        # Unknown codes (NaN) get their own slot after the categories
+        codes[codes < 0] = len(categories)
+        dims[name] = (codes, len(categories) + 1, lambda codes, categories=categories: pd.Categorical.from_codes(
+            np.where(codes == len(categories), -1, codes), categories=categories))
+    for name in ['is_holiday', 'is_weekend']:
+        dims[name] = ((bike[name].to_numpy() == 1).astype(np.int64), 2,
+                      lambda codes: codes.astype(np.int8))
+    return dims
+
+
+@staged('build_cube')
+def build_cube(bike):
+    """Aggregate ``count`` over ``DIMENSIONS`` in a single pass over the rows.
+
+    Rows are counted per cell of the full key space only when it has no more
+    cells than there are rows; otherwise the occupied keys are numbered with
+    ``np.unique`` first, so memory follows the rows, not the product of the
+    dimension sizes.
+    """
+    dims = _dimension_codes(bike)
+    shape = tuple(dims[name][1] for name in DIMENSIONS)
+    key = np.ravel_multi_index([dims[name][0] for name in DIMENSIONS], shape)
+    values = bike['count'].to_numpy().astype(np.float64)
+    size = int(np.prod(shape))
+    if size <= len(key):
+        n = np.bincount(key, minlength=size)
+        cells = np.flatnonzero(n)
+        n = n[cells]
+        total = np.bincount(key, weights=values, minlength=size)[cells]
+        sumsq = np.bincount(key, weights=values * values, minlength=size)[cells]
+    else:
+        cells, key = np.unique(key, return_inverse=True)
+        n = np.bincount(key, minlength=len(cells))
+        total = np.bincount(key, weights=values, minlength=len(cells))
+        sumsq = np.bincount(key, weights=values * values, minlength=len(cells))
+    cube = {name: dims[name][2](codes) for name, codes in zip(DIMENSIONS, np.unravel_index(cells, shape))}
+    cube.update(n=n, sum=total, sumsq=sumsq)
+    return pd.DataFrame(cube)
+
+
+def merge_cubes(*cubes):
+    """Add cubes built from disjoint sets of rows into one cube."""
+    merged = pd.concat(cubes, ignore_index=True)
+    merged = merged.groupby(DIMENSIONS, observed=True, dropna=False, sort=True)[MEASURES].sum()
+    return merged.reset_index()
+
+
+def _group_codes(column):
+    """Integer codes and level labels of a cube column (missing labels get code -1)."""
+    if isinstance(column.dtype, pd.CategoricalDtype):
+        return column.cat.codes.to_numpy().astype(np.int64), column.cat.categories
+    levels, codes = np.unique(column.to_numpy(), return_inverse=True)
+    return codes.astype(np.int64), pd.Index(levels, name=column.name)
+
+
+def rollup(cube, by, **filters):
+    """Roll the cube up to ``by`` (a column or list), after keeping cells matching ``filters``.
+
+    Returns ``n``, ``sum``, ``sumsq``, ``mean`` and ``std`` (ddof=1) of ``count``
+    for each observed group, indexed by ``by`` in sorted order.
+    """
+    if filters:
+        keep = np.ones(len(cube), dtype=bool)
+        for name, value in filters.items():
+            keep &= cube[name].to_numpy() == value
+        cube = cube[keep]
+    names = [by] if isinstance(by, str) else list(by)
+    codes, levels = zip(*(_group_codes(cube[name]) for name in names))
+    return _rollup_codes(codes, levels, names, *(cube[name].to_numpy() for name in MEASURES))
+
+
+def _rollup_codes(codes, levels, names, n, total, sumsq):
+    """``rollup`` of cells given their group codes per name and their ``n``, ``sum`` and ``sumsq``."""
+    valid = np.logical_and.reduce([c >= 0 for c in codes])
+    shape = tuple(len(level) for level in levels)
+    key = np.ravel_multi_index([c[valid] for c in codes], shape)
+    size = int(np.prod(shape))
+    n = np.bincount(key, weights=n[valid], minlength=size)
+    cells = np.flatnonzero(n)
+    n = n[cells].astype(np.int64)
+    total = np.bincount(key, weights=total[valid], minlength=size)[cells]
+    sumsq = np.bincount(key, weights=sumsq[valid], minlength=size)[cells]
+    positions = np.unravel_index(cells, shape)
+    if len(names) == 1:
+        index = pd.Index(levels[0][positions[0]], name=names[0])
+    else:
+        index = pd.MultiIndex(levels=levels, codes=positions, names=names)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        variance = (sumsq - total ** 2 / n) / (n - 1)
+        std = np.sqrt(np.clip(variance, 0, None))
+        mean = total / n
+    return pd.DataFrame({'n': n, 'sum': total, 'sumsq': sumsq, 'mean': mean, 'std': std}, index=index)
+
+
+def cube_path(path, cache_dir=None):
+    """Where the cube built from the CSV ``path`` is saved."""
+    return cache_path(path, '.cube.npz', cache_dir)
+
+
+def save_cube(cube, target):
+    os.makedirs(os.path.dirname(os.path.abspath(target)), exist_ok=True)
+    np.savez(target, **frame_to_arrays(cube))
+
+
+def load_cube(target):
+    with np.load(target, allow_pickle=False) as arrays:
+        return arrays_to_frame(dict(arrays))
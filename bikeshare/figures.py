@@ -0,0 +1,374 @@
+"""The report's figures as named jobs, and a batch renderer for headless servers.
+
+Each job draws one figure of the report from a ``ReportData`` and returns it.
+``render_figures`` renders any set of jobs to PNG/SVG with the Agg backend
+across a process pool; every worker maps the prepared data from the column
+store (see ``bikeshare.colstore``), so the workers share one page-cached copy
+instead of each receiving a pickled frame or parsing its own.
+
+    python -m bikeshare.figures london_merged.csv --out figures --format png svg
+"""
+import argparse
+import io
+import math
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import matplotlib.pyplot as plt
+import seaborn as sns
+
+from .backends import BACKEND_ENV, BACKENDS, DEFAULT_BACKEND
+from .cache import ResultCache, artifact_key
+from .cube import rollup
+from .colstore import open_bike_store
+from .correlation import group_corr
+from .instrument import stage, staged
+from .load import CACHE_DIR, data_version
+from .plots import barplot_ci, pointplot_ci, regplot_binned
+from .report import ReportData, build_tables
+from .stats import HEATMAP_COLUMNS
+
+# Font sizes set in In[49], used by every figure of the report
+REPORT_RC = {
+    'font.size': 14,
+    'axes.labelsize': 14,
+    'axes.titlesize': 15,
+    'legend.fontsize': 14,
+    'xtick.labelsize': 10,
+    'ytick.labelsize': 10,
+}
+# In[40] heatmap styling, shared by the per-period heatmaps
+HEATMAP_STYLE = {'annot': True, 'cmap': 'Spectral', 'linewidths': .5}
+HISTOGRAM_COLUMNS = ['count', 'temp_real_C', 'temp_feels_like_C', 'humidity_percent', 'wind_speed_kph']
+
+FIGURES = {}
+# ReportData options each figure job depends on (part of its cache key)
+FIGURE_OPTIONS = {}
+
+
+def figure_job(name, options=()):
+    """Register the decorated function as the figure job ``name``, reading ``options``."""
+    def register(draw):
+        FIGURES[name] = draw
+        FIGURE_OPTIONS[name] = tuple(options)
+        return draw
+    return register
+
+
+def draw(name, data):
+    """Draw the figure job ``name`` with the report font sizes and return the figure."""
+    with stage(f'figure:{name}'), plt.rc_context(REPORT_RC):
+        return FIGURES[name](data)
+
+
+@figure_job('histograms')
+def histograms(data):
+    # In[49]
+    fig = plt.figure(figsize=(20, 15))
+    for i, column in enumerate(HISTOGRAM_COLUMNS, 1):
+        plt.subplot(3, 2, i)
+        sns.histplot(data=data.bike, x=column, bins=20, color='orange', edgecolor='black', linewidth=3)
+        plt.xlabel(column)
+        plt.ylabel('Frequency')
+        plt.title(f'Histogram of {column}')
+    plt.tight_layout()
+    return fig
+
+
+@figure_job('heatmap')
+def heatmap(data):
+    # In[40]
+    corr_matrix = data.stats.corr().loc[HEATMAP_COLUMNS, HEATMAP_COLUMNS]
+    fig = plt.figure(figsize=(10, 6))
+    sns.heatmap(corr_matrix, **HEATMAP_STYLE)
+    plt.title('Correlation Heatmap')
+    plt.xticks(rotation=45)
+    return fig
+
+
+def heatmap_series(corr, ncols=2, title='Correlation Heatmap', **kwargs):
+    """One In[40]-style heatmap per group of a ``group_corr`` or ``rolling_corr`` frame."""
+    keys = corr.index.droplevel(-1).unique()
+    nrows = math.ceil(len(keys) / ncols)
+    fig, axes = plt.subplots(nrows, ncols, figsize=(10 * ncols, 6 * nrows), squeeze=False)
+    for ax, key in zip(axes.flat, keys):
+        sns.heatmap(corr.loc[key], ax=ax, **{**HEATMAP_STYLE, **kwargs})
+        ax.set_title(f'{title}: {key}')
+        ax.tick_params(axis='x', rotation=45)
+    for ax in axes.flat[len(keys):]:
+        ax.axis('off')
+    fig.tight_layout()
+    return fig
+
+
+@figure_job('heatmap_by_season')
+def heatmap_by_season(data):
+    # In[40], one heatmap per season on a common colour scale
+    return heatmap_series(group_corr(data.bike, 'season', HEATMAP_COLUMNS), fmt='.2f', vmin=-1, vmax=1)
+
+
+@figure_job('by_year')
+def by_year(data):
+    # In[20]
+    fig = plt.figure(figsize=(10, 6))
+    sns.barplot(x='year', y='sum', data=rollup(data.cube, 'year').reset_index(), errorbar=None)
+    plt.title('Bike Shares by Year')
+    plt.xlabel('Year')
+    plt.ylabel('Count of Bike Shares')
+    plt.xticks(rotation=45)
+    return fig
+
+
+@figure_job('by_hour')
+def by_hour(data):
+    # In[38]
+    fig = plt.figure(figsize=(10, 6))
+    totals = rollup(data.cube, 'hour').reset_index()
+    sns.barplot(x='hour', y='sum', data=totals, errorbar=None)
+    sns.lineplot(x='hour', y='sum', data=totals, marker='x', linestyle='-', color='black')
+    plt.title('Total Bike Shares by Hour')
+    plt.xlabel('Hour')
+    plt.ylabel('Total No. of Bike Shares')
+    plt.xticks(rotation=45)
+    return fig
+
+
+@figure_job('by_dayofweek')
+def by_dayofweek(data):
+    # In[22]
+    fig = plt.figure(figsize=(10, 6))
+    totals = rollup(data.cube, 'dayofweek').reset_index()
+    sns.barplot(x='dayofweek', y='sum', data=totals, errorbar=None, color='orange')
+    sns.lineplot(x='dayofweek', y='sum', data=totals, color='black')
+    plt.title('Total Bike Rentals by Day of Week')
+    plt.xlabel('Day of Week')
+    plt.ylabel('Total No. of Bike Rentals')
+    plt.xticks(rotation=45)
+    return fig
+
+
+@figure_job('weekend_pie')
+def weekend_pie(data):
+    # In[23]
+    fig = plt.figure(dpi=150)
+    rollup(data.cube, 'is_weekend')['n'].plot(kind='pie', autopct='%1.1f%%')
+    plt.ylabel('')
+    plt.title('Weekend vs. Weekday Bike Shares')
+    return fig
+
+
+@figure_job('hour_points', options=['ci_method'])
+def hour_points(data):
+    # In[25]
+    fig, axs = plt.subplots(nrows=4, ncols=1, figsize=(12, 10), dpi=100)
+    for ax, hue in zip(axs, [None, 'is_holiday', 'is_weekend', 'season']):
+        by = ['hour'] if hue is None else ['hour', hue]
+        pointplot_ci(data.ci(by), x='hour', hue=hue, ax=ax)
+    plt.tight_layout()
+    return fig
+
+
+@figure_job('by_weather')
+def by_weather(data):
+    # In[26]
+    fig = plt.figure(figsize=(10, 6))
+    sns.barplot(x='weather', y='sum', data=rollup(data.cube, 'weather').reset_index(), errorbar=None)
+    plt.title('Bike Shares by Weather Condition')
+    plt.xlabel('Weather Condition')
+    plt.ylabel('Count of Bike Shares')
+    plt.xticks(rotation=45)
+    return fig
+
+
+@figure_job('by_season', options=['ci_method'])
+def by_season(data):
+    # In[27]
+    fig = plt.figure(figsize=(10, 6))
+    barplot_ci(data.ci('season'), x='season')
+    plt.title('Bike Shares by Season')
+    plt.xlabel('Season')
+    plt.ylabel('Count of Bike Shares')
+    plt.xticks(rotation=45)
+    return fig
+
+
+def _relationship(data, x, title, xlabel):
+    # In[28]-In[31]
+    fig = plt.figure(figsize=(10, 6))
+    if data.relationship_mode == 'binned':
+        regplot_binned(data.bike, x=x, y='count', line_kws={'color': 'red'})
+    else:
+        sns.regplot(x=x, y='count', data=data.bike, scatter_kws={'alpha': 0.1}, line_kws={'color': 'red'})
+    plt.title(title)
+    plt.xlabel(xlabel)
+    plt.ylabel('Count of Bike Shares')
+    return fig
+
+
+@figure_job('temp_real', options=['relationship_mode'])
+def temp_real(data):
+    return _relationship(data, 'temp_real_C', 'Temperature vs. Bike Shares', 'Real Temperature (°C)')
+
+
+@figure_job('temp_feels_like', options=['relationship_mode'])
+def temp_feels_like(data):
+    return _relationship(data, 'temp_feels_like_C', 'Feels like Temp vs. Bike Shares', 'Feels like Temperature (°C)')
+
+
+@figure_job('humidity', options=['relationship_mode'])
+def humidity(data):
+    return _relationship(data, 'humidity_percent', 'Humidity vs. Bike Shares', 'Humidity')
+
+
+@figure_job('wind_speed', options=['relationship_mode'])
+def wind_speed(data):
+    return _relationship(data, 'wind_speed_kph', 'Wind Speed vs. Bike Shares', 'Wind Speed (°C)')
+
+
+@figure_job('dayofweek_points', options=['ci_method'])
+def dayofweek_points(data):
+    # In[32]
+    fig, axs = plt.subplots(nrows=2, ncols=1, figsize=(12, 6), dpi=100)
+    for ax, hue in zip(axs, [None, 'season']):
+        by = ['dayofweek'] if hue is None else ['dayofweek', hue]
+        pointplot_ci(data.ci(by), x='dayofweek', hue=hue, ax=ax)
+    plt.tight_layout()
+    return fig
+
+
+@figure_job('season_weather')
+def season_weather(data):
+    # In[33]
+    grid = sns.catplot(data=rollup(data.cube, ['season', 'weather']).reset_index(), x='weather', y='n',
+                       col='season', kind='bar', height=7, aspect=1.5, col_wrap=2)
+    return grid.figure
+
+
+# Per-process state of the render workers
+_worker_data = None
+
+
+def _init_worker(path, cache_dir, options):
+    global _worker_data
+    plt.switch_backend('Agg')
+    bike = open_bike_store(path, cache_dir, backend=options.get('backend')).to_frame()
+    _worker_data = ReportData(path, cache_dir, bike=bike, **options)
+
+
+def _render(name, outdir, formats):
+    start = time.perf_counter()
+    with stage(f'render:{name}'):
+        fig = draw(name, _worker_data)
+        files = []
+        for fmt in formats:
+            target = os.path.join(outdir, f'{name}.{fmt}')
+            fig.savefig(target, format=fmt)
+            files.append(target)
+        plt.close(fig)
+    return files, time.perf_counter() - start
+
+
+def _render_bytes(name, fmt):
+    # Used by bikeshare.service: the figure as encoded bytes instead of a file
+    with stage(f'render:{name}'):
+        fig = draw(name, _worker_data)
+        buffer = io.BytesIO()
+        fig.savefig(buffer, format=fmt)
+        plt.close(fig)
+    return buffer.getvalue()
+
+
+def _figure_key(version, name, fmt, options):
+    params = {option: options.get(option) for option in FIGURE_OPTIONS[name]}
+    return artifact_key(version, name, {'format': fmt, **params}, FIGURES[name])
+
+
+@staged('render_figures')
+def render_figures(path='london_merged.csv', outdir='figures', names=None, formats=('png',),
+                   workers=None, cache_dir=None, cache=None, **options):
+    """Render figure jobs to ``outdir`` in parallel; returns ``{name: (files, seconds)}``.
+
+    ``names`` defaults to every job in ``FIGURES``; ``options`` are passed to
+    ``ReportData`` (``ci_method``, ``relationship_mode``, ``backend``). With a ``ResultCache``
+    figures already rendered from the same data, options and job code are
+    copied from the cache and only the others go to the process pool.
+    """
+    names = list(FIGURES) if names is None else list(names)
+    unknown = set(names) - set(FIGURES)
+    if unknown:
+        raise ValueError(f'unknown figures: {sorted(unknown)}')
+    os.makedirs(outdir, exist_ok=True)
+    # Build the snapshot and column store once here so the workers only map it
+    open_bike_store(path, cache_dir, backend=options.get('backend'))
+    results = {}
+    pending = names
+    if cache is not None:
+        version = data_version(path, cache_dir)
+        pending = []
+        for name in names:
+            start = time.perf_counter()
+            cached = [cache.lookup(_figure_key(version, name, fmt, options), name) for fmt in formats]
+            if any(data is None for data in cached):
+                pending.append(name)
+                continue
+            files = []
+            for fmt, data in zip(formats, cached):
+                target = os.path.join(outdir, f'{name}.{fmt}')
+                with open(target, 'wb') as f:
+                    f.write(data)
+                files.append(target)
+            results[name] = (files, time.perf_counter() - start)
+    if pending:
+        workers = workers or min(len(pending), os.cpu_count() or 1)
+        with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(path, cache_dir, options)) as pool:
+            futures = {pool.submit(_render, name, outdir, tuple(formats)): name for name in pending}
+            for future in as_completed(futures):
+                results[futures[future]] = future.result()
+    if cache is not None:
+        for name in pending:
+            for fmt, target in zip(formats, results[name][0]):
+                with open(target, 'rb') as f:
+                    cache.put_bytes(_figure_key(version, name, fmt, options), f.read(), name)
+        cache.flush()
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Render the report tables and figures headlessly.')
+    parser.add_argument('path', nargs='?', default='london_merged.csv')
+    parser.add_argument('--out', default='figures')
+    parser.add_argument('--figure', action='append', dest='names', choices=sorted(FIGURES),
+                        help='figure to render (repeatable, default: all)')
+    parser.add_argument('--format', nargs='+', default=['png'], choices=['png', 'svg', 'pdf'])
+    parser.add_argument('--workers', type=int)
+    parser.add_argument('--ci-method', default='t', choices=['t', 'normal', 'bootstrap'])
+    parser.add_argument('--relationship-mode', default='binned', choices=['binned', 'scatter'])
+    parser.add_argument('--backend', choices=sorted(BACKENDS),
+                        help=f'load/prepare backend (default: ${BACKEND_ENV} or {DEFAULT_BACKEND})')
+    parser.add_argument('--results-cache', help=f'result cache directory (default: {CACHE_DIR}/results next to the CSV)')
+    parser.add_argument('--cache-size', type=float, default=512, help='result cache budget in MB')
+    parser.add_argument('--no-cache', action='store_true', help='recompute every table and figure')
+    args = parser.parse_args(argv)
+    start = time.perf_counter()
+    options = {'ci_method': args.ci_method, 'relationship_mode': args.relationship_mode, 'backend': args.backend}
+    cache = None
+    if not args.no_cache:
+        directory = args.results_cache or os.path.join(
+            os.path.dirname(os.path.abspath(args.path)), CACHE_DIR, 'results')
+        cache = ResultCache(directory, int(args.cache_size * 1024 * 1024))
+    tables = build_tables(ReportData(args.path, **options), cache=cache,
+                          version=data_version(args.path) if cache else None)
+    os.makedirs(os.path.join(args.out, 'tables'), exist_ok=True)
+    for name, table in tables.items():
+        table.to_csv(os.path.join(args.out, 'tables', f'{name}.csv'))
+    results = render_figures(args.path, args.out, args.names, args.format, args.workers, cache=cache, **options)
+    for name, (files, seconds) in sorted(results.items(), key=lambda item: -item[1][1]):
+        print(f'{name:20s} {seconds:6.2f} s  {" ".join(files)}')
+    print(f'{"total":20s} {time.perf_counter() - start:6.2f} s')
+    if cache is not None:
+        print(cache.summary())
+
+
+if __name__ == '__main__':
+    main()
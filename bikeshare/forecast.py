@@ -0,0 +1,246 @@
+"""Hourly demand forecasts: ridge regression on calendar, weather and flag features.
+
+The model predicts ``count`` from one-hot encodings of hour, dayofweek,
+season, weather and the holiday/weekend flags, the one-hot interactions in
+``INTERACTIONS`` (the weekday/weekend and seasonal shapes of the daily
+profile, In[25] and In[32]) and the standardized temperatures, humidity and
+wind speed.
+
+Training never builds the design matrix. Every row falls into one cell of
+``CELL_DIMENSIONS`` (26,880 cells), and the one-hot part of its features
+depends only on that cell, so one pass of ``np.bincount`` over the rows (as
+in ``build_cube``) gives everything the normal equations need: the rows,
+the sum of ``count`` and the sums of the measurements per cell, and the
+global cross products of the measurements. These statistics merge exactly,
+so ``partial_fit`` can train on chunks. The ridge system, with a few hundred
+unknowns, is then solved in closed form.
+
+For prediction, the intercept and one-hot weights are folded into one value
+per cell (``cell_bias``). A batch of hours therefore costs one
+``ravel_multi_index``, one gather and a four-column dot product, with no
+per-row Python.
+"""
+import numpy as np
+import pandas as pd
+
+from .instrument import staged
+from .prepare import SEASONS, WEATHER
+from .query import LRUCache
+
+# Dimensions the one-hot features are built from, with their number of levels
+# (season and weather have one more level for unknown codes, like the cube)
+CELL_DIMENSIONS = {'hour': 24, 'dayofweek': 7, 'season': len(SEASONS) + 1, 'weather': len(WEATHER) + 1,
+                   'is_holiday': 2, 'is_weekend': 2}
+CATEGORIES = {'season': list(SEASONS.values()), 'weather': list(WEATHER.values())}
+NUMERIC_FEATURES = ['temp_real_C', 'temp_feels_like_C', 'humidity_percent', 'wind_speed_kph']
+INTERACTIONS = (('hour', 'is_weekend'), ('hour', 'is_holiday'), ('hour', 'season'))
+MODEL_CACHE_SIZE = 8
+
+
+def _category_codes(values, name):
+    # Codes of season/weather labels, unknown labels and NaN in the extra last level
+    categories = CATEGORIES[name]
+    if isinstance(values, str):
+        return np.array([categories.index(values) if values in categories else len(categories)])
+    dtype = getattr(values, 'dtype', None)
+    if isinstance(dtype, pd.CategoricalDtype) and list(dtype.categories) == categories:
+        codes = np.asarray(values.cat.codes if isinstance(values, pd.Series) else values.codes, dtype=np.int64)
+    else:
+        codes = pd.Categorical(np.atleast_1d(values), categories=categories).codes.astype(np.int64)
+    return np.where(codes < 0, len(categories), codes)
+
+
+def cell_keys(hours):
+    """Cell number of each hour in ``hours`` (a frame or a dict of arrays or scalars)."""
+    coords = []
+    for name, levels in CELL_DIMENSIONS.items():
+        values = hours[name]
+        if name in CATEGORIES:
+            codes = _category_codes(values, name)
+        elif name.startswith('is_'):
+            codes = (np.atleast_1d(np.asarray(values)) == 1).astype(np.int64)
+        else:
+            codes = np.atleast_1d(np.asarray(values)).astype(np.int64)
+            if codes.size and (codes.min() < 0 or codes.max() >= levels):
+                raise ValueError(f'{name} must be in 0..{levels - 1}')
+        coords.append(codes)
+    coords = np.broadcast_arrays(*coords)
+    return np.ravel_multi_index(coords, tuple(CELL_DIMENSIONS.values()))
+
+
+def _numeric(hours, n=None):
+    columns = [np.atleast_1d(np.asarray(hours[name], dtype=np.float64)) for name in NUMERIC_FEATURES]
+    if n is not None:
+        columns = [np.broadcast_to(c, (n,)) for c in columns]
+    return np.column_stack(columns)
+
+
+def _blocks(interactions):
+    # One-hot blocks: the single dimensions, then the interactions
+    return [(name,) for name in CELL_DIMENSIONS] + [tuple(block) for block in interactions]
+
+
+def cell_design(interactions=INTERACTIONS):
+    """0/1 matrix (cells x one-hot features) and the feature names."""
+    shape = tuple(CELL_DIMENSIONS.values())
+    coords = dict(zip(CELL_DIMENSIONS, np.unravel_index(np.arange(int(np.prod(shape))), shape)))
+    columns, names = [], []
+    for block in _blocks(interactions):
+        levels = tuple(CELL_DIMENSIONS[name] for name in block)
+        index = np.ravel_multi_index([coords[name] for name in block], levels)
+        onehot = np.zeros((len(index), int(np.prod(levels))))
+        onehot[np.arange(len(index)), index] = 1
+        columns.append(onehot)
+        names += [':'.join(f'{name}={level}' for name, level in zip(block, values))
+                  for values in zip(*np.unravel_index(np.arange(onehot.shape[1]), levels))]
+    return np.hstack(columns), names
+
+
+class DemandModel:
+    """Ridge regression of ``count``, fitted from mergeable per-cell statistics.
+
+    ``alpha`` is the ridge penalty on the one-hot and standardized numeric
+    weights (not on the intercept); ``clip`` floors predictions at zero.
+    """
+
+    def __init__(self, alpha=1.0, interactions=INTERACTIONS, clip=True):
+        self.alpha = alpha
+        self.interactions = tuple(tuple(block) for block in interactions)
+        self.clip = clip
+        self.reset()
+
+    def reset(self):
+        size = int(np.prod(tuple(CELL_DIMENSIONS.values())))
+        k = len(NUMERIC_FEATURES)
+        self.n = np.zeros(size)
+        self.sum_y = np.zeros(size)
+        self.sum_x = np.zeros((size, k))
+        self.xx = np.zeros((k, k))
+        self.xy = np.zeros(k)
+        self.yy = 0.0
+        self.cell_bias = None
+        return self
+
+    @staged('forecast_stats')
+    def partial_fit(self, bike):
+        """Add the rows of a prepared frame to the training statistics (rows with NaN are skipped)."""
+        x = _numeric(bike)
+        y = np.asarray(bike['count'], dtype=np.float64)
+        keep = ~(np.isnan(x).any(axis=1) | np.isnan(y))
+        keys = cell_keys(bike)
+        if not keep.all():
+            x, y, keys = x[keep], y[keep], keys[keep]
+        size = len(self.n)
+        self.n += np.bincount(keys, minlength=size)
+        self.sum_y += np.bincount(keys, y, minlength=size)
+        for j in range(x.shape[1]):
+            self.sum_x[:, j] += np.bincount(keys, x[:, j], minlength=size)
+        self.xx += x.T @ x
+        self.xy += x.T @ y
+        self.yy += float(y @ y)
+        self.cell_bias = None
+        return self
+
+    def merge(self, other):
+        """Add the training statistics of another model (same interactions)."""
+        self.n += other.n
+        self.sum_y += other.sum_y
+        self.sum_x += other.sum_x
+        self.xx += other.xx
+        self.xy += other.xy
+        self.yy += other.yy
+        self.cell_bias = None
+        return self
+
+    def fit(self, bike):
+        return self.reset().partial_fit(bike).solve()
+
+    @staged('forecast_solve')
+    def solve(self):
+        """Solve the ridge normal equations from the accumulated statistics."""
+        total = self.n.sum()
+        if not total:
+            raise ValueError('no training rows')
+        design, self.feature_names = cell_design(self.interactions)
+        cells = np.flatnonzero(self.n)
+        c, n = design[cells], self.n[cells]
+        self.mean = self.sum_x.sum(axis=0) / total
+        self.scale = np.sqrt(np.maximum(np.diag(self.xx) / total - self.mean ** 2, 0))
+        self.scale[self.scale == 0] = 1
+        # Normal equations in the raw features [1, one-hot, numeric] ...
+        p, k = c.shape[1], len(self.mean)
+        gram = np.empty((1 + p + k, 1 + p + k))
+        sum_cx = c.T @ self.sum_x[cells]
+        gram[0, 0] = total
+        gram[0, 1:p + 1] = gram[1:p + 1, 0] = n @ c
+        gram[0, p + 1:] = gram[p + 1:, 0] = self.sum_x.sum(axis=0)
+        gram[1:p + 1, 1:p + 1] = (c * n[:, None]).T @ c
+        gram[1:p + 1, p + 1:] = sum_cx
+        gram[p + 1:, 1:p + 1] = sum_cx.T
+        gram[p + 1:, p + 1:] = self.xx
+        rhs = np.concatenate([[self.sum_y.sum()], c.T @ self.sum_y[cells], self.xy])
+        # ... moved to the standardized numeric features z = M x
+        m = np.eye(1 + p + k)
+        m[p + 1:, p + 1:] = np.diag(1 / self.scale)
+        m[p + 1:, 0] = -self.mean / self.scale
+        gram_z, rhs_z = m @ gram @ m.T, m @ rhs
+        penalty = np.full(1 + p + k, float(self.alpha))
+        penalty[0] = 0
+        weights = np.linalg.solve(gram_z + np.diag(penalty), rhs_z)
+        self.intercept = weights[0]
+        self.onehot_weights = weights[1:p + 1]
+        self.numeric_weights = weights[p + 1:]
+        # Raw-scale form used by predict: bias per cell plus a dot product with the measurements
+        self.slopes = self.numeric_weights / self.scale
+        self.cell_bias = self.intercept - self.slopes @ self.mean + design @ self.onehot_weights
+        sse = self.yy - 2 * weights @ rhs_z + weights @ gram_z @ weights
+        self.rows = int(total)
+        self.train_rmse = float(np.sqrt(max(sse, 0) / total))
+        return self
+
+    def predict(self, hours):
+        """Predicted ``count`` of each hour in ``hours``, a frame or a dict of arrays or scalars.
+
+        Needs the ``CELL_DIMENSIONS`` and ``NUMERIC_FEATURES`` columns; season
+        and weather are labels (strings or categoricals). Hours with a missing
+        measurement get NaN.
+        """
+        if self.cell_bias is None:
+            raise ValueError('the model is not fitted; call fit() or solve()')
+        keys = cell_keys(hours)
+        predicted = self.cell_bias[keys] + _numeric(hours, len(keys)) @ self.slopes
+        return np.maximum(predicted, 0) if self.clip else predicted
+
+    def score(self, bike):
+        """RMSE, MAE and R^2 of the predictions of ``count`` on a prepared frame."""
+        y = np.asarray(bike['count'], dtype=np.float64)
+        predicted = self.predict(bike)
+        keep = ~(np.isnan(predicted) | np.isnan(y))
+        error = predicted[keep] - y[keep]
+        return {'rows': int(keep.sum()), 'rmse': float(np.sqrt(np.mean(error ** 2))),
+                'mae': float(np.mean(np.abs(error))),
+                'r2': float(1 - np.sum(error ** 2) / np.sum((y[keep] - y[keep].mean()) ** 2))}
+
+    def coefficients(self):
+        """The fitted weights as a Series (one-hot weights, then per standardized measurement)."""
+        names = ['intercept'] + self.feature_names + [f'{name} (std)' for name in NUMERIC_FEATURES]
+        return pd.Series(np.concatenate([[self.intercept], self.onehot_weights, self.numeric_weights]),
+                         index=names)
+
+
+_models = LRUCache(MODEL_CACHE_SIZE)
+
+
+def fitted_model(path='london_merged.csv', cache_dir=None, alpha=1.0, interactions=INTERACTIONS, clip=True):
+    """``DemandModel`` fitted on the prepared data of ``path``, kept in memory per data version."""
+    from .colstore import open_bike_store
+    from .load import data_version
+
+    store = open_bike_store(path, cache_dir)
+    key = (data_version(path, cache_dir), alpha, tuple(tuple(block) for block in interactions), clip)
+    model = _models.get(key)
+    if model is None:
+        model = DemandModel(alpha, interactions, clip).fit(store.to_frame(list(CELL_DIMENSIONS) + NUMERIC_FEATURES
+                                                                         + ['count']))
+        _models.put(key, model)
+    return model
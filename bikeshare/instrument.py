@@ -0,0 +1,320 @@
+"""Per-stage timing and memory instrumentation of the pipeline.
+
+Switched on by the environment, off (and close to free) otherwise:
+
+    BIKESHARE_PROFILE=trace.jsonl python "Project London Bike Share.py"
+    BIKESHARE_PROFILE=trace.jsonl BIKESHARE_PROFILE_MEMORY=1 python -m bikeshare figures
+    python -m bikeshare profile trace.jsonl --flame trace.folded --baseline baseline.jsonl
+
+The pipeline functions are wrapped with ``@staged(name)`` and code blocks
+with ``with stage(name):``. While profiling is off the wrapper is a single
+global lookup before the call. While it is on, every stage records its wall
+and CPU time, the rows it received and returned, the resident set size at
+its start and end and the process peak RSS; with ``BIKESHARE_PROFILE_MEMORY``
+also the peak of the memory allocated by Python during the stage
+(tracemalloc, which slows allocation-heavy code down two- to three-fold).
+
+Records are appended to the trace as JSON lines, one per stage, each time an
+outermost stage ends, so worker processes (which inherit the setting) write
+to the same file and nothing is lost when a process exits abruptly. Nested
+stages carry their ``path`` (outer;inner), which ``summarize`` turns into
+self times and ``folded`` into the folded-stack format read by flamegraph.pl
+and speedscope.
+"""
+import argparse
+import contextlib
+import functools
+import json
+import os
+import resource
+import sys
+import threading
+import time
+import tracemalloc
+
+PROFILE_ENV = 'BIKESHARE_PROFILE'
+MEMORY_ENV = 'BIKESHARE_PROFILE_MEMORY'
+_PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+_NULL_STAGE = contextlib.nullcontext()
+
+_tracer = None
+
+
+def _rss_bytes():
+    # Current resident set size; falls back to the peak where /proc is missing
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except OSError:
+        return _max_rss_bytes()
+
+
+def _max_rss_bytes():
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+
+def _count(value):
+    # Rows of a frame, series, array or categorical; None for anything else
+    shape = getattr(value, 'shape', None)
+    if shape:
+        return int(shape[0])
+    return None
+
+
+class _Stage:
+    __slots__ = ('tracer', 'name', 'rows_in', 'rows_out', 'path', 'start', 'cpu', 'rss', 'traced', 'peak')
+
+    def __init__(self, tracer, name, rows_in=None):
+        self.tracer = tracer
+        self.name = name
+        self.rows_in = rows_in
+        self.rows_out = None
+
+    def __enter__(self):
+        stack = self.tracer._stack()
+        self.path = f'{stack[-1].path};{self.name}' if stack else self.name
+        if self.tracer.memory:
+            traced, peak = tracemalloc.get_traced_memory()
+            if stack:
+                stack[-1].peak = max(stack[-1].peak, peak)
+            tracemalloc.reset_peak()
+            self.traced = traced
+            self.peak = traced
+        stack.append(self)
+        self.rss = _rss_bytes()
+        self.cpu = time.process_time()
+        self.start = time.perf_counter()
+        return self
+
+    def rows(self, rows_out):
+        """Record the number of rows the stage produced."""
+        self.rows_out = rows_out
+
+    def __exit__(self, exc_type, exc, tb):
+        wall = time.perf_counter() - self.start
+        cpu = time.process_time() - self.cpu
+        stack = self.tracer._stack()
+        stack.pop()
+        record = {
+            'name': self.name,
+            'path': self.path,
+            'pid': os.getpid(),
+            'thread': threading.get_ident(),
+            'depth': len(stack),
+            'start': self.start - self.tracer.origin,
+            'wall_seconds': wall,
+            'cpu_seconds': cpu,
+            'rows_in': self.rows_in,
+            'rows_out': self.rows_out,
+            'rss_start_bytes': self.rss,
+            'rss_end_bytes': _rss_bytes(),
+            'max_rss_bytes': _max_rss_bytes(),
+        }
+        if self.tracer.memory:
+            peak = max(self.peak, tracemalloc.get_traced_memory()[1])
+            record['peak_traced_bytes'] = peak - self.traced
+            if stack:
+                stack[-1].peak = max(stack[-1].peak, peak)
+        if exc_type is not None:
+            record['error'] = exc_type.__name__
+        self.tracer._record(record, outermost=not stack)
+        return False
+
+
+class Tracer:
+    """Collects stage records and appends them to ``path`` (JSON lines)."""
+
+    def __init__(self, path, memory=False):
+        self.path = path
+        self.memory = memory
+        self.records = []
+        self._reset()
+        if memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def _reset(self):
+        # Also run in forked children: they start with no open stages and their own buffer
+        self.origin = time.perf_counter()
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._pending = []
+
+    def _stack(self):
+        try:
+            return self._local.stack
+        except AttributeError:
+            self._local.stack = []
+            return self._local.stack
+
+    def _record(self, record, outermost):
+        with self._lock:
+            self.records.append(record)
+            self._pending.append(record)
+            if not outermost:
+                return
+            lines = ''.join(json.dumps(r) + '\n' for r in self._pending)
+            self._pending = []
+        if self.path:
+            with open(self.path, 'a') as f:
+                f.write(lines)
+
+
+def enable(path=None, memory=False):
+    """Start recording stages (to ``path`` as JSON lines, if given); returns the ``Tracer``."""
+    global _tracer
+    _tracer = Tracer(path, memory)
+    return _tracer
+
+
+def disable():
+    """Stop recording; returns the ``Tracer`` that was active, if any."""
+    global _tracer
+    tracer, _tracer = _tracer, None
+    if tracer is not None and tracer.memory:
+        tracemalloc.stop()
+    return tracer
+
+
+def enabled():
+    return _tracer is not None
+
+
+def stage(name, rows=None):
+    """Context manager timing the enclosed block as stage ``name``.
+
+    ``rows`` is the number of input rows; call ``.rows(n)`` on the value
+    bound by ``as`` to record the output rows. A no-op while profiling is off.
+    """
+    if _tracer is None:
+        return _NULL_STAGE
+    return _Stage(_tracer, name, rows)
+
+
+def staged(name):
+    """Decorator recording each call of the function as stage ``name``.
+
+    The input rows are those of the first argument and the output rows those
+    of the result, when they have a ``shape``.
+    """
+    def decorate(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if _tracer is None:
+                return function(*args, **kwargs)
+            with _Stage(_tracer, name, _count(args[0]) if args else None) as current:
+                result = function(*args, **kwargs)
+                current.rows_out = _count(result)
+            return result
+        return wrapper
+    return decorate
+
+
+def _after_fork():
+    if _tracer is not None:
+        _tracer._reset()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork)
+
+if os.environ.get(PROFILE_ENV):
+    enable(os.environ[PROFILE_ENV], memory=os.environ.get(MEMORY_ENV, '') not in ('', '0'))
+
+
+def read_trace(path):
+    """The records of a trace file."""
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def summarize(records):
+    """Per stage path: calls, total/self/CPU seconds, rows and peak memory, slowest self time first.
+
+    Self time is the wall time of a stage minus that of the stages directly
+    inside it (in the same process and thread).
+    """
+    stages = {}
+    children = {}
+    for r in records:
+        s = stages.setdefault(r['path'], {'path': r['path'], 'calls': 0, 'wall_seconds': 0.0, 'cpu_seconds': 0.0,
+                                          'rows_in': 0, 'max_rss_bytes': 0, 'peak_traced_bytes': None})
+        s['calls'] += 1
+        s['wall_seconds'] += r['wall_seconds']
+        s['cpu_seconds'] += r['cpu_seconds']
+        s['rows_in'] += r['rows_in'] or 0
+        s['max_rss_bytes'] = max(s['max_rss_bytes'], r['max_rss_bytes'])
+        if r.get('peak_traced_bytes') is not None:
+            s['peak_traced_bytes'] = max(s['peak_traced_bytes'] or 0, r['peak_traced_bytes'])
+        parent = r['path'].rpartition(';')[0]
+        if parent:
+            children[parent] = children.get(parent, 0.0) + r['wall_seconds']
+    for path, s in stages.items():
+        s['self_seconds'] = max(s['wall_seconds'] - children.get(path, 0.0), 0.0)
+        s['rows_per_second'] = s['rows_in'] / s['wall_seconds'] if s['rows_in'] and s['wall_seconds'] else None
+    return sorted(stages.values(), key=lambda s: -s['self_seconds'])
+
+
+def folded(records):
+    """Folded stacks ('outer;inner self-microseconds' lines) for flamegraph.pl or speedscope."""
+    return ''.join(f'{s["path"]} {round(s["self_seconds"] * 1e6)}\n' for s in summarize(records)
+                   if s['self_seconds'] > 0)
+
+
+def compare(records, baseline, tolerance=0.25, min_seconds=0.05):
+    """Stages whose total wall time grew by more than ``tolerance`` over ``baseline``.
+
+    Stages faster than ``min_seconds`` in both traces are ignored as noise.
+    Returns ``[(path, baseline_seconds, seconds)]``.
+    """
+    before = {s['path']: s['wall_seconds'] for s in summarize(baseline)}
+    regressions = []
+    for s in summarize(records):
+        old = before.get(s['path'])
+        if old is None or max(old, s['wall_seconds']) < min_seconds:
+            continue
+        if s['wall_seconds'] > old * (1 + tolerance):
+            regressions.append((s['path'], old, s['wall_seconds']))
+    return regressions
+
+
+def format_summary(stages, top=None):
+    lines = [f'{"self s":>9} {"total s":>9} {"cpu s":>9} {"calls":>6} {"rows/s":>11} {"peak MB":>8}  stage']
+    for s in stages[:top]:
+        peak = s['peak_traced_bytes']
+        lines.append(f'{s["self_seconds"]:9.3f} {s["wall_seconds"]:9.3f} {s["cpu_seconds"]:9.3f} {s["calls"]:6d} '
+                     f'{s["rows_per_second"] or 0:11.3g} {"" if peak is None else f"{peak / 1e6:8.1f}":>8}  '
+                     f'{s["path"]}')
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m bikeshare profile',
+                                     description=f'Summarize a trace written with {PROFILE_ENV}=<trace.jsonl>.')
+    parser.add_argument('trace')
+    parser.add_argument('--top', type=int, default=25, help='stages listed (slowest self time first)')
+    parser.add_argument('--flame', help='write folded stacks here (flamegraph.pl / speedscope input)')
+    parser.add_argument('--json', help='write the per-stage summary here as JSON')
+    parser.add_argument('--baseline', help='trace to compare with; exits 1 on regressions')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed relative slowdown')
+    parser.add_argument('--min-seconds', type=float, default=0.05, help='ignore stages faster than this')
+    args = parser.parse_args(argv)
+    records = read_trace(args.trace)
+    stages = summarize(records)
+    print(format_summary(stages, args.top))
+    if args.flame:
+        with open(args.flame, 'w') as f:
+            f.write(folded(records))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(stages, f, indent=1)
+    if args.baseline:
+        regressions = compare(records, read_trace(args.baseline), args.tolerance, args.min_seconds)
+        for path, old, new in regressions:
+            print(f'regression: {path} {old:.3f} s -> {new:.3f} s ({new / old - 1:+.0%})', file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,199 @@
+"""Building the hourly london_merged.csv table from raw TfL journey extracts.
+
+The journey extracts have one row per hire, e.g.
+
+    Rental Id,Duration,Bike Id,End Date,EndStation Id,EndStation Name,Start Date,StartStation Id,StartStation Name
+    40346508,180,12019,04/01/2015 00:03,374,"Waterloo Station 1, Waterloo",04/01/2015 00:00,154,"Waterloo Station 3, Waterloo"
+
+``cnt`` is the number of hires started in each hour. Only the start column is
+read, in chunks of ``chunksize`` rows (pyarrow's streaming CSV reader when it
+is installed, pandas otherwise), and only its hour prefix is parsed (one
+``strptime`` per distinct hour, not per journey), so a worker never holds more
+than one chunk plus the counts of the hours it has seen. Files are spread over
+a process pool and the partial counts merged as they arrive. The hourly
+weather, holiday and season fields are then joined with ``merge_asof``.
+
+    python -m bikeshare ingest journeys/*.csv --weather weather.csv --out merged.csv
+"""
+import csv as std_csv
+import importlib.util
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from .instrument import staged
+from .load import RAW_COLUMNS, RAW_DTYPES, TIMESTAMP_FORMAT
+from .prepare import MONTH_SEASON
+
+# Start time column and its format in the TfL extracts, old and new layouts
+START_COLUMNS = {
+    'Start Date': '%d/%m/%Y %H:%M',
+    'Start date': '%Y-%m-%d %H:%M',
+}
+WEATHER_COLUMNS = ['t1', 't2', 'hum', 'wind_speed', 'weather_code']
+# Approximate bytes per journey row, to turn ``chunksize`` into a pyarrow block size
+ROW_BYTES = 128
+
+
+def start_column(path):
+    """Name and format of the start time column of a journey extract."""
+    header = pd.read_csv(path, nrows=0).columns
+    for column, date_format in START_COLUMNS.items():
+        if column in header:
+            return column, date_format
+    raise ValueError(f'{path}: no start time column (expected one of {list(START_COLUMNS)})')
+
+
+def hour_prefix(date_format):
+    """Format of the leading part of ``date_format`` up to the hour, and its length."""
+    end = date_format.find('%H')
+    if end < 0:
+        raise ValueError(f'date format {date_format!r} has no %H')
+    prefix = date_format[:end + 2]
+    return prefix, len(datetime(2000, 1, 1).strftime(prefix))
+
+
+def merge_counts(*partials):
+    """Sum ``(hours, counts)`` pairs into one pair sorted by hour."""
+    hours = np.concatenate([h for h, _ in partials])
+    counts = np.concatenate([c for _, c in partials])
+    hours, inverse = np.unique(hours, return_inverse=True)
+    return hours, np.bincount(inverse, counts, len(hours)).astype(np.int64)
+
+
+def _line_blocks(path, block_bytes):
+    # The header's column names, then blocks of about ``block_bytes`` that end
+    # on a line break (the extracts have no line breaks inside quoted fields)
+    with open(path, 'rb') as f:
+        yield next(std_csv.reader([f.readline().decode()]))
+        while True:
+            block = f.read(block_bytes)
+            if not block:
+                return
+            yield block + f.readline()
+
+
+def _prefix_counts_arrow(path, column, width, chunksize):
+    # pyarrow's own streaming reader reads ahead without bound, so the blocks
+    # are cut here and parsed one at a time
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    from pyarrow import csv
+
+    blocks = _line_blocks(path, chunksize * ROW_BYTES)
+    read_options = csv.ReadOptions(column_names=next(blocks))
+    convert_options = csv.ConvertOptions(include_columns=[column], column_types={column: pa.string()})
+    for block in blocks:
+        starts = csv.read_csv(pa.py_buffer(block), read_options, convert_options=convert_options).column(0)
+        counts = pc.value_counts(pc.utf8_slice_codeunits(pc.drop_null(starts), 0, width))
+        yield counts.field('values').to_numpy(zero_copy_only=False), counts.field('counts').to_numpy()
+
+
+def _prefix_counts_pandas(path, column, width, chunksize):
+    with pd.read_csv(path, usecols=[column], dtype={column: str}, chunksize=chunksize) as reader:
+        for chunk in reader:
+            counts = chunk[column].dropna().str[:width].value_counts(sort=False)
+            yield counts.index.to_numpy(), counts.to_numpy()
+
+
+@staged('journey_hour_counts')
+def journey_hour_counts(path, chunksize=100_000, column=None, date_format=None, engine=None):
+    """Journeys started per hour in one extract, as ``(hours, counts)``.
+
+    ``hours`` are whole hours since the epoch (int64), sorted; ``column`` and
+    ``date_format`` default to what ``start_column`` finds in the header.
+    ``engine`` is 'pyarrow' or 'pandas' (default: pyarrow when installed).
+    """
+    if column is None:
+        column, date_format = start_column(path)
+    if engine is None:
+        engine = 'pyarrow' if importlib.util.find_spec('pyarrow') else 'pandas'
+    chunks = {'pyarrow': _prefix_counts_arrow, 'pandas': _prefix_counts_pandas}[engine]
+    prefix_format, width = hour_prefix(date_format)
+    total = (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64))
+    for prefixes, counts in chunks(path, column, width, chunksize):
+        hours = pd.to_datetime(prefixes, format=prefix_format).to_numpy()
+        total = merge_counts(total, (hours.astype('datetime64[h]').astype(np.int64), counts.astype(np.int64)))
+    return total
+
+
+@staged('hourly_counts')
+def hourly_counts(paths, workers=None, chunksize=100_000):
+    """Journeys started per hour over all ``paths``, as a frame with ``timestamp`` and ``cnt``.
+
+    With more than one worker the files are counted in a process pool; each
+    partial is merged as soon as it arrives.
+    """
+    paths = list(paths)
+    workers = min(workers or os.cpu_count() or 1, len(paths)) or 1
+    total = (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64))
+    if workers == 1:
+        for path in paths:
+            total = merge_counts(total, journey_hour_counts(path, chunksize))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(journey_hour_counts, path, chunksize) for path in paths]
+            for future in as_completed(futures):
+                total = merge_counts(total, future.result())
+    hours, counts = total
+    return pd.DataFrame({'timestamp': hours.astype('datetime64[h]').astype('datetime64[s]'), 'cnt': counts})
+
+
+def read_weather(path):
+    """Hourly weather table: a london_merged.csv style file, with or without ``cnt``."""
+    header = pd.read_csv(path, nrows=0).columns
+    columns = [c for c in RAW_COLUMNS if c in header and c != 'cnt']
+    missing = [c for c in ['timestamp'] + WEATHER_COLUMNS if c not in columns]
+    if missing:
+        raise ValueError(f'{path}: weather table lacks {missing}')
+    return pd.read_csv(path, usecols=columns, dtype={c: RAW_DTYPES[c] for c in columns if c != 'timestamp'},
+                       parse_dates=['timestamp'], date_format=TIMESTAMP_FORMAT)
+
+
+@staged('merge_hourly')
+def merge_hourly(counts, weather, tolerance='59min', holidays=(), zero_hours=False):
+    """Join the hourly ``weather`` fields onto ``counts``; returns the london_merged.csv columns.
+
+    Each hour takes the latest weather observation at or before it, no older
+    than ``tolerance`` (so an hourly table is never carried into the next
+    hour); hours without one are dropped, as in london_merged.csv.
+    ``is_holiday``, ``is_weekend`` and ``season`` come from ``weather`` when it
+    has them, otherwise from ``holidays`` (dates), the weekday and the month.
+    With ``zero_hours`` the hours without journeys between the first and last
+    hour with journeys are kept with ``cnt`` 0.
+    """
+    counts = counts.sort_values('timestamp', ignore_index=True)
+    if zero_hours and len(counts):
+        grid = pd.date_range(counts['timestamp'].iloc[0], counts['timestamp'].iloc[-1], freq='h', unit='s')
+        counts = (counts.set_index('timestamp').reindex(grid, fill_value=0)
+                  .rename_axis('timestamp').reset_index())
+    weather = weather.drop(columns=['cnt'], errors='ignore').sort_values('timestamp', ignore_index=True)
+    weather['timestamp'] = weather['timestamp'].astype(counts['timestamp'].dtype)
+    merged = pd.merge_asof(counts, weather, on='timestamp', direction='backward',
+                           tolerance=pd.Timedelta(tolerance))
+    merged = merged.dropna(subset=WEATHER_COLUMNS, ignore_index=True)
+    time = merged['timestamp'].to_numpy().astype('datetime64[h]')
+    days = time.astype('datetime64[D]')
+    if 'is_holiday' not in merged:
+        merged['is_holiday'] = np.isin(days, np.array(holidays, dtype='datetime64[D]'))
+    if 'is_weekend' not in merged:
+        merged['is_weekend'] = (days.astype(np.int64) + 3) % 7 >= 5
+    if 'season' not in merged:
+        merged['season'] = MONTH_SEASON[days.astype('datetime64[M]').astype(np.int64) % 12]
+    return merged[RAW_COLUMNS].astype(RAW_DTYPES)
+
+
+def ingest_journeys(paths, weather, workers=None, chunksize=100_000, **kwargs):
+    """Hourly london_merged.csv table from journey extracts and a weather table (path or frame)."""
+    if isinstance(weather, (str, os.PathLike)):
+        weather = read_weather(weather)
+    return merge_hourly(hourly_counts(paths, workers, chunksize), weather, **kwargs)
+
+
+def write_merged_csv(frame, path):
+    """Write ``frame`` in the london_merged.csv format."""
+    frame.to_csv(path, index=False, date_format=TIMESTAMP_FORMAT)
+    return path
@@ -0,0 +1,127 @@
+"""Loading london_merged.csv with explicit dtypes and a cached columnar snapshot."""
+import os
+
+import numpy as np
+import pandas as pd
+
+from .instrument import staged
+from .snapshot import (  # noqa: F401 (re-exported)
+    CACHE_DIR, SNAPSHOT_VERSION, cache_path, data_version, file_digest, file_fingerprint,
+    read_snapshot_arrays, snapshot_path, write_snapshot_arrays,
+)
+
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# Explicit dtypes for the raw columns, so pandas does not have to infer them
+RAW_DTYPES = {
+    'cnt': 'int64',
+    't1': 'float64',
+    't2': 'float64',
+    'hum': 'float64',
+    'wind_speed': 'float64',
+    'weather_code': 'float64',
+    'is_holiday': 'float64',
+    'is_weekend': 'float64',
+    'season': 'float64',
+}
+RAW_COLUMNS = ['timestamp'] + list(RAW_DTYPES)
+
+def _read_csv(path, **kwargs):
+    return pd.read_csv(
+        path,
+        usecols=RAW_COLUMNS,
+        dtype=RAW_DTYPES,
+        parse_dates=['timestamp'],
+        date_format=TIMESTAMP_FORMAT,
+        **kwargs,
+    )
+
+
+@staged('read_csv')
+def read_bike_csv(path):
+    """Parse a london_merged.csv style file with fixed dtypes and timestamp format."""
+    return _read_csv(path)[RAW_COLUMNS]
+
+
+def iter_bike_csv(path, chunksize=100_000):
+    """Yield ``read_bike_csv`` frames of at most ``chunksize`` rows."""
+    with _read_csv(path, chunksize=chunksize) as reader:
+        for chunk in reader:
+            yield chunk[RAW_COLUMNS]
+
+
+def frame_to_arrays(frame):
+    """Split a frame into plain NumPy arrays that ``np.savez`` can store without pickling."""
+    arrays = {'__columns__': np.array(frame.columns, dtype=str)}
+    for name, column in frame.items():
+        if isinstance(column.dtype, pd.CategoricalDtype):
+            arrays[name] = column.cat.codes.to_numpy()
+            arrays['__categories__' + name] = np.array(column.cat.categories, dtype=str)
+        else:
+            arrays[name] = column.to_numpy()
+    return arrays
+
+
+def arrays_to_frame(arrays):
+    """Inverse of ``frame_to_arrays``."""
+    columns = {}
+    for name in arrays['__columns__']:
+        name = str(name)
+        values = arrays[name]
+        if '__categories__' + name in arrays:
+            categories = [str(c) for c in arrays['__categories__' + name]]
+            values = pd.Categorical.from_codes(values, categories=categories)
+        columns[name] = values
+    return pd.DataFrame(columns)
+
+
+def write_snapshot(frame, fingerprint, target):
+    """Store ``frame`` and the fingerprint of the CSV it came from."""
+    write_snapshot_arrays(frame_to_arrays(frame), fingerprint, target)
+
+
+@staged('read_snapshot')
+def read_snapshot(path, target):
+    """Return the snapshot frame if it still matches ``path``, else None."""
+    arrays = read_snapshot_arrays(path, target)
+    return None if arrays is None else arrays_to_frame(arrays)
+
+
+def quarantine_path(path, cache_dir=None):
+    """Where ``load_bike(..., validate='quarantine')`` writes the rows it leaves out."""
+    return cache_path(path, '.quarantine.csv', cache_dir)
+
+
+@staged('load_bike')
+def load_bike(path='london_merged.csv', cache_dir=None, use_cache=True, compact=False, validate=None, backend=None):
+    """Load the prepared bike frame, reusing the columnar snapshot when the CSV is unchanged.
+
+    ``compact=True`` returns (and caches) the downcast layout from ``compact_bike``.
+    Without a valid snapshot the CSV is parsed and prepared by ``backend``
+    (a name of ``bikeshare.backends``, by default from ``BIKESHARE_BACKEND``).
+    ``validate`` is a policy of ``bikeshare.validate`` ('strict', 'quarantine'
+    or 'drop') applied to the loaded rows; the snapshot always keeps every row.
+    The quarantine file (``quarantine_path``) holds the rows of the last
+    validated load that quarantined any, and is removed by one that did not.
+    """
+    target = snapshot_path(path, cache_dir, compact)
+    bike = read_snapshot(path, target) if use_cache else None
+    if bike is None:
+        fingerprint = file_fingerprint(path)
+        from .backends import get_backend
+
+        bike = get_backend(backend).load_prepared(path, compact)
+        if use_cache:
+            write_snapshot(bike, fingerprint, target)
+    if validate is not None:
+        from .validate import validate_bike
+
+        bike, report = validate_bike(bike, validate)
+        target = quarantine_path(path, cache_dir)
+        if report.quarantine is not None:
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            report.quarantine.to_csv(target, index_label='row', date_format=TIMESTAMP_FORMAT)
+        elif os.path.exists(target):
+            # Left by an earlier load of another version of the file; nothing is quarantined now
+            os.remove(target)
+    return bike
@@ -0,0 +1,218 @@
+"""Map-reduce of the report aggregates over many london_merged-schema files.
+
+Every file is one map task in a process pool: ``load_bike`` (so each file
+keeps its own snapshot), then the partial aggregates of the report:
+
+- the count cube (``build_cube``): rows, sum and sum of squares of ``count``
+  per cell, behind the group-by tables and charts,
+- ``StreamingStats`` over ``NUMERICAL_COLUMNS``: count, mean, co-moment
+  matrix, min and max, behind ``describe()`` and the correlations,
+- histograms of ``HISTOGRAM_EDGES`` (the In[49] columns on fixed edges, so
+  histograms of different files add up), with the rows below and above
+  the edges counted too.
+
+A worker only holds one file's frame at a time, so its memory is bounded by
+the largest file. Each partial is merged as soon as the files before it are,
+in the order the files were given, and then dropped, so the parent only holds
+the running ``Aggregates`` of each city (and the partials of files finishing
+early, until their turn). The cities are then merged into one for all files:
+row counts, cube counts, histograms and the sums of ``count`` add up exactly
+(integers in float64, while below 2**53), and means and co-moments merge
+with Chan's pairwise formulas, which are exact up to rounding. The
+quantiles in ``describe`` come from the merged random sample and stay
+approximate, as in ``bikeshare.stats``.
+
+    python -m bikeshare mapreduce london=london_merged.csv paris=paris/*.csv --workers 4 --out cities.json
+"""
+import argparse
+import glob
+import json
+import os
+import resource
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from .aggregate import GROUPS, _number
+from .backends import BACKEND_ENV, BACKENDS, DEFAULT_BACKEND
+from .cube import build_cube, merge_cubes, rollup
+from .instrument import staged
+from .load import load_bike
+from .stats import NUMERICAL_COLUMNS, StreamingStats
+
+# Fixed histogram edges of the In[49] columns (20 bins each, in prepared units)
+HISTOGRAM_EDGES = {
+    'count': np.linspace(0, 8000, 21),
+    'temp_real_C': np.linspace(-10, 40, 21),
+    'temp_feels_like_C': np.linspace(-15, 45, 21),
+    'humidity_percent': np.linspace(0, 1, 21),
+    'wind_speed_kph': np.linspace(0, 60, 21),
+}
+
+
+def histogram_counts(values, edges):
+    """Rows below ``edges``, in each bin (the last one closed, like ``np.histogram``) and above.
+
+    Missing values are not counted.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    values = values[~np.isnan(values)]
+    bins = np.searchsorted(edges, values, side='right')
+    bins[values == edges[-1]] = len(edges) - 1
+    return np.bincount(bins, minlength=len(edges) + 1)
+
+
+def _max_rss_bytes():
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+
+class Aggregates:
+    """Mergeable partial aggregates of one or more files."""
+
+    def __init__(self, files, rows, cube, stats, histograms):
+        self.files = list(files)
+        self.rows = rows
+        self.cube = cube
+        self.stats = stats
+        self.histograms = histograms
+
+    @classmethod
+    def from_frame(cls, bike, files=(), seed=None):
+        histograms = {name: histogram_counts(bike[name], edges) for name, edges in HISTOGRAM_EDGES.items()}
+        return cls(files, len(bike), build_cube(bike), StreamingStats(NUMERICAL_COLUMNS, seed=seed).update(bike),
+                   histograms)
+
+    def merge(self, other):
+        """Fold ``other`` (built from other rows) into these aggregates."""
+        self.files += other.files
+        self.rows += other.rows
+        self.cube = merge_cubes(self.cube, other.cube)
+        self.stats.merge(other.stats)
+        for name, counts in other.histograms.items():
+            self.histograms[name] = self.histograms[name] + counts
+        return self
+
+    def to_dict(self, groups=GROUPS):
+        """JSON-ready summary: rows, ``describe()``, correlations, group sums and histograms."""
+        index, rows = self.stats.describe_rows()
+        matrix = self.stats.corr_matrix()
+        columns = self.stats.columns
+        result = {
+            'files': self.files,
+            'rows': int(self.rows),
+            'describe': {column: {label: _number(rows[i, j]) for i, label in enumerate(index)}
+                         for j, column in enumerate(columns)},
+            'corr': {a: {b: _number(matrix[i, j]) for j, b in enumerate(columns)} for i, a in enumerate(columns)},
+            'groups': {},
+            'histograms': {},
+        }
+        for by in groups:
+            table = rollup(self.cube, by)
+            result['groups'][by] = {str(label): {'n': int(n), 'sum': _number(total), 'mean': _number(mean)}
+                                    for label, n, total, mean in zip(table.index, table['n'], table['sum'],
+                                                                     table['mean'])}
+        for name, counts in self.histograms.items():
+            result['histograms'][name] = {'edges': HISTOGRAM_EDGES[name].tolist(), 'below': int(counts[0]),
+                                          'counts': counts[1:-1].tolist(), 'above': int(counts[-1])}
+        return result
+
+
+def map_file(path, seed=None, **load_options):
+    """Map task: ``(Aggregates, timing)`` of one file, loaded with ``load_bike(path, **load_options)``."""
+    start = time.perf_counter()
+    bike = load_bike(path, **load_options)
+    aggregates = Aggregates.from_frame(bike, [path], seed)
+    del bike
+    return aggregates, {'path': path, 'rows': aggregates.rows, 'seconds': time.perf_counter() - start,
+                        'pid': os.getpid(), 'max_rss_bytes': _max_rss_bytes()}
+
+
+def _map_in_order(tasks, workers, load_options):
+    # ``map_file`` results in task order; each is dropped here once yielded, and a file finishing
+    # early is only held (in its future) until the files before it are merged
+    if workers == 1:
+        for seed, (_, path) in enumerate(tasks):
+            yield map_file(path, seed, **load_options)
+        return
+    # Largest files first, so one big file does not start last
+    order = sorted(range(len(tasks)), key=lambda i: -os.path.getsize(tasks[i][1]))
+    with ProcessPoolExecutor(workers) as pool:
+        futures = {i: pool.submit(map_file, tasks[i][1], i, **load_options) for i in order}
+        for i in range(len(tasks)):
+            yield futures.pop(i).result()
+
+
+@staged('map_reduce')
+def map_reduce(files, workers=None, **load_options):
+    """Aggregates of ``files`` (``{city: [paths]}``) per city and for all of them.
+
+    Returns ``(cities, combined, timings)``: ``{city: Aggregates}``, the
+    ``Aggregates`` of every file and one timing dict per file. ``workers``
+    defaults to one process per CPU; with 1 the files are mapped in this
+    process. ``load_options`` go to ``load_bike`` (``cache_dir``,
+    ``compact``, ``validate``, ``backend``, ...).
+    """
+    tasks = [(city, path) for city, paths in files.items() for path in paths]
+    if not tasks:
+        raise ValueError('no files to process')
+    workers = min(workers or os.cpu_count() or 1, len(tasks))
+    cities, combined, timings = {}, None, []
+    # Merged in the order the files were given, so the result does not depend on the scheduling
+    for (city, _), (partial, timing) in zip(tasks, _map_in_order(tasks, workers, load_options)):
+        timings.append({'city': city, **timing})
+        if city in cities:
+            cities[city].merge(partial)
+        else:
+            cities[city] = partial
+        del partial
+    for partial in cities.values():
+        copy = Aggregates(partial.files, partial.rows, partial.cube, StreamingStats(NUMERICAL_COLUMNS),
+                          dict(partial.histograms))
+        copy.stats.merge(partial.stats)
+        combined = copy if combined is None else combined.merge(copy)
+    return cities, combined, timings
+
+
+def parse_files(specs):
+    """``{city: [paths]}`` from ``city=pattern`` or ``pattern`` arguments (city: the file name stem)."""
+    files = {}
+    for spec in specs:
+        city, _, pattern = spec.partition('=') if '=' in spec else ('', '', spec)
+        paths = sorted(glob.glob(pattern)) or [pattern]
+        for path in paths:
+            name = city or os.path.splitext(os.path.basename(path))[0]
+            files.setdefault(name, []).append(path)
+    return files
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m bikeshare mapreduce',
+                                     description='Report aggregates of many files, per city and combined.')
+    parser.add_argument('files', nargs='+', help='[city=]path or glob (repeatable)')
+    parser.add_argument('--workers', type=int, default=None, help='processes (default: one per CPU)')
+    parser.add_argument('--cache-dir')
+    parser.add_argument('--compact', action='store_true', help='load with the compact dtypes')
+    parser.add_argument('--validate', choices=['strict', 'quarantine', 'drop'])
+    parser.add_argument('--backend', choices=sorted(BACKENDS),
+                        help=f'load/prepare backend (default: ${BACKEND_ENV} or {DEFAULT_BACKEND})')
+    parser.add_argument('--out', default='-', help='JSON output (default: stdout)')
+    parser.add_argument('--indent', type=int, default=None)
+    args = parser.parse_args(argv)
+    start = time.perf_counter()
+    cities, combined, timings = map_reduce(parse_files(args.files), args.workers, cache_dir=args.cache_dir,
+                                           compact=args.compact, validate=args.validate, backend=args.backend)
+    result = {'cities': {city: aggregates.to_dict() for city, aggregates in cities.items()},
+              'combined': combined.to_dict(), 'files': timings}
+    out = sys.stdout if args.out == '-' else open(args.out, 'w')
+    try:
+        json.dump(result, out, indent=args.indent)
+        out.write('\n')
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    print(f'mapreduce: {combined.rows:,d} rows from {len(timings)} files in {len(cities)} cities '
+          f'in {time.perf_counter() - start:.1f} s', file=sys.stderr)
+    return 0
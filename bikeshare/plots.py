@@ -0,0 +1,77 @@
+"""Drawing helpers for statistics computed outside seaborn."""
+import matplotlib.pyplot as plt
+import numpy as np
+
+
+def pointplot_ci(ci, x, hue=None, ax=None, capsize=0):
+    """Point plot of ``ci['mean']`` with ``lo``/``hi`` error bars, like ``sns.pointplot``.
+
+    ``ci`` is indexed by ``x`` (or by ``[x, hue]``), as returned by ``group_ci``.
+    """
+    if ax is None:
+        ax = plt.gca()
+    frame = ci.reset_index()
+    levels = list(dict.fromkeys(frame[x]))
+    position = {level: i for i, level in enumerate(levels)}
+    groups = [(None, frame)] if hue is None else frame.groupby(hue, observed=True, sort=False)
+    for label, group in groups:
+        xs = group[x].map(position).to_numpy()
+        mean = group['mean'].to_numpy()
+        yerr = [mean - group['lo'].to_numpy(), group['hi'].to_numpy() - mean]
+        ax.errorbar(xs, mean, yerr=yerr, marker='o', capsize=capsize,
+                    label=None if hue is None else str(label))
+    ax.set_xticks(range(len(levels)))
+    ax.set_xticklabels([str(level) for level in levels])
+    ax.set_xlabel(x)
+    ax.set_ylabel('count')
+    if hue is not None:
+        ax.legend(title=hue)
+    return ax
+
+
+def barplot_ci(ci, x, ax=None, **kwargs):
+    """Bar plot of ``ci['mean']`` with ``lo``/``hi`` error bars, like ``sns.barplot``."""
+    if ax is None:
+        ax = plt.gca()
+    frame = ci.reset_index()
+    mean = frame['mean'].to_numpy()
+    yerr = [mean - frame['lo'].to_numpy(), frame['hi'].to_numpy() - mean]
+    ax.bar([str(level) for level in frame[x]], mean, yerr=yerr, **kwargs)
+    ax.set_xlabel(x)
+    ax.set_ylabel('count')
+    return ax
+
+
+def regplot_binned(data, x, y='count', ax=None, bins=60, level=0.95, cmap='Blues',
+                   line_kws=None, report=True):
+    """Scalable replacement for ``sns.regplot``: density grid, least-squares line and band.
+
+    The points are binned into a ``bins`` x ``bins`` grid in one pass and the line
+    comes from ``LineFit``, so the cost of drawing does not grow with the rows.
+    With ``report`` the fit coefficients and the time spent are printed.
+    Returns the ``LineFit``.
+    """
+    import time
+
+    from .regression import LineFit, density_grid
+
+    if ax is None:
+        ax = plt.gca()
+    start = time.perf_counter()
+    xs = data[x].to_numpy(dtype='float64')
+    ys = data[y].to_numpy(dtype='float64')
+    counts, x_edges, y_edges = density_grid(xs, ys, bins)
+    fit = LineFit.from_arrays(xs, ys)
+    grid = np.linspace(x_edges[0], x_edges[-1], 100)
+    lo, hi = fit.band(grid, level)
+    elapsed = time.perf_counter() - start
+    ax.pcolormesh(x_edges, y_edges, np.ma.masked_equal(counts.T, 0), cmap=cmap, norm='log')
+    line_kws = {'color': 'red', **(line_kws or {})}
+    ax.plot(grid, fit.predict(grid), **line_kws)
+    ax.fill_between(grid, lo, hi, color=line_kws['color'], alpha=0.15)
+    ax.set_xlabel(x)
+    ax.set_ylabel(y)
+    if report:
+        print(f'{y} = {fit.intercept:.2f} + {fit.slope:.2f} * {x} '
+              f'(r = {fit.r:.3f}, n = {fit.n}, {elapsed * 1000:.1f} ms)')
+    return fit
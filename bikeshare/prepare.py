@@ -0,0 +1,135 @@
+"""Turning the raw london_merged.csv columns into the frame used by the report."""
+import numpy as np
+import pandas as pd
+
+from .instrument import staged
+
+# Renaming the columns (In[9])
+COLUMN_NAMES = {
+    'timestamp': 'time',
+    'cnt': 'count',
+    't1': 'temp_real_C',
+    't2': 'temp_feels_like_C',
+    'hum': 'humidity_percent',
+    'wind_speed': 'wind_speed_kph',
+    'weather_code': 'weather',
+    'is_holiday': 'is_holiday',
+    'is_weekend': 'is_weekend',
+    'season': 'season',
+}
+
+# Season and weather codes used by the dataset (In[11], In[12])
+SEASONS = {
+    0: 'spring',
+    1: 'summer',
+    2: 'autumn',
+    3: 'winter',
+}
+# Meteorological season code of each month (January first)
+MONTH_SEASON = np.array([3, 3, 0, 0, 0, 1, 1, 1, 2, 2, 2, 3])
+WEATHER = {
+    1: 'Clear',
+    2: 'Scattered clouds',
+    3: 'Broken clouds',
+    4: 'Cloudy',
+    7: 'Rain',
+    10: 'Rain with thunderstorm',
+    26: 'Snowfall',
+}
+
+CALENDAR_COLUMNS = ['year', 'month', 'dayofweek', 'hour']
+FLAG_COLUMNS = ['is_holiday', 'is_weekend']
+MEASUREMENT_COLUMNS = ['temp_real_C', 'temp_feels_like_C', 'humidity_percent', 'wind_speed_kph']
+
+# dtypes of the opt-in compact layout
+COMPACT_DTYPES = {
+    'count': 'int32',
+    'temp_real_C': 'float32',
+    'temp_feels_like_C': 'float32',
+    'humidity_percent': 'float32',
+    'wind_speed_kph': 'float32',
+    'is_holiday': 'int8',
+    'is_weekend': 'int8',
+    'year': 'int16',
+    'month': 'int8',
+    'dayofweek': 'int8',
+    'hour': 'int8',
+}
+
+
+def code_lookup(mapping):
+    """Array mapping a raw integer code to its position in ``mapping`` (-1 if unknown)."""
+    lookup = np.full(max(mapping) + 1, -1, dtype=np.int8)
+    lookup[list(mapping)] = np.arange(len(mapping), dtype=np.int8)
+    return lookup
+
+
+@staged('map_codes')
+def map_codes(values, mapping):
+    """Map float codes straight to a Categorical, without going through strings.
+
+    Codes that are not in ``mapping`` (or are not whole numbers) become NaN,
+    like the ``astype('str').map(...)`` cells did.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    lookup = code_lookup(mapping)
+    finite = np.isfinite(values)
+    ints = np.where(finite, values, -1).astype(np.int64)
+    valid = finite & (ints >= 0) & (ints < len(lookup)) & (ints == values)
+    codes = np.full(len(values), -1, dtype=np.int8)
+    codes[valid] = lookup[ints[valid]]
+    return pd.Categorical.from_codes(codes, categories=list(mapping.values()))
+
+
+@staged('calendar_parts')
+def calendar_parts(time):
+    """year, month, dayofweek and hour of each timestamp, in one integer pass.
+
+    Works on the epoch seconds directly instead of going through four ``.dt``
+    accessors; the date part uses the days-to-civil conversion from
+    http://howardhinnant.github.io/date_algorithms.html.
+    """
+    seconds = np.asarray(time, dtype='datetime64[s]').astype(np.int64)
+    hours = seconds // 3600
+    days = hours // 24
+    hour = hours - days * 24
+    # 1970-01-01 was a Thursday (dayofweek 3)
+    dayofweek = (days + 3) % 7
+    z = days + 719468
+    era = z // 146097
+    doe = z - era * 146097
+    yoe = (doe - doe // 1460 + doe // 36524 - doe // 146096) // 365
+    doy = doe - (365 * yoe + yoe // 4 - yoe // 100)
+    mp = (5 * doy + 2) // 153
+    month = np.where(mp < 10, mp + 3, mp - 9)
+    year = yoe + era * 400 + (month <= 2)
+    return {'year': year, 'month': month, 'dayofweek': dayofweek, 'hour': hour}
+
+
+def compact_bike(bike):
+    """Downcast a prepared frame: int8 flags and calendar parts, float32 measurements."""
+    dtypes = {name: dtype for name, dtype in COMPACT_DTYPES.items() if name in bike}
+    return bike.astype(dtypes)
+
+
+def bytes_per_row(frame):
+    """Memory used by ``frame`` divided by its number of rows."""
+    return frame.memory_usage(index=False, deep=True).sum() / max(len(frame), 1)
+
+
+@staged('prepare_bike')
+def prepare_bike(raw, compact=False):
+    """Apply the In[9]-In[15] transformations to a frame from ``read_bike_csv``.
+
+    With ``compact=True`` the result uses the smaller ``COMPACT_DTYPES`` layout.
+    """
+    bike = raw.rename(columns=COLUMN_NAMES)
+    # Converting humidity into a fraction
+    bike['humidity_percent'] = bike['humidity_percent'] / 100
+    bike['season'] = map_codes(bike['season'], SEASONS)
+    bike['weather'] = map_codes(bike['weather'], WEATHER)
+    for name, values in calendar_parts(bike['time']).items():
+        bike[name] = values
+    if compact:
+        bike = compact_bike(bike)
+    return bike
@@ -0,0 +1,175 @@
+"""Filter-and-group queries over the count cube, for dashboards.
+
+A query is a filter spec, ``{column: value or list of values}`` over the cube
+dimensions, and a group-by spec: e.g. the mean count by hour on summer
+weekends in clear weather, the kind of question In[25] and In[33] answer.
+``QueryIndex`` keeps one packed bitmap per dimension value over the cube
+cells, so a filter is a few bitwise ORs (values of one column) and ANDs
+(across columns) of precomputed bitmaps instead of comparisons over the data;
+the selected cells are then rolled up as ``rollup`` does. Answers are kept
+in a bounded LRU cache keyed on the data version and dropped when it changes.
+
+The index is built on the cube rolled up to ``QUERY_DIMENSIONS`` (no year;
+pass ``dimensions=DIMENSIONS`` to keep it): about 20x fewer cells than the
+full cube at 10^7 rows, which keeps an uncached query around a millisecond.
+"""
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from .cube import DIMENSIONS, MEASURES, _group_codes, _rollup_codes, build_cube
+from .prepare import SEASONS, WEATHER
+
+DEFAULT_CACHE_SIZE = 256
+# Cube dimensions the dashboard filters and groups on
+QUERY_DIMENSIONS = ['month', 'dayofweek', 'hour', 'season', 'weather', 'is_holiday', 'is_weekend']
+# Every value a filter may take, whether or not the data has it (any year)
+DIMENSION_VALUES = {
+    'month': range(1, 13),
+    'dayofweek': range(7),
+    'hour': range(24),
+    'season': list(SEASONS.values()),
+    'weather': list(WEATHER.values()),
+    'is_holiday': (0, 1),
+    'is_weekend': (0, 1),
+}
+
+
+class LRUCache:
+    """Mapping that keeps the ``maxsize`` most recently used entries."""
+
+    def __init__(self, maxsize=DEFAULT_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        try:
+            value = self._entries[key]
+        except KeyError:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        if self.maxsize <= 0:
+            return
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+
+
+def _freeze(value):
+    if isinstance(value, (list, tuple, set, frozenset, np.ndarray, pd.Index)):
+        return tuple(sorted({_freeze(v) for v in value}, key=repr))
+    return value.item() if isinstance(value, np.generic) else value
+
+
+def query_key(by, filters):
+    """Hashable, order-independent form of a query spec."""
+    by = (by,) if isinstance(by, str) else tuple(by)
+    return by, tuple(sorted((name, _freeze(value)) for name, value in filters.items()))
+
+
+class QueryIndex:
+    """Bitmap indexes over the cells of a cube, plus an LRU cache of answers.
+
+    ``version`` identifies the data the cube was built from (e.g. the result
+    of ``data_version``); ``refresh`` swaps in a new cube and empties the cache
+    when it changes. ``dimensions`` are the cube dimensions kept for queries.
+    """
+
+    def __init__(self, cube, version=None, cache_size=DEFAULT_CACHE_SIZE, dimensions=QUERY_DIMENSIONS):
+        self.dimensions = list(dimensions)
+        unknown = set(self.dimensions) - set(DIMENSIONS)
+        if unknown:
+            raise ValueError(f'not cube dimensions: {sorted(unknown)}')
+        self.cache = LRUCache(cache_size)
+        self._build(cube, version)
+
+    @classmethod
+    def from_bike(cls, bike, version=None, cache_size=DEFAULT_CACHE_SIZE, dimensions=QUERY_DIMENSIONS):
+        return cls(build_cube(bike), version, cache_size, dimensions)
+
+    def _build(self, cube, version):
+        if len(self.dimensions) < len(DIMENSIONS):
+            cube = (cube.groupby(self.dimensions, observed=True, dropna=False, sort=True)[MEASURES].sum()
+                    .reset_index())
+        self.cube = cube
+        self.version = version
+        self.cells = len(cube)
+        self.codes = {}
+        self.levels = {}
+        self.bitmaps = {}
+        for name in self.dimensions:
+            codes, levels = _group_codes(cube[name])
+            self.codes[name] = codes
+            self.levels[name] = levels
+            self.bitmaps[name] = {_freeze(label): np.packbits(codes == i) for i, label in enumerate(levels)}
+        self.measures = {name: cube[name].to_numpy(dtype=np.float64) for name in MEASURES}
+
+    def refresh(self, cube, version):
+        """Use ``cube`` from now on if ``version`` differs from the current one."""
+        if version != self.version:
+            self._build(cube, version)
+            self.cache.clear()
+
+    def select(self, filters):
+        """Packed bitmap of the cells matching ``filters`` (None for no filters: every cell).
+
+        Raises ValueError for a value outside ``DIMENSION_VALUES``; a valid
+        value the data does not have matches no cells.
+        """
+        selected = None
+        for name, value in filters.items():
+            if name not in self.bitmaps:
+                raise ValueError(f'cannot filter on {name!r}; choose from {self.dimensions}')
+            values = value if isinstance(value, (list, tuple, set, frozenset)) else [value]
+            allowed = DIMENSION_VALUES.get(name)
+            unknown = [v for v in values if allowed is not None and _freeze(v) not in allowed]
+            if unknown:
+                raise ValueError(f'unknown {name} {", ".join(map(repr, unknown))}; choose from {list(allowed)}')
+            column = np.zeros((self.cells + 7) // 8, dtype=np.uint8)
+            for v in values:
+                bitmap = self.bitmaps[name].get(_freeze(v))
+                if bitmap is not None:
+                    column = column | bitmap
+            selected = column if selected is None else selected & column
+        return selected
+
+    def query(self, by='hour', **filters):
+        """``n``, ``sum``, ``sumsq``, ``mean`` and ``std`` of ``count`` per group of ``by`` over the matching rows.
+
+        Filters are ``column=value`` or ``column=[values]`` on the cube
+        dimensions, e.g. ``query('hour', season='summer', is_weekend=1)``.
+        The result has the layout of ``rollup``; treat it as read-only, it
+        is shared with the cache.
+        """
+        key = query_key(by, filters)
+        result = self.cache.get(key)
+        if result is None:
+            result = self._compute(list(key[0]), filters)
+            self.cache.put(key, result)
+        return result
+
+    def _compute(self, names, filters):
+        for name in names:
+            if name not in self.codes:
+                raise ValueError(f'cannot group by {name!r}; choose from {self.dimensions}')
+        bitmap = self.select(filters)
+        cells = (np.flatnonzero(np.unpackbits(bitmap, count=self.cells)) if bitmap is not None
+                 else np.arange(self.cells))
+        codes = [self.codes[name][cells] for name in names]
+        levels = [self.levels[name] for name in names]
+        return _rollup_codes(codes, levels, names, *(self.measures[name][cells] for name in MEASURES))
@@ -0,0 +1,82 @@
+"""Closed-form least-squares line fits for the relationship plots (In[28]-In[31])."""
+import numpy as np
+
+from .ci import t_quantile
+
+
+class LineFit:
+    """Least-squares line ``y = intercept + slope * x`` from sufficient statistics.
+
+    Only ``n``, the means and the centred sums of squares and products are
+    kept, so fits over chunks can be merged with ``merge``.
+    """
+
+    def __init__(self, n=0, mean_x=0.0, mean_y=0.0, sxx=0.0, syy=0.0, sxy=0.0):
+        self.n = n
+        self.mean_x, self.mean_y = mean_x, mean_y
+        self.sxx, self.syy, self.sxy = sxx, syy, sxy
+
+    @classmethod
+    def from_arrays(cls, x, y):
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        keep = ~(np.isnan(x) | np.isnan(y))
+        x, y = x[keep], y[keep]
+        if not len(x):
+            return cls()
+        mean_x, mean_y = x.mean(), y.mean()
+        dx, dy = x - mean_x, y - mean_y
+        return cls(len(x), mean_x, mean_y, dx @ dx, dy @ dy, dx @ dy)
+
+    def merge(self, other):
+        if not other.n:
+            return self
+        n = self.n + other.n
+        factor = self.n * other.n / n
+        delta_x, delta_y = other.mean_x - self.mean_x, other.mean_y - self.mean_y
+        self.sxx += other.sxx + delta_x * delta_x * factor
+        self.syy += other.syy + delta_y * delta_y * factor
+        self.sxy += other.sxy + delta_x * delta_y * factor
+        self.mean_x += delta_x * other.n / n
+        self.mean_y += delta_y * other.n / n
+        self.n = n
+        return self
+
+    @property
+    def slope(self):
+        return self.sxy / self.sxx
+
+    @property
+    def intercept(self):
+        return self.mean_y - self.slope * self.mean_x
+
+    @property
+    def r(self):
+        return self.sxy / np.sqrt(self.sxx * self.syy)
+
+    @property
+    def residual_std(self):
+        return np.sqrt(max(self.syy - self.slope * self.sxy, 0) / (self.n - 2))
+
+    def predict(self, x):
+        return self.intercept + self.slope * np.asarray(x, dtype=np.float64)
+
+    def band(self, x, level=0.95):
+        """Lower and upper confidence limits of the fitted line at ``x``."""
+        x = np.asarray(x, dtype=np.float64)
+        critical = t_quantile((1 + level) / 2, self.n - 2)
+        half = critical * self.residual_std * np.sqrt(1 / self.n + (x - self.mean_x) ** 2 / self.sxx)
+        fitted = self.predict(x)
+        return fitted - half, fitted + half
+
+    def __repr__(self):
+        return (f'LineFit(n={self.n}, intercept={self.intercept:.4g}, '
+                f'slope={self.slope:.4g}, r={self.r:.3f})')
+
+
+def density_grid(x, y, bins=60):
+    """2-D histogram of the points: ``(counts, x_edges, y_edges)``."""
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    keep = ~(np.isnan(x) | np.isnan(y))
+    return np.histogram2d(x[keep], y[keep], bins=bins)
@@ -0,0 +1,86 @@
+"""Prepared report inputs and the summary tables computed from them."""
+from .ci import group_ci
+from .cube import build_cube, rollup
+from .instrument import stage
+from .load import load_bike
+from .stats import HEATMAP_COLUMNS, NUMERICAL_COLUMNS, StreamingStats
+
+
+class ReportData:
+    """Prepared inputs of the report tables and figure jobs, loaded once per process.
+
+    ``ci_method`` selects the intervals of the mean plots (see ``group_ci``) and
+    ``relationship_mode`` the In[28]-In[31] style ('binned' or 'scatter').
+    An already prepared frame can be passed as ``bike`` instead of loading ``path``
+    with ``backend`` (see ``load_bike``).
+    """
+
+    def __init__(self, path='london_merged.csv', cache_dir=None, ci_method='t', relationship_mode='binned',
+                 bike=None, backend=None):
+        self.path = path
+        self.bike = load_bike(path, cache_dir, backend=backend) if bike is None else bike
+        self.ci_method = ci_method
+        self.relationship_mode = relationship_mode
+        self._cube = None
+        self._stats = None
+
+    @property
+    def cube(self):
+        if self._cube is None:
+            self._cube = build_cube(self.bike)
+        return self._cube
+
+    @property
+    def stats(self):
+        if self._stats is None:
+            with stage('stats', len(self.bike)):
+                self._stats = StreamingStats(NUMERICAL_COLUMNS).update(self.bike)
+        return self._stats
+
+    def ci(self, by):
+        return group_ci(self.bike, by, method=self.ci_method, cube=self.cube)
+
+
+def describe_table(data, columns):
+    # In[17]
+    return data.bike[columns].describe()
+
+
+def corr_table(data, columns):
+    # In[18], In[40]
+    return data.stats.corr().loc[columns, columns]
+
+
+def group_table(data, by, estimator):
+    # In[20], In[22], In[26], In[27], In[38]
+    return rollup(data.cube, by)[['n', estimator]]
+
+
+# Summary tables of the report: name -> (function, parameters)
+TABLES = {
+    'describe': (describe_table, {'columns': NUMERICAL_COLUMNS}),
+    'corr': (corr_table, {'columns': HEATMAP_COLUMNS}),
+    'sum_by_year': (group_table, {'by': ['year'], 'estimator': 'sum'}),
+    'sum_by_hour': (group_table, {'by': ['hour'], 'estimator': 'sum'}),
+    'sum_by_dayofweek': (group_table, {'by': ['dayofweek'], 'estimator': 'sum'}),
+    'sum_by_weather': (group_table, {'by': ['weather'], 'estimator': 'sum'}),
+    'mean_by_season': (group_table, {'by': ['season'], 'estimator': 'mean'}),
+    'mean_by_hour_season': (group_table, {'by': ['hour', 'season'], 'estimator': 'mean'}),
+}
+
+
+def build_tables(data, names=None, cache=None, version=None):
+    """Compute the ``TABLES`` named in ``names`` (all by default) as ``{name: frame}``.
+
+    With a ``ResultCache`` and the ``version`` of the input data, tables
+    computed before with the same parameters and code are read from the cache.
+    """
+    tables = {}
+    for name in (TABLES if names is None else names):
+        function, params = TABLES[name]
+        with stage(f'table:{name}'):
+            if cache is None:
+                tables[name] = function(data, **params)
+            else:
+                tables[name] = cache.compute(version, name, function, params, args=(data,))
+    return tables
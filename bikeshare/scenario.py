@@ -0,0 +1,223 @@
+"""What-if scenarios for the recommendations: demand shifts, hourly load and fleet size.
+
+A scenario rescales the hourly ``count`` of the history with demand-shift
+rules and measures the load that results:
+
+- ``peak_shift``: the fraction of the ``count`` of the working-day peak
+  hours (``PEAK_HOURS``, the commute peaks of In[25]) moved to the
+  ``OFF_PEAK_HOURS`` of the same day, in proportion to their own load
+  (hourly pricing),
+- ``weather=<label>``: the relative change of demand in that weather, e.g.
+  ``weather=Clear: 0.1`` for a promotion adding 10% on clear hours (In[33]),
+- ``season=<label>``: the relative change of demand in that season.
+
+For each scenario ``Scenarios.evaluate`` reports the total hires, the peak
+hourly load, the fleet needed to serve ``service_level`` of the hours (also
+per season, for seasonal fleet sizing) and the peak and mean utilisation of
+that fleet. ``trips_per_bike`` is the number of hires one bike can start in
+an hour.
+
+Every rule is a per-hour factor, so a block of scenarios is evaluated as a
+few (scenarios x hours) array operations: gathers of the weather and season
+factors, ``np.add.reduceat`` over the days for the shifted load, and
+``np.partition`` for the fleet quantiles. Blocks are sized by ``block_cells``
+and can be spread over a process pool; the workers memory-map the per-hour
+arrays from a temporary directory instead of receiving a pickled copy each.
+"""
+import itertools
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from .instrument import staged
+from .prepare import SEASONS, WEATHER
+
+PEAK_HOURS = (7, 8, 9, 16, 17, 18, 19)
+OFF_PEAK_HOURS = (10, 11, 12, 13, 14, 15)
+RULES = {'weather': list(WEATHER.values()), 'season': list(SEASONS.values())}
+# Scenario-by-hour cells evaluated at once (64 MiB per float64 temporary)
+BLOCK_CELLS = 1 << 23
+
+
+def scenario_grid(peak_shift=(0.0,), weather=None, season=None):
+    """Every combination of the given rule values, one scenario per row.
+
+    ``weather`` and ``season`` map a label to the relative changes to try,
+    e.g. ``scenario_grid([0, 0.1, 0.2], weather={'Clear': [0, 0.05, 0.1]})``.
+    """
+    axes = {'peak_shift': list(np.atleast_1d(peak_shift))}
+    for rule, changes in (('weather', weather), ('season', season)):
+        for label, values in (changes or {}).items():
+            axes[f'{rule}={label}'] = list(np.atleast_1d(values))
+    return pd.DataFrame(list(itertools.product(*axes.values())), columns=list(axes), dtype=np.float64)
+
+
+def _codes(values, categories):
+    # Category positions, with unknown labels and NaN in the extra last level
+    codes = np.asarray(pd.Categorical(np.asarray(values, dtype=object), categories=categories).codes,
+                       dtype=np.int64)
+    return np.where(codes < 0, len(categories), codes)
+
+
+class Scenarios:
+    """The hourly history of a prepared frame, ready to evaluate scenario grids on."""
+
+    # Per-hour arrays (one entry per row of the history or of its peak hours), mapped by the workers
+    ARRAYS = ('count', 'factor_codes', 'season_codes', 'hour', 'peak', 'off_peak', 'peak_day', 'off_peak_day',
+              'peak_days', 'peak_starts', 'off_peak_days', 'off_peak_starts')
+    SETTINGS = ('days', 'hour_counts', 'trips_per_bike', 'service_level', 'block_cells', 'baseline_fleet')
+
+    def __init__(self, bike, peak_hours=PEAK_HOURS, off_peak_hours=OFF_PEAK_HOURS, trips_per_bike=1.0,
+                 service_level=0.99, block_cells=BLOCK_CELLS):
+        if not 0 < service_level <= 1:
+            raise ValueError('service_level must be in (0, 1]')
+        bike = bike.sort_values('time') if not bike['time'].is_monotonic_increasing else bike
+        self.count = bike['count'].to_numpy(dtype=np.float64)
+        codes = {rule: _codes(bike[rule], categories) for rule, categories in RULES.items()}
+        self.factor_codes = codes['weather'] * (len(RULES['season']) + 1) + codes['season']
+        self.season_codes = codes['season']
+        self.hour = hour = bike['hour'].to_numpy(dtype=np.intp)
+        self.hour_counts = np.bincount(hour, minlength=24)
+        working = (bike['is_weekend'].to_numpy() != 1) & (bike['is_holiday'].to_numpy() != 1)
+        day = bike['time'].to_numpy().astype('datetime64[D]')
+        day = np.cumsum(np.r_[True, day[1:] != day[:-1]]) - 1
+        self.days = int(day[-1]) + 1 if len(day) else 0
+        # Peak and off-peak hours as column indices, their days, and where each day starts among them
+        self.peak = np.flatnonzero(working & np.isin(hour, peak_hours))
+        self.off_peak = np.flatnonzero(working & np.isin(hour, off_peak_hours))
+        self.peak_day, self.off_peak_day = day[self.peak], day[self.off_peak]
+        self.peak_days, self.peak_starts = np.unique(self.peak_day, return_index=True)
+        self.off_peak_days, self.off_peak_starts = np.unique(self.off_peak_day, return_index=True)
+        self.trips_per_bike = trips_per_bike
+        self.service_level = service_level
+        self.block_cells = block_cells
+        self.baseline_fleet = self.fleet(self.count[None, :])[0]
+
+    @classmethod
+    def _open(cls, directory, settings):
+        # A copy whose per-hour arrays are memory-mapped from ``directory`` (see ``_save``)
+        scenarios = cls.__new__(cls)
+        for name in cls.ARRAYS:
+            setattr(scenarios, name, np.load(os.path.join(directory, name + '.npy'), mmap_mode='r'))
+        for name, value in settings.items():
+            setattr(scenarios, name, value)
+        return scenarios
+
+    def _save(self, directory):
+        for name in self.ARRAYS:
+            np.save(os.path.join(directory, name + '.npy'), getattr(self, name))
+        return {name: getattr(self, name) for name in self.SETTINGS}
+
+    def fleet(self, load, hours=None):
+        """Bikes needed to serve ``service_level`` of the hours of each row of ``load``."""
+        load = load if hours is None else load[:, hours]
+        k = min(int(np.ceil(self.service_level * load.shape[1])), load.shape[1]) - 1
+        return np.ceil(np.partition(load, k, axis=1)[:, k] / self.trips_per_bike)
+
+    def _factors(self, grid, rule):
+        # (scenarios x levels + 1) demand factors of one rule, 1 for labels without a column
+        categories = RULES[rule]
+        factors = np.ones((len(grid), len(categories) + 1))
+        for column in grid.columns:
+            if column.startswith(rule + '='):
+                label = column.split('=', 1)[1]
+                if label not in categories:
+                    raise ValueError(f'unknown {rule} {label!r}; expected one of {categories}')
+                factors[:, categories.index(label)] = 1 + grid[column].to_numpy(dtype=np.float64)
+        return factors
+
+    def load(self, grid):
+        """Hourly load under each scenario of ``grid``: an array of scenarios x hours."""
+        unknown = [c for c in grid.columns if c != 'peak_shift' and c.split('=', 1)[0] not in RULES]
+        if unknown:
+            raise ValueError(f'unknown scenario columns: {unknown}')
+        shift = grid['peak_shift'].to_numpy(dtype=np.float64) if 'peak_shift' in grid else np.zeros(len(grid))
+        if np.any((shift < 0) | (shift > 1)):
+            raise ValueError('peak_shift must be in [0, 1]')
+        # One gather of the combined weather and season factor of each hour
+        weather, season = self._factors(grid, 'weather'), self._factors(grid, 'season')
+        if np.any(weather < 0) or np.any(season < 0):
+            raise ValueError('demand changes must be at least -1')
+        factors = (weather[:, :, None] * season[:, None, :]).reshape(len(grid), -1)
+        load = self.count[None, :] * factors[:, self.factor_codes]
+        if shift.any() and len(self.peak) and len(self.off_peak):
+            # Load moved out of each day's peak hours and the off-peak load it is spread over
+            peak = load[:, self.peak]
+            off_peak = load[:, self.off_peak]
+            moved = np.zeros((len(grid), self.days))
+            spread = np.zeros((len(grid), self.days))
+            moved[:, self.peak_days] = np.add.reduceat(peak, self.peak_starts, axis=1) * shift[:, None]
+            spread[:, self.off_peak_days] = np.add.reduceat(off_peak, self.off_peak_starts, axis=1)
+            # Days without off-peak load keep their peak load
+            receives = spread > 0
+            with np.errstate(invalid='ignore', divide='ignore'):
+                gain = np.where(receives, moved / spread, 0)
+            load[:, self.peak] = peak * (1 - shift[:, None] * receives)[:, self.peak_day]
+            load[:, self.off_peak] = off_peak * (1 + gain[:, self.off_peak_day])
+        return load
+
+    def _evaluate_block(self, grid, hourly=False):
+        load = self.load(grid)
+        peak_load = load.max(axis=1)
+        fleet = self.fleet(load)
+        result = {
+            'total': load.sum(axis=1),
+            'peak_load': peak_load,
+            'peak_utilisation': peak_load / (self.baseline_fleet * self.trips_per_bike),
+            'fleet': fleet,
+            'mean_utilisation': load.mean(axis=1) / (fleet * self.trips_per_bike),
+        }
+        for code, label in enumerate(RULES['season']):
+            hours = self.season_codes == code
+            if hours.any():
+                result[f'fleet_{label}'] = self.fleet(load, hours)
+        if not hourly:
+            return result, None
+        profile = np.array([np.bincount(self.hour, weights=row, minlength=24) for row in load])
+        return result, profile / np.maximum(self.hour_counts, 1)
+
+    def _blocks(self, grid):
+        rows = max(1, self.block_cells // max(len(self.count), 1))
+        return [grid.iloc[start:start + rows] for start in range(0, len(grid), rows)]
+
+    @staged('scenarios')
+    def evaluate(self, grid, workers=1, hourly=False):
+        """Metrics of every scenario of ``grid`` (see ``scenario_grid``), one row each.
+
+        With ``hourly=True`` the columns ``load_h00`` ... ``load_h23`` hold the
+        mean load of each hour of the day. ``workers`` > 1 (or None for one
+        per CPU) evaluates the blocks of the grid in a process pool.
+        """
+        blocks = self._blocks(grid.reset_index(drop=True))
+        workers = min(workers or os.cpu_count() or 1, len(blocks)) or 1
+        if workers == 1:
+            parts = [self._evaluate_block(block, hourly) for block in blocks]
+        else:
+            with tempfile.TemporaryDirectory(prefix='bikeshare-scenarios-') as directory:
+                settings = self._save(directory)
+                with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(directory, settings)) as pool:
+                    parts = list(pool.map(_evaluate_block, blocks, [hourly] * len(blocks)))
+        frame = grid.reset_index(drop=True).copy()
+        for name in parts[0][0] if parts else ():
+            frame[name] = np.concatenate([part[0][name] for part in parts])
+        if hourly and parts:
+            profile = np.vstack([part[1] for part in parts])
+            for hour in range(profile.shape[1]):
+                frame[f'load_h{hour:02d}'] = profile[:, hour]
+        return frame
+
+
+# Per-process view of the history, mapped once per worker
+_worker_scenarios = None
+
+
+def _init_worker(directory, settings):
+    global _worker_scenarios
+    _worker_scenarios = Scenarios._open(directory, settings)
+
+
+def _evaluate_block(grid, hourly):
+    return _worker_scenarios._evaluate_block(grid, hourly)
@@ -0,0 +1,336 @@
+"""Local HTTP service for the report's tables, queries and figures (asyncio, standard library only).
+
+    python -m bikeshare serve london_merged.csv --port 8000 --workers 2
+
+    GET /                         the endpoints below
+    GET /tables                   names of the report tables (``report.TABLES``)
+    GET /tables/<name>            one table as JSON (pandas 'split' layout)
+    GET /query?by=hour&season=summer&is_weekend=1
+                                  ``QueryIndex.query`` as JSON (repeat a filter for several values)
+    GET /figures                  names of the figure jobs (``figures.FIGURES``)
+    GET /figures/<name>.png       one figure, also .svg
+
+The prepared data is mapped from the column store once and the CSV is checked
+for changes at most every ``check_interval`` seconds. A ``ServiceState`` holds
+one version of everything answers depend on (version, data, query index,
+cached answers, render workers); a new one is built in a thread when the CSV
+changes and swapped in with one assignment on the event loop, so a request
+sees either the old version or the new one, and renders already queued on
+the old workers finish before they exit. Every answer carries an ETag
+made of the data version and the request target, so a client sending it back
+in ``If-None-Match`` gets a 304 without anything being recomputed. Figures are
+rendered in a process pool and tables computed in a thread, so the event loop
+only parses requests and writes answers; concurrent requests for a figure
+that is being rendered wait for the same render.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import parse_qsl, urlsplit
+
+from .backends import BACKEND_ENV, BACKENDS, DEFAULT_BACKEND
+from .colstore import open_bike_store
+from .figures import FIGURES, _init_worker, _render_bytes
+from .load import data_version
+from .query import LRUCache, QueryIndex
+from .report import TABLES, ReportData, build_tables
+from .snapshot import file_digest
+
+RESPONSE_CACHE_SIZE = 512
+FIGURE_TYPES = {'png': 'image/png', 'svg': 'image/svg+xml'}
+JSON_TYPE = 'application/json'
+REASONS = {200: 'OK', 304: 'Not Modified', 400: 'Bad Request', 404: 'Not Found',
+           405: 'Method Not Allowed', 500: 'Internal Server Error'}
+MAX_HEADER_BYTES = 16 * 1024
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def _json(payload):
+    return json.dumps(payload, separators=(',', ':')).encode()
+
+
+def _frame_json(frame, **fields):
+    # pandas 'split' layout: {"columns": [...], "index": [...], "data": [[...], ...]}
+    payload = json.loads(frame.to_json(orient='split', date_format='iso'))
+    return _json({**fields, **payload})
+
+
+def _query_value(text):
+    # Query string values are text; the numeric cube dimensions hold integers
+    return int(text) if text.lstrip('-').isdigit() else text
+
+
+def etag_matches(header, etag):
+    """Whether an ``If-None-Match`` header value matches ``etag``."""
+    if header is None:
+        return False
+    tags = [tag.strip() for tag in header.split(',')]
+    return '*' in tags or etag in tags or 'W/' + etag in tags
+
+
+class ServiceState:
+    """One version of the served data; never changed once built, replaced whole on a reload."""
+
+    __slots__ = ('source', 'version', 'data', 'queries', 'responses', 'pool')
+
+    def __init__(self, source, version, data, queries, pool):
+        self.source = source
+        self.version = version
+        self.data = data
+        self.queries = queries
+        self.responses = LRUCache(RESPONSE_CACHE_SIZE)
+        self.pool = pool
+
+    @classmethod
+    def load(cls, path, cache_dir=None, workers=1, options=None):
+        """Map the prepared data of ``path`` and start ``workers`` render processes on it."""
+        options = options or {}
+        store = open_bike_store(path, cache_dir, backend=options.get('backend'))
+        bike = store.to_frame()
+        version = data_version(path, cache_dir)
+        pool = ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(path, cache_dir, options))
+        return cls(dict(store.schema['source']), version, ReportData(path, cache_dir, bike=bike, **options),
+                   QueryIndex.from_bike(bike, version), pool)
+
+
+class ReportService:
+    """Answers requests from one process-wide copy of the prepared data.
+
+    ``options`` are passed to ``ReportData`` (``ci_method``,
+    ``relationship_mode``, ``backend``) and so to the render workers; ``workers`` is the
+    size of the render pool.
+    """
+
+    def __init__(self, path='london_merged.csv', cache_dir=None, workers=None, check_interval=1.0, **options):
+        self.path = path
+        self.cache_dir = cache_dir
+        self.workers = workers or min(4, os.cpu_count() or 1)
+        self.check_interval = check_interval
+        self.options = options
+        self.state = ServiceState.load(path, cache_dir, self.workers, options)
+        # Size, mtime and digest of the CSV last seen; the mtime follows touches that kept the content
+        self.source = dict(self.state.source)
+        self._renders = {}
+        self._checked = 0.0
+        self._reload = None
+
+    @property
+    def version(self):
+        return self.state.version
+
+    def close(self):
+        self.state.pool.shutdown(wait=False, cancel_futures=True)
+
+    def _refresh(self, source):
+        # In a thread: ``(source, state)``, ``state`` None when only the mtime of the CSV changed
+        st = os.stat(self.path)
+        if st.st_size == source['size'] and file_digest(self.path) == source['digest']:
+            return {**source, 'mtime': st.st_mtime_ns}, None
+        state = ServiceState.load(self.path, self.cache_dir, self.workers, self.options)
+        return state.source, state
+
+    async def _reload_state(self):
+        source, state = await asyncio.get_running_loop().run_in_executor(None, self._refresh, self.source)
+        self.source = source
+        if state is not None:
+            old, self.state = self.state, state
+            # Renders already queued finish on the old workers, which then exit
+            old.pool.shutdown(wait=False)
+
+    async def _check_version(self):
+        now = time.monotonic()
+        if self._reload is None and now - self._checked < self.check_interval:
+            return
+        self._checked = now
+        if self._reload is None:
+            st = os.stat(self.path)
+            if st.st_size == self.source['size'] and st.st_mtime_ns == self.source['mtime']:
+                return
+            self._reload = asyncio.ensure_future(self._reload_state())
+        # Requests arriving during a reload wait for it, then see the new version
+        reload = self._reload
+        try:
+            await asyncio.shield(reload)
+        finally:
+            if self._reload is reload and reload.done():
+                self._reload = None
+
+    def etag(self, target, state=None):
+        version = (state or self.state).version
+        digest = hashlib.blake2b(f'{version}\0{target}'.encode(), digest_size=12).hexdigest()
+        return f'"{digest}"'
+
+    async def respond(self, method, target, headers):
+        """``(status, content_type, body, etag)`` of a request."""
+        if method not in ('GET', 'HEAD'):
+            raise HTTPError(405, f'{method} not allowed')
+        await self._check_version()
+        # One state for the whole request, whatever is swapped in meanwhile
+        state = self.state
+        etag = self.etag(target, state)
+        if etag_matches(headers.get('if-none-match'), etag):
+            return 304, None, b'', etag
+        cached = state.responses.get(etag)
+        if cached is None:
+            cached = await self._answer(state, target)
+            state.responses.put(etag, cached)
+        return 200, cached[0], cached[1], etag
+
+    async def _answer(self, state, target):
+        url = urlsplit(target)
+        parts = [part for part in url.path.split('/') if part]
+        loop = asyncio.get_running_loop()
+        if not parts:
+            return JSON_TYPE, _json({'version': state.version, 'tables': '/tables', 'query': '/query',
+                                     'figures': '/figures', 'query_dimensions': state.queries.dimensions})
+        if parts == ['tables']:
+            return JSON_TYPE, _json(sorted(TABLES))
+        if parts[0] == 'tables' and len(parts) == 2:
+            name = parts[1]
+            if name not in TABLES:
+                raise HTTPError(404, f'unknown table {name!r}')
+            return JSON_TYPE, await loop.run_in_executor(None, self._table, state, name)
+        if parts == ['query']:
+            by, filters = [], {}
+            for key, value in parse_qsl(url.query):
+                if key == 'by':
+                    by.append(value)
+                else:
+                    filters.setdefault(key, []).append(_query_value(value))
+            filters = {key: values[0] if len(values) == 1 else values for key, values in filters.items()}
+            try:
+                result = state.queries.query(by or 'hour', **filters)
+            except ValueError as e:
+                raise HTTPError(400, str(e))
+            return JSON_TYPE, _frame_json(result, version=state.version)
+        if parts == ['figures']:
+            return JSON_TYPE, _json(sorted(FIGURES))
+        if parts[0] == 'figures' and len(parts) == 2:
+            name, _, fmt = parts[1].rpartition('.')
+            if name not in FIGURES or fmt not in FIGURE_TYPES:
+                raise HTTPError(404, f'unknown figure {parts[1]!r}')
+            return FIGURE_TYPES[fmt], await self._render(state, name, fmt)
+        raise HTTPError(404, f'no such resource {url.path!r}')
+
+    def _table(self, state, name):
+        table = build_tables(state.data, [name])[name]
+        return _frame_json(table, name=name, version=state.version)
+
+    async def _render(self, state, name, fmt):
+        key = (state.version, name, fmt)
+        future = self._renders.get(key)
+        if future is None:
+            future = asyncio.get_running_loop().run_in_executor(state.pool, _render_bytes, name, fmt)
+            self._renders[key] = future
+            future.add_done_callback(lambda _: self._renders.pop(key, None))
+        return await asyncio.shield(future)
+
+    async def handle(self, reader, writer):
+        """Serve the requests of one connection (HTTP/1.1 keep-alive, no request bodies)."""
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b'\r\n\r\n')
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+                    break
+                lines = head.decode('latin-1').split('\r\n')
+                try:
+                    method, target, protocol = lines[0].split(' ')
+                except ValueError:
+                    writer.write(_response(400, JSON_TYPE, _json({'error': 'malformed request line'}),
+                                           keep_alive=False))
+                    break
+                headers = {}
+                for line in lines[1:]:
+                    name, _, value = line.partition(':')
+                    if name:
+                        headers[name.strip().lower()] = value.strip()
+                length = headers.get('content-length') or '0'
+                if not length.isdigit():
+                    # The body cannot be skipped without its length, so the connection ends here
+                    writer.write(_response(400, JSON_TYPE, _json({'error': f'bad Content-Length {length!r}'}),
+                                           keep_alive=False))
+                    break
+                if int(length):
+                    await reader.readexactly(int(length))
+                connection = headers.get('connection', '').lower()
+                keep_alive = connection == 'keep-alive' or (protocol == 'HTTP/1.1' and connection != 'close')
+                try:
+                    status, content_type, body, etag = await self.respond(method, target, headers)
+                except HTTPError as e:
+                    status, content_type, body, etag = e.status, JSON_TYPE, _json({'error': str(e)}), None
+                except Exception as e:
+                    print(f'{method} {target}: {e!r}', file=sys.stderr)
+                    status, content_type, body, etag = 500, JSON_TYPE, _json({'error': repr(e)}), None
+                writer.write(_response(status, content_type, body, etag, keep_alive, send_body=method != 'HEAD'))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+
+def _response(status, content_type, body, etag=None, keep_alive=True, send_body=True):
+    lines = [f'HTTP/1.1 {status} {REASONS[status]}']
+    if content_type:
+        lines.append(f'Content-Type: {content_type}')
+    if etag:
+        lines.append(f'ETag: {etag}')
+        lines.append('Cache-Control: no-cache')
+    lines.append(f'Content-Length: {len(body)}')
+    lines.append('Connection: ' + ('keep-alive' if keep_alive else 'close'))
+    head = ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1')
+    return head + body if send_body else head
+
+
+async def serve(service, host='127.0.0.1', port=8000):
+    """Serve ``service`` until cancelled; the bound address is printed to stderr."""
+    server = await asyncio.start_server(service.handle, host, port, limit=MAX_HEADER_BYTES)
+    host, port = server.sockets[0].getsockname()[:2]
+    print(f'serving {service.path} (version {service.version[:12]}) on http://{host}:{port}',
+          file=sys.stderr, flush=True)
+    async with server:
+        await server.serve_forever()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m bikeshare serve',
+                                     description='Serve the report tables, queries and figures over HTTP.')
+    parser.add_argument('path', nargs='?', default='london_merged.csv')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000, help='0 picks a free port')
+    parser.add_argument('--workers', type=int, help='render processes (default: up to 4)')
+    parser.add_argument('--cache-dir')
+    parser.add_argument('--check-interval', type=float, default=1.0,
+                        help='seconds between checks of the CSV for changes')
+    parser.add_argument('--ci-method', default='t', choices=['t', 'normal', 'bootstrap'])
+    parser.add_argument('--relationship-mode', default='binned', choices=['binned', 'scatter'])
+    parser.add_argument('--backend', choices=sorted(BACKENDS),
+                        help=f'load/prepare backend (default: ${BACKEND_ENV} or {DEFAULT_BACKEND})')
+    args = parser.parse_args(argv)
+    service = ReportService(args.path, args.cache_dir, args.workers, args.check_interval,
+                            ci_method=args.ci_method, relationship_mode=args.relationship_mode,
+                            backend=args.backend)
+    try:
+        asyncio.run(serve(service, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
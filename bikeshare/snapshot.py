@@ -0,0 +1,109 @@
+"""Columnar snapshots of prepared data, keyed on the source CSV (NumPy only).
+
+A snapshot is an uncompressed ``.npz`` with one array per column, categorical
+columns stored as codes plus a ``__categories__<name>`` array, and the size,
+mtime and content hash of the CSV it was built from. This module does not
+import pandas, so short-lived jobs can read snapshots without paying for it.
+"""
+import hashlib
+import os
+
+import numpy as np
+
+CACHE_DIR = '.bikeshare_cache'
+# Bumped whenever prepare_bike changes what it produces, so old snapshots are not reused
+SNAPSHOT_VERSION = 2
+
+
+def file_digest(path, blocksize=1 << 20):
+    """Hex digest of the file contents."""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(blocksize), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def file_fingerprint(path):
+    """Size, mtime and content hash identifying one version of ``path``."""
+    st = os.stat(path)
+    return {'size': st.st_size, 'mtime': st.st_mtime_ns, 'digest': file_digest(path)}
+
+
+def cache_path(path, suffix, cache_dir=None):
+    """File derived from ``path`` in the cache (``.bikeshare_cache`` next to the CSV by default)."""
+    if cache_dir is None:
+        cache_dir = os.path.join(os.path.dirname(os.path.abspath(path)), CACHE_DIR)
+    return os.path.join(cache_dir, os.path.basename(path) + suffix)
+
+
+def snapshot_path(path, cache_dir=None, compact=False):
+    """Where the snapshot of ``path`` lives."""
+    return cache_path(path, '.compact.npz' if compact else '.npz', cache_dir)
+
+
+def write_snapshot_arrays(arrays, fingerprint, target):
+    """Store column ``arrays`` with the fingerprint of the CSV they came from."""
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    arrays = dict(arrays)
+    arrays['__size__'] = np.int64(fingerprint['size'])
+    arrays['__mtime__'] = np.int64(fingerprint['mtime'])
+    arrays['__digest__'] = np.array(fingerprint['digest'])
+    arrays['__version__'] = np.int64(SNAPSHOT_VERSION)
+    # One temporary file per process: readers rewrite the snapshot after a touch
+    tmp = f'{target}.{os.getpid()}.tmp.npz'
+    np.savez(tmp, **arrays)
+    os.replace(tmp, target)
+
+
+def read_snapshot_arrays(path, target):
+    """Return the snapshot arrays if they still match ``path``, else None."""
+    if not os.path.exists(target):
+        return None
+    with np.load(target, allow_pickle=False) as snapshot:
+        arrays = dict(snapshot)
+    if int(arrays.get('__version__', 0)) != SNAPSHOT_VERSION:
+        return None
+    fingerprint = {'size': int(arrays['__size__']), 'mtime': int(arrays['__mtime__']),
+                   'digest': str(arrays['__digest__'])}
+    if not fingerprint_matches(path, fingerprint):
+        return None
+    if fingerprint['mtime'] != int(arrays['__mtime__']):
+        # Touched but unchanged: store the new mtime so the next read skips the hash
+        try:
+            write_snapshot_arrays(arrays, fingerprint, target)
+        except OSError:
+            pass
+    return arrays
+
+
+def fingerprint_matches(path, fingerprint):
+    """Whether ``path`` is still the file ``fingerprint`` was taken from.
+
+    Size and mtime are compared first; the content hash is only computed when
+    the mtime changed (e.g. the file was touched or copied). If the content
+    is the same, ``fingerprint['mtime']`` is set to the new mtime, for the
+    caller to store so that the next check skips the hash.
+    """
+    st = os.stat(path)
+    if fingerprint['size'] != st.st_size:
+        return False
+    if fingerprint['mtime'] == st.st_mtime_ns:
+        return True
+    if fingerprint['digest'] != file_digest(path):
+        return False
+    fingerprint['mtime'] = st.st_mtime_ns
+    return True
+
+
+def data_version(path, cache_dir=None):
+    """Content hash of ``path``, read from its snapshot when the snapshot is still valid."""
+    target = snapshot_path(path, cache_dir)
+    st = os.stat(path)
+    if os.path.exists(target):
+        with np.load(target, allow_pickle=False) as snapshot:
+            if (int(snapshot['__version__']) == SNAPSHOT_VERSION
+                    and int(snapshot['__size__']) == st.st_size
+                    and int(snapshot['__mtime__']) == st.st_mtime_ns):
+                return str(snapshot['__digest__'])
+    return file_digest(path)
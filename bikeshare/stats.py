@@ -0,0 +1,194 @@
+"""Streaming statistics: describe() and corr() without holding the data in memory.
+
+``StreamingStats`` keeps one-pass accumulators (count, mean, co-moment matrix,
+min, max) that are updated chunk by chunk and can be merged, plus a bottom-k
+random sample for approximate quantiles.
+
+Tolerance against the in-memory ``describe()``/``corr()``: count, min and max
+are exact; mean, std, covariance and correlation agree to about 1e-9 relative
+(floating point rounding only). Quantiles are exact while the number of rows
+is at most ``sample_size`` and otherwise have a rank error of roughly
+``1 / sqrt(sample_size)`` (about 0.3% of the rows for the default).
+
+The accumulators only need NumPy; pandas is imported when a frame is
+returned or a CSV is streamed, so the stats-only CLI path stays light.
+"""
+import numpy as np
+
+from .instrument import staged
+
+# Numerical columns of the prepared frame used by describe() and the heatmap
+NUMERICAL_COLUMNS = [
+    'count', 'temp_real_C', 'temp_feels_like_C', 'humidity_percent',
+    'wind_speed_kph', 'hour', 'month', 'dayofweek',
+]
+# Column order of the correlation heatmap (In[40])
+HEATMAP_COLUMNS = [
+    'count', 'temp_real_C', 'month', 'dayofweek', 'hour',
+    'temp_feels_like_C', 'humidity_percent', 'wind_speed_kph',
+]
+QUANTILES = [0.25, 0.5, 0.75]
+SAMPLE_SIZE = 100_000
+
+
+class QuantileSketch:
+    """Uniform random sample of rows, kept as the rows with the smallest random keys.
+
+    Two sketches merge into a uniform sample of the union by keeping the
+    smallest keys of both, so partial sketches can be combined in any order.
+    """
+
+    def __init__(self, width, sample_size=SAMPLE_SIZE, seed=None):
+        self.sample_size = sample_size
+        self.rng = np.random.default_rng(seed)
+        self.keys = np.empty(0)
+        self.rows = np.empty((0, width))
+
+    def _keep(self, keys, rows):
+        if len(keys) > self.sample_size:
+            keep = np.argpartition(keys, self.sample_size - 1)[:self.sample_size]
+            keys, rows = keys[keep], rows[keep]
+        self.keys, self.rows = keys, rows
+
+    def update(self, rows):
+        keys = self.rng.random(len(rows))
+        self._keep(np.concatenate([self.keys, keys]), np.concatenate([self.rows, rows]))
+
+    def merge(self, other):
+        self._keep(np.concatenate([self.keys, other.keys]), np.concatenate([self.rows, other.rows]))
+
+    def quantiles(self, q):
+        """Quantiles of each column, shape ``(len(q), width)``."""
+        if not len(self.rows):
+            return np.full((len(q), self.rows.shape[1]), np.nan)
+        return np.quantile(self.rows, q, axis=0)
+
+
+class StreamingStats:
+    """Mergeable one-pass count/mean/variance/min/max and covariance of ``columns``.
+
+    Rows with a missing value in any of the columns are skipped.
+    """
+
+    def __init__(self, columns=NUMERICAL_COLUMNS, sample_size=SAMPLE_SIZE, seed=None):
+        self.columns = list(columns)
+        width = len(self.columns)
+        self.n = 0
+        self.mean = np.zeros(width)
+        self.comoment = np.zeros((width, width))
+        self.min = np.full(width, np.inf)
+        self.max = np.full(width, -np.inf)
+        self.sketch = QuantileSketch(width, sample_size, seed)
+
+    def _combine(self, n, mean, comoment):
+        # Chan et al. pairwise update of the mean and co-moment matrix
+        total = self.n + n
+        delta = mean - self.mean
+        self.mean = self.mean + delta * (n / total)
+        self.comoment = self.comoment + comoment + np.outer(delta, delta) * (self.n * n / total)
+        self.n = total
+
+    def update(self, values):
+        """Add a chunk: a frame or dict of arrays with ``columns``, or a 2-D array in that order."""
+        if isinstance(values, dict):
+            values = np.column_stack([values[column] for column in self.columns])
+        elif hasattr(values, 'columns'):
+            values = values[self.columns]
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values).any(axis=1)]
+        if not len(values):
+            return self
+        mean = values.mean(axis=0)
+        centered = values - mean
+        self._combine(len(values), mean, centered.T @ centered)
+        self.min = np.minimum(self.min, values.min(axis=0))
+        self.max = np.maximum(self.max, values.max(axis=0))
+        self.sketch.update(values)
+        return self
+
+    def merge(self, other):
+        """Fold the accumulators of ``other`` (same columns) into this one."""
+        if other.columns != self.columns:
+            raise ValueError('cannot merge statistics over different columns')
+        if other.n:
+            self._combine(other.n, other.mean, other.comoment)
+            self.min = np.minimum(self.min, other.min)
+            self.max = np.maximum(self.max, other.max)
+            self.sketch.merge(other.sketch)
+        return self
+
+    def to_arrays(self):
+        """Accumulator state as plain arrays (see ``from_arrays``)."""
+        return {
+            'columns': np.array(self.columns, dtype=str),
+            'n': np.int64(self.n),
+            'mean': self.mean,
+            'comoment': self.comoment,
+            'min': self.min,
+            'max': self.max,
+            'sample_size': np.int64(self.sketch.sample_size),
+            'sample_keys': self.sketch.keys,
+            'sample_rows': self.sketch.rows,
+        }
+
+    @classmethod
+    def from_arrays(cls, arrays, seed=None):
+        stats = cls([str(c) for c in arrays['columns']], int(arrays['sample_size']), seed)
+        stats.n = int(arrays['n'])
+        stats.mean = arrays['mean']
+        stats.comoment = arrays['comoment']
+        stats.min = arrays['min']
+        stats.max = arrays['max']
+        stats.sketch.keys = arrays['sample_keys']
+        stats.sketch.rows = arrays['sample_rows']
+        return stats
+
+    def variance(self, ddof=1):
+        return self.comoment.diagonal() / max(self.n - ddof, 1)
+
+    def cov_matrix(self, ddof=1):
+        return self.comoment / max(self.n - ddof, 1)
+
+    def corr_matrix(self):
+        scale = np.sqrt(self.comoment.diagonal())
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return self.comoment / np.outer(scale, scale)
+
+    def describe_rows(self):
+        """``(index, rows)`` of ``describe()`` as a label list and a 2-D array."""
+        rows = np.vstack([
+            np.full(len(self.columns), float(self.n)),
+            self.mean,
+            np.sqrt(self.variance()),
+            self.min,
+            self.sketch.quantiles(QUANTILES),
+            self.max,
+        ])
+        index = ['count', 'mean', 'std', 'min'] + [f'{q:.0%}' for q in QUANTILES] + ['max']
+        return index, rows
+
+    def cov(self, ddof=1):
+        import pandas as pd
+        return pd.DataFrame(self.cov_matrix(ddof), index=self.columns, columns=self.columns)
+
+    def corr(self):
+        import pandas as pd
+        return pd.DataFrame(self.corr_matrix(), index=self.columns, columns=self.columns)
+
+    def describe(self):
+        """Same layout as ``DataFrame.describe()``."""
+        import pandas as pd
+        index, rows = self.describe_rows()
+        return pd.DataFrame(rows, index=index, columns=self.columns)
+
+
+@staged('stream_stats')
+def stream_stats(path='london_merged.csv', chunksize=100_000, columns=NUMERICAL_COLUMNS, **kwargs):
+    """Compute ``StreamingStats`` over a CSV, reading and preparing it in chunks."""
+    from .load import iter_bike_csv
+    from .prepare import prepare_bike
+
+    stats = StreamingStats(columns, **kwargs)
+    for chunk in iter_bike_csv(path, chunksize):
+        stats.update(prepare_bike(chunk))
+    return stats
@@ -0,0 +1,152 @@
+"""Synthetic data shaped like london_merged.csv, for benchmarks at any size.
+
+The generator reproduces the structure the report looks at: commuter peaks at
+8:00 and 17:00-18:00 on weekdays, a flatter afternoon profile on weekends,
+more rides in summer and in clear weather, seasonal and daily temperature
+cycles, humidity falling with temperature, the weather codes
+{1, 2, 3, 4, 7, 10, 26} at their observed frequencies and seasons 0-3.
+
+Timestamps are consecutive hours from ``start``; past ``span_hours`` (30
+years) they start over, one second later on each repetition, as if the
+further rows came from other stations with the same calendar reporting a
+moment apart. The dates stay in the range pandas parses, the calendar parts
+of every row are those of its hour, and every timestamp is unique up to
+3,600 repetitions (about 9.5e8 rows).
+
+``synthetic_journeys`` expands hourly rows into one row per hire in the TfL
+journey extract layout, for the ingestion stage (see ``bikeshare.journeys``).
+"""
+import numpy as np
+import pandas as pd
+
+from .load import RAW_COLUMNS, TIMESTAMP_FORMAT
+from .prepare import MONTH_SEASON, WEATHER
+
+# Observed weather code frequencies in london_merged.csv
+WEATHER_CODES = np.array(list(WEATHER), dtype=np.float64)
+WEATHER_P = np.array([6150, 4034, 3551, 1464, 2141, 14, 60], dtype=np.float64)
+WEATHER_P /= WEATHER_P.sum()
+# Relative demand by weather code
+WEATHER_FACTOR = np.zeros(27)
+WEATHER_FACTOR[[1, 2, 3, 4, 7, 10, 26]] = [1.0, 1.2, 1.0, 0.55, 0.6, 0.5, 0.25]
+
+# Relative demand by hour of day
+WEEKDAY_PROFILE = np.array([
+    0.25, 0.17, 0.12, 0.08, 0.07, 0.10, 0.45, 1.40, 2.90, 1.60, 0.85, 0.85,
+    1.00, 1.05, 1.00, 1.10, 1.60, 2.80, 2.60, 1.50, 0.95, 0.70, 0.55, 0.40,
+])
+WEEKEND_PROFILE = np.array([
+    0.45, 0.38, 0.30, 0.20, 0.12, 0.10, 0.15, 0.25, 0.45, 0.80, 1.20, 1.55,
+    1.75, 1.85, 1.85, 1.80, 1.70, 1.50, 1.20, 0.90, 0.70, 0.55, 0.45, 0.35,
+])
+SEASON_FACTOR = np.array([0.95, 1.25, 1.0, 0.7])
+
+SPAN_HOURS = 30 * 8766
+HOLIDAY_RATE = 0.022
+
+JOURNEY_COLUMNS = ['Rental Id', 'Duration', 'Bike Id', 'End Date', 'EndStation Id', 'EndStation Name',
+                   'Start Date', 'StartStation Id', 'StartStation Name']
+STATIONS = 800
+
+
+def synthetic_raw(n_rows, start='2015-01-04', seed=0, offset=0, span_hours=SPAN_HOURS):
+    """``n_rows`` raw rows (``read_bike_csv`` layout), starting ``offset`` hours after ``start``."""
+    rng = np.random.default_rng([seed, offset])
+    repetition, hours = np.divmod(offset + np.arange(n_rows), span_hours)
+    if n_rows and repetition[-1] >= 3600:
+        raise ValueError(f'at most {3600 * span_hours:,d} rows have unique timestamps, not {offset + n_rows:,d}')
+    time = np.datetime64(pd.Timestamp(start), 'h') + hours
+    days = time.astype('datetime64[D]')
+    hour = (time - days).astype(np.int64)
+    dayofweek = (days.astype(np.int64) + 3) % 7
+    month = days.astype('datetime64[M]').astype(np.int64) % 12
+    day_of_year = (days - days.astype('datetime64[Y]')).astype(np.int64)
+    season = MONTH_SEASON[month]
+    weekend = dayofweek >= 5
+    # Holidays are whole days, picked by hashing the day number
+    holiday = ((days.astype(np.int64) * 2654435761) % 1000) < HOLIDAY_RATE * 1000
+    holiday &= ~weekend
+
+    weather = rng.choice(WEATHER_CODES, size=n_rows, p=WEATHER_P)
+    # Snow only in winter
+    weather[(weather == 26) & (season != 3)] = 3
+    t1 = (12.5 - 7.5 * np.cos(2 * np.pi * (day_of_year - 20) / 365.25)
+          - 2.5 * np.cos(2 * np.pi * (hour - 3) / 24) + rng.normal(0, 2.5, n_rows))
+    t1 = np.round(np.clip(t1, -5, 36) * 2) / 2
+    wind = np.round(np.clip(rng.gamma(4, 4, n_rows), 0, 56.5) * 2) / 2
+    t2 = np.round((t1 - np.where(t1 < 12, wind / 8, 0) + rng.normal(0, 0.5, n_rows)) * 2) / 2
+    hum = np.round(np.clip(95 - 1.8 * t1 + rng.normal(0, 10, n_rows) + 8 * (weather >= 7), 20, 100) * 2) / 2
+
+    profile = np.where(weekend | holiday, WEEKEND_PROFILE[hour], WEEKDAY_PROFILE[hour])
+    expected = (1150 * profile * SEASON_FACTOR[season] * WEATHER_FACTOR[weather.astype(np.int64)]
+                * np.clip(1 + 0.025 * (t1 - 12), 0.3, None) * np.clip(1.6 - hum / 120, 0.2, None))
+    cnt = rng.poisson(np.maximum(expected, 0.1) * rng.gamma(25, 1 / 25, n_rows))
+
+    return pd.DataFrame({
+        'timestamp': time.astype('datetime64[s]') + repetition.astype('timedelta64[s]'),
+        'cnt': cnt.astype(np.int64),
+        't1': t1,
+        't2': t2,
+        'hum': hum,
+        'wind_speed': wind,
+        'weather_code': weather,
+        'is_holiday': holiday.astype(np.float64),
+        'is_weekend': weekend.astype(np.float64),
+        'season': season.astype(np.float64),
+    })[RAW_COLUMNS]
+
+
+def iter_synthetic(n_rows, chunksize=1_000_000, **kwargs):
+    """Yield ``synthetic_raw`` chunks that together make ``n_rows`` consecutive rows."""
+    for offset in range(0, n_rows, chunksize):
+        yield synthetic_raw(min(chunksize, n_rows - offset), offset=offset, **kwargs)
+
+
+def write_synthetic_csv(path, n_rows, chunksize=1_000_000, **kwargs):
+    """Write ``n_rows`` synthetic rows to ``path`` in the london_merged.csv format."""
+    with open(path, 'w', newline='') as f:
+        for i, chunk in enumerate(iter_synthetic(n_rows, chunksize, **kwargs)):
+            chunk.to_csv(f, header=i == 0, index=False, date_format=TIMESTAMP_FORMAT)
+    return path
+
+
+def _tfl_dates(minutes):
+    # 'dd/mm/YYYY HH:MM', the date format of the TfL extracts
+    iso = pd.Series(np.datetime_as_string(minutes, unit='m'))
+    return iso.str[8:10] + '/' + iso.str[5:7] + '/' + iso.str[:4] + ' ' + iso.str[11:16]
+
+
+def synthetic_journeys(raw, seed=0, first_id=0):
+    """One row per hire counted in ``raw['cnt']``, in the TfL journey extract layout."""
+    rng = np.random.default_rng([seed, first_id])
+    counts = raw['cnt'].to_numpy()
+    n = int(counts.sum())
+    start = (np.repeat(raw['timestamp'].to_numpy().astype('datetime64[m]'), counts)
+             + rng.integers(0, 60, n).astype('timedelta64[m]'))
+    duration = np.maximum(rng.gamma(2, 600, n), 60).astype(np.int64)
+    end = start + (duration // 60).astype('timedelta64[m]')
+    stations = rng.integers(1, STATIONS + 1, (2, n))
+    names = pd.Series(stations.ravel()).astype(str)
+    names = ('Station ' + names).to_numpy().reshape(2, n)
+    return pd.DataFrame({
+        'Rental Id': first_id + np.arange(n),
+        'Duration': duration,
+        'Bike Id': rng.integers(1, 15000, n),
+        'End Date': _tfl_dates(end),
+        'EndStation Id': stations[1],
+        'EndStation Name': names[1],
+        'Start Date': _tfl_dates(start),
+        'StartStation Id': stations[0],
+        'StartStation Name': names[0],
+    })[JOURNEY_COLUMNS]
+
+
+def write_synthetic_journeys(path, raw, hours_per_chunk=1000, seed=0):
+    """Write the journeys of the hourly rows ``raw`` to ``path``, ``hours_per_chunk`` hours at a time."""
+    first_id = 0
+    with open(path, 'w', newline='') as f:
+        for i in range(0, len(raw), hours_per_chunk):
+            journeys = synthetic_journeys(raw.iloc[i:i + hours_per_chunk], seed, first_id)
+            journeys.to_csv(f, header=i == 0, index=False)
+            first_id += len(journeys)
+    return path
@@ -0,0 +1,173 @@
+"""Gap-aware hourly time index over the prepared frame.
+
+The 17,414 rows cover about 17,544 hours, so some hours are missing.
+``HourlyIndex`` works on the sorted ``time`` column as integer hours: it
+reports the gaps, can reindex to the complete hourly grid with an explicit
+fill policy, answers time ranges by binary search (returning row slices, not
+boolean masks) and computes moving statistics in O(n) from cumulative sums.
+"""
+import numpy as np
+import pandas as pd
+
+from .prepare import calendar_parts
+
+FILL_POLICIES = ('nan', 'zero', 'ffill', 'interpolate')
+
+
+def _hours(times):
+    return np.asarray(times, dtype='datetime64[h]').astype(np.int64)
+
+
+def _window_hours(window):
+    if isinstance(window, str):
+        return int(pd.Timedelta(window) / pd.Timedelta('1h'))
+    return int(window)
+
+
+class HourlyIndex:
+    """Time index of a prepared frame whose ``time`` column is sorted and on the hour."""
+
+    def __init__(self, bike):
+        hours = _hours(bike['time'])
+        if len(hours) and (np.diff(hours) <= 0).any():
+            raise ValueError('time must be strictly increasing; sort and deduplicate the frame first')
+        self.bike = bike
+        self.hours = hours
+
+    def __len__(self):
+        return len(self.hours)
+
+    @property
+    def expected_hours(self):
+        """Number of hours from the first to the last row."""
+        return int(self.hours[-1] - self.hours[0] + 1) if len(self.hours) else 0
+
+    def gaps(self):
+        """One row per gap: first and last missing hour and how many hours are missing."""
+        steps = np.diff(self.hours)
+        after = np.flatnonzero(steps > 1)
+        first = self.hours[after] + 1
+        last = self.hours[after + 1] - 1
+        return pd.DataFrame({
+            'start': first.astype('datetime64[h]').astype('datetime64[s]'),
+            'end': last.astype('datetime64[h]').astype('datetime64[s]'),
+            'missing_hours': last - first + 1,
+        })
+
+    def gap_report(self):
+        """Summary of the gaps as a dict."""
+        gaps = self.gaps()
+        return {
+            'rows': len(self),
+            'expected_hours': self.expected_hours,
+            'missing_hours': int(gaps['missing_hours'].sum()),
+            'gaps': len(gaps),
+            'longest_gap_hours': int(gaps['missing_hours'].max()) if len(gaps) else 0,
+        }
+
+    def positions(self, start=None, end=None):
+        """Row range ``[i, j)`` with ``start <= time < end``, found by binary search."""
+        i = 0 if start is None else int(np.searchsorted(self.hours, _hours([start])[0], 'left'))
+        j = len(self.hours) if end is None else int(np.searchsorted(self.hours, _hours([end])[0], 'left'))
+        return i, max(i, j)
+
+    def slice(self, start=None, end=None):
+        """Rows with ``start <= time < end`` as a positional slice of the frame."""
+        i, j = self.positions(start, end)
+        return self.bike.iloc[i:j]
+
+    def values(self, column, start=None, end=None):
+        """NumPy view of ``column`` for ``start <= time < end`` (no copy for numeric columns)."""
+        i, j = self.positions(start, end)
+        return self.bike[column].to_numpy()[i:j]
+
+    def select(self, start=None, end=None, weekdays=None, **equals):
+        """Time range plus filters, e.g. ``select('2016-06-01', '2016-09-01', weekdays=True)``.
+
+        The range is found by binary search; ``weekdays`` (True for Monday-Friday,
+        False for weekends) and ``column=value`` filters are evaluated on that
+        range only.
+        """
+        part = self.slice(start, end)
+        keep = np.ones(len(part), dtype=bool)
+        if weekdays is not None:
+            keep &= (part['dayofweek'].to_numpy() < 5) == weekdays
+        for column, value in equals.items():
+            keep &= part[column].to_numpy() == value
+        return part if keep.all() else part[keep]
+
+    def complete(self, fill='nan'):
+        """Reindex to every hour between the first and last row.
+
+        ``fill`` is one of ``FILL_POLICIES`` or a dict mapping columns to one;
+        columns not named keep NaN. Categorical columns can only use 'nan' or
+        'ffill'. Calendar parts and ``is_weekend`` are recomputed for the new
+        hours and an ``observed`` column tells real rows from filled ones.
+        """
+        positions = self.hours - self.hours[0]
+        grid = self.hours[0] + np.arange(self.expected_hours)
+        observed = np.zeros(len(grid), dtype=bool)
+        observed[positions] = True
+        policies = fill if isinstance(fill, dict) else {column: fill for column in self.bike}
+        calendar = calendar_parts(grid.astype('datetime64[h]'))
+        columns = {'time': grid.astype('datetime64[h]').astype(self.bike['time'].dtype)}
+        for name, column in self.bike.items():
+            if name == 'time':
+                continue
+            if name in calendar:
+                columns[name] = calendar[name].astype(column.dtype)
+                continue
+            if name == 'is_weekend':
+                columns[name] = (calendar['dayofweek'] >= 5).astype(column.dtype)
+                continue
+            policy = policies.get(name, 'nan')
+            if policy not in FILL_POLICIES:
+                raise ValueError(f'fill policy for {name!r} must be one of {FILL_POLICIES}, not {policy!r}')
+            full = pd.Series(column.to_numpy(), index=positions).reindex(np.arange(len(grid)))
+            if isinstance(column.dtype, pd.CategoricalDtype):
+                if policy not in ('nan', 'ffill'):
+                    raise ValueError(f'categorical column {name!r} can only be filled with nan or ffill')
+                full = full.astype(column.dtype)
+            if policy == 'zero':
+                full = full.fillna(0)
+            elif policy == 'ffill':
+                full = full.ffill()
+            elif policy == 'interpolate':
+                full = full.astype(np.float64).interpolate()
+            # The Categorical itself, as to_numpy() would turn the labels into plain objects
+            columns[name] = full.array if isinstance(column.dtype, pd.CategoricalDtype) else full.to_numpy()
+        columns['observed'] = observed
+        return pd.DataFrame(columns)
+
+    def rolling(self, column='count', window='24h', stat='mean', min_periods=1):
+        """Moving ``stat`` ('mean' or 'sum') of ``column`` over the trailing ``window``.
+
+        The window is in hours of time, not rows: the value at hour t uses the
+        observations in (t - window, t], however many hours are missing. It is
+        computed in O(n) from cumulative sums over the complete hourly grid and
+        returned for the observed rows, indexed by time.
+        """
+        width = _window_hours(window)
+        positions = self.hours - self.hours[0]
+        size = self.expected_hours
+        values = np.zeros(size)
+        present = np.zeros(size)
+        raw = self.bike[column].to_numpy(dtype=np.float64)
+        ok = ~np.isnan(raw)
+        values[positions[ok]] = raw[ok]
+        present[positions[ok]] = 1
+        total = np.concatenate([[0.0], np.cumsum(values)])
+        count = np.concatenate([[0.0], np.cumsum(present)])
+        upper = positions + 1
+        lower = np.maximum(upper - width, 0)
+        sums = total[upper] - total[lower]
+        counts = count[upper] - count[lower]
+        if stat == 'sum':
+            result = sums
+        elif stat == 'mean':
+            with np.errstate(invalid='ignore', divide='ignore'):
+                result = sums / counts
+        else:
+            raise ValueError(f"stat must be 'mean' or 'sum', not {stat!r}")
+        result = np.where(counts >= min_periods, result, np.nan)
+        return pd.Series(result, index=pd.DatetimeIndex(self.bike['time']), name=f'{column}_{window}_{stat}')
@@ -0,0 +1,161 @@
+"""Schema checks of the prepared frame, run in the load pass.
+
+The season and weather mappings (In[11], In[12]) turn unknown codes into NaN
+without a word, and nothing else looks at the values. ``check_bike`` runs
+every rule of ``RULES`` as a column-wise comparison on the arrays the load
+already produced: the unknown codes are the -1 codes left by ``map_codes``
+and the weekend check uses the ``dayofweek`` of ``calendar_parts``, so no
+column is parsed or mapped twice. Duplicate timestamps cost one ``np.diff``
+when the times are sorted (the usual case) and a sort otherwise.
+
+A ``ValidationReport`` holds the number of violations of each rule and the
+row positions. ``validate_bike`` applies a policy:
+
+- ``strict``: raise ``ValidationError`` if any row breaks a rule,
+- ``drop``: leave out the rows breaking a rule,
+- ``quarantine``: leave them out and keep them, with the rules they break,
+  in ``report.quarantine`` (``load_bike`` writes them next to the snapshot).
+
+    python -m bikeshare validate london_merged.csv --limit 5
+"""
+import argparse
+import json
+import sys
+
+import numpy as np
+
+from .instrument import staged
+
+POLICIES = ('strict', 'quarantine', 'drop')
+# Plausible ranges of the measurements in prepared units (humidity as a fraction, In[10])
+RANGES = {
+    'count': (0, np.inf),
+    'temp_real_C': (-30.0, 50.0),
+    'temp_feels_like_C': (-40.0, 55.0),
+    'humidity_percent': (0.0, 1.0),
+    'wind_speed_kph': (0.0, 150.0),
+}
+RULES = (['time_missing', 'time_duplicate', 'season_code', 'weather_code']
+         + [f'{name}_range' for name in RANGES]
+         + ['is_holiday_flag', 'is_weekend_flag', 'is_weekend_mismatch'])
+
+
+class ValidationError(ValueError):
+    """Raised by the ``strict`` policy; ``report`` is the ``ValidationReport``."""
+
+    def __init__(self, report):
+        counts = ', '.join(f'{rule}: {n:,d}' for rule, n in report.counts.items() if n)
+        super().__init__(f'{report.invalid.size:,d} of {report.rows:,d} rows break the schema ({counts})')
+        self.report = report
+
+
+class ValidationReport:
+    """Violations of each rule of ``RULES`` as row positions, for ``rows`` rows checked."""
+
+    def __init__(self, rows, violations):
+        self.rows = rows
+        self.violations = violations
+        self.quarantine = None
+
+    @property
+    def counts(self):
+        return {rule: int(positions.size) for rule, positions in self.violations.items()}
+
+    @property
+    def invalid(self):
+        """Sorted positions of the rows breaking at least one rule."""
+        found = [positions for positions in self.violations.values() if positions.size]
+        return np.unique(np.concatenate(found)) if found else np.empty(0, dtype=np.int64)
+
+    @property
+    def ok(self):
+        return not any(positions.size for positions in self.violations.values())
+
+    def rules_of(self, positions):
+        """Comma-separated rules broken by each row of ``positions``."""
+        positions = np.asarray(positions)
+        names = [[] for _ in range(len(positions))]
+        for rule, found in self.violations.items():
+            for i in np.flatnonzero(np.isin(positions, found)):
+                names[i].append(rule)
+        return [','.join(rule_names) for rule_names in names]
+
+    def to_dict(self, limit=10):
+        """JSON-ready summary: counts and the first ``limit`` row positions of each broken rule."""
+        return {'rows': self.rows, 'invalid_rows': int(self.invalid.size),
+                'violations': {rule: {'count': int(positions.size), 'rows': positions[:limit].tolist()}
+                               for rule, positions in self.violations.items() if positions.size}}
+
+    def __repr__(self):
+        return f'ValidationReport(rows={self.rows}, invalid={self.invalid.size}, counts={self.counts})'
+
+
+def _duplicates(times):
+    # Positions of the rows whose (non-missing) timestamp appeared on an earlier row
+    ns = np.asarray(times, dtype='datetime64[ns]').view(np.int64)
+    present = ns != np.iinfo(np.int64).min
+    steps = np.diff(ns)
+    if present.all() and (steps > 0).all():
+        return np.empty(0, dtype=np.int64)
+    if present.all() and (steps >= 0).all():
+        return np.flatnonzero(steps == 0) + 1
+    order = np.flatnonzero(present)
+    order = order[np.argsort(ns[order], kind='stable')]
+    repeated = np.diff(ns[order]) == 0
+    return np.sort(order[1:][repeated])
+
+
+@staged('check_bike')
+def check_bike(bike):
+    """``ValidationReport`` of a prepared frame (row positions, not index labels)."""
+    masks = {
+        'time_missing': np.asarray(bike['time'].isna()),
+        'season_code': np.asarray(bike['season'].cat.codes) < 0,
+        'weather_code': np.asarray(bike['weather'].cat.codes) < 0,
+    }
+    for name, (low, high) in RANGES.items():
+        values = np.asarray(bike[name])
+        # NaN fails both comparisons, so missing values count as out of range
+        masks[f'{name}_range'] = ~((values >= low) & (values <= high))
+    flags = {}
+    for name in ('is_holiday', 'is_weekend'):
+        values = np.asarray(bike[name])
+        flags[name] = values == 1
+        masks[f'{name}_flag'] = ~(flags[name] | (values == 0))
+    masks['is_weekend_mismatch'] = (~masks['is_weekend_flag'] & ~masks['time_missing']
+                                    & (flags['is_weekend'] != (np.asarray(bike['dayofweek']) >= 5)))
+    violations = {rule: np.flatnonzero(masks[rule]) for rule in RULES if rule != 'time_duplicate'}
+    violations['time_duplicate'] = _duplicates(bike['time'])
+    return ValidationReport(len(bike), {rule: violations[rule] for rule in RULES})
+
+
+def validate_bike(bike, policy='strict'):
+    """Check a prepared frame and apply ``policy``; returns ``(bike, report)``."""
+    if policy not in POLICIES:
+        raise ValueError(f'policy must be one of {POLICIES}, not {policy!r}')
+    report = check_bike(bike)
+    if report.ok:
+        return bike, report
+    if policy == 'strict':
+        raise ValidationError(report)
+    invalid = report.invalid
+    if policy == 'quarantine':
+        report.quarantine = bike.iloc[invalid].assign(violations=report.rules_of(invalid))
+    keep = np.ones(len(bike), dtype=bool)
+    keep[invalid] = False
+    return bike[keep], report
+
+
+def main(argv=None):
+    from .load import load_bike
+
+    parser = argparse.ArgumentParser(prog='python -m bikeshare validate',
+                                     description='Check london_merged.csv against the schema rules.')
+    parser.add_argument('path', nargs='?', default='london_merged.csv')
+    parser.add_argument('--cache-dir')
+    parser.add_argument('--limit', type=int, default=10, help='row positions listed per rule')
+    args = parser.parse_args(argv)
+    report = check_bike(load_bike(args.path, args.cache_dir))
+    json.dump(report.to_dict(args.limit), sys.stdout, indent=1)
+    sys.stdout.write('\n')
+    return 0 if report.ok else 1
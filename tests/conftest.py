@@ -0,0 +1,15 @@
+import numpy as np
+import pytest
+
+from bikeshare.prepare import prepare_bike
+from bikeshare.synthetic import synthetic_raw
+
+
+@pytest.fixture(scope='session')
+def bike():
+    """Prepared synthetic rows, 100 with a missing season and 100 with a missing holiday flag."""
+    bike = prepare_bike(synthetic_raw(5000, seed=3))
+    missing = np.random.default_rng(0).choice(len(bike), 200, replace=False)
+    bike.loc[missing[:100], 'season'] = np.nan
+    bike.loc[missing[100:], 'is_holiday'] = np.nan
+    return bike
@@ -0,0 +1,60 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from bikeshare.anomaly import AnomalyDetector, baseline_keys
+from bikeshare.prepare import prepare_bike
+from bikeshare.synthetic import synthetic_raw
+
+
+@pytest.fixture(scope='module')
+def hours():
+    hours = prepare_bike(synthetic_raw(3000, seed=2))
+    hours['count'] = hours['count'].astype(np.float64)
+    rng = np.random.default_rng(0)
+    hours.loc[rng.choice(len(hours), 40, replace=False), 'count'] = np.nan
+    hours.loc[rng.choice(len(hours), 5, replace=False), 'count'] = np.inf
+    # Unknown seasons, which have no baseline key
+    hours.loc[rng.choice(len(hours), 20, replace=False), 'season'] = np.nan
+    # A few spikes, so some hours are flagged
+    hours.loc[rng.choice(np.arange(1000, len(hours)), 10, replace=False), 'count'] *= 20
+    return hours
+
+
+@pytest.mark.parametrize('count', [np.nan, np.inf, -np.inf])
+def test_observe_skips_non_finite_counts(hours, count):
+    detector = AnomalyDetector()
+    detector.score(hours.iloc[:500])
+    before = detector.state()
+    seen = detector.seen
+    z, anomaly = detector.observe(hours['time'].iloc[500], count)
+    assert np.isnan(z) and not anomaly
+    assert detector.seen == seen
+    pd.testing.assert_frame_equal(detector.state(), before)
+
+
+@pytest.mark.parametrize('key', [-1, 1344, 5000])
+def test_observe_key_skips_keys_out_of_range(hours, key):
+    detector = AnomalyDetector()
+    detector.score(hours.iloc[:500])
+    before = detector.state()
+    seen = detector.seen
+    z, anomaly = detector.observe_key(key, 100.0)
+    assert np.isnan(z) and not anomaly
+    assert detector.seen == seen
+    pd.testing.assert_frame_equal(detector.state(), before)
+
+
+def test_observe_matches_score_with_missing_values(hours):
+    streamed = AnomalyDetector(warmup=24)
+    results = [streamed.observe_key(key, count)
+               for key, count in zip(baseline_keys(hours), hours['count'].to_numpy())]
+    z = np.array([result[0] for result in results])
+    flags = np.array([result[1] for result in results])
+    batch = AnomalyDetector(warmup=24)
+    scored = batch.score(hours)
+    np.testing.assert_allclose(z, scored['z'].to_numpy(), rtol=1e-9, atol=1e-9, equal_nan=True)
+    np.testing.assert_array_equal(flags, scored['anomaly'].to_numpy())
+    assert flags.any()
+    assert streamed.seen == batch.seen == int((np.isfinite(hours['count']) & hours['season'].notna()).sum())
+    pd.testing.assert_frame_equal(streamed.state(), batch.state(), rtol=1e-9)
@@ -0,0 +1,44 @@
+import pandas as pd
+import pytest
+
+from bikeshare.backends import BACKEND_ENV, backend_name, get_backend
+from bikeshare.load import load_bike
+from bikeshare.synthetic import write_synthetic_csv
+
+pytest.importorskip('pyarrow')
+
+QUERIES = [
+    ('hour', ['count'], None),
+    (['season', 'weather'], ['count', 'temp_real_C'], None),
+    (['year', 'dayofweek'], ['count'], {'season': 'summer', 'is_weekend': 1}),
+    (['month'], ['count', 'humidity_percent'], {'hour': [7, 8, 17, 18], 'weather': ['Clear', 'Rain']}),
+]
+
+
+@pytest.fixture(scope='module')
+def path(tmp_path_factory):
+    # Small record batches, so the arrow backend merges partials of several batches
+    return write_synthetic_csv(str(tmp_path_factory.mktemp('backends') / 'bike.csv'), 20_000, seed=5)
+
+
+@pytest.mark.parametrize('compact', [False, True])
+def test_load_prepared_matches_pandas(path, compact):
+    expected = get_backend('pandas').load_prepared(path, compact)
+    got = get_backend('arrow', block_size=1 << 16).load_prepared(path, compact)
+    pd.testing.assert_frame_equal(got, expected)
+
+
+@pytest.mark.parametrize('by, columns, filters', QUERIES)
+def test_group_sums_match_pandas(path, tmp_path, by, columns, filters):
+    expected = get_backend('pandas', cache_dir=str(tmp_path)).group_sums(path, by, columns, filters)
+    got = get_backend('arrow', threads=2, block_size=1 << 16).group_sums(path, by, columns, filters)
+    pd.testing.assert_frame_equal(got, expected, check_exact=False, rtol=1e-12)
+
+
+def test_load_bike_backend_from_environment(path, tmp_path, monkeypatch):
+    expected = load_bike(path, str(tmp_path / 'pandas'), backend='pandas')
+    monkeypatch.setenv(BACKEND_ENV, 'arrow')
+    assert backend_name() == 'arrow'
+    pd.testing.assert_frame_equal(load_bike(path, str(tmp_path / 'arrow')), expected)
+    with pytest.raises(ValueError, match='unknown backend'):
+        get_backend('polars')
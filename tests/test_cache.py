@@ -0,0 +1,18 @@
+import os
+
+import pytest
+
+from bikeshare.cache import ResultCache
+
+
+def test_put_bytes_replaces_entries_whole(tmp_path):
+    cache = ResultCache(str(tmp_path))
+    cache.put_bytes('key', b'old', 'table')
+    with pytest.raises(TypeError):
+        # Fails after the file is opened: the stored entry must be untouched
+        cache.put_bytes('key', object(), 'table')
+    assert cache.get_bytes('key') == b'old'
+    cache.put_bytes('key', b'new', 'table')
+    assert cache.get_bytes('key') == b'new'
+    cache.flush()
+    assert sorted(name for name in os.listdir(tmp_path) if not name.endswith('.tmp')) == ['index.json', 'key']
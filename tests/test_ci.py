@@ -0,0 +1,84 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from bikeshare.ci import bootstrap_ci, group_ci, moment_ci, t_quantile
+
+
+@pytest.fixture(scope='module')
+def samples():
+    # 10000 groups of 10 draws from N(5, 2^2)
+    rng = np.random.default_rng(0)
+    values = rng.normal(5, 2, (10000, 10))
+    return pd.DataFrame({'n': 10, 'mean': values.mean(axis=1), 'std': values.std(axis=1, ddof=1)})
+
+
+def test_t_interval_covers_at_its_level(samples):
+    ci = moment_ci(samples, 0.95, 't')
+    covered = ((ci['lo'] <= 5) & (5 <= ci['hi'])).mean()
+    # Binomial standard error of the coverage is about 0.002
+    assert abs(covered - 0.95) < 0.008
+    # The normal interval is too narrow for 10 draws
+    normal = moment_ci(samples, 0.95, 'normal')
+    assert ((normal['lo'] <= 5) & (5 <= normal['hi'])).mean() < covered
+
+
+def test_t_interval_width(samples):
+    ci = moment_ci(samples, 0.95, 't')
+    # t quantile 0.975 with 9 degrees of freedom
+    expected = 2 * 2.2621571628 * samples['std'] / np.sqrt(10)
+    np.testing.assert_allclose(ci['hi'] - ci['lo'], expected, rtol=3e-4)
+    np.testing.assert_allclose(t_quantile(0.975, [1, 2]), [12.7062047362, 4.3026527297], rtol=1e-9)
+
+
+def test_bootstrap_agrees_with_t_on_large_groups():
+    rng = np.random.default_rng(1)
+    sizes = [500, 1000, 2000]
+    codes = np.repeat(np.arange(3), sizes)
+    values = rng.exponential(3.0, codes.size)
+    mean, lo, hi = bootstrap_ci(codes, values, 0.95, n_boot=4000, seed=0)
+    moments = pd.DataFrame({'n': sizes, 'mean': np.bincount(codes, values) / sizes,
+                            'std': [values[codes == g].std(ddof=1) for g in range(3)]})
+    ci = moment_ci(moments, 0.95, 't')
+    np.testing.assert_allclose(mean, ci['mean'], rtol=1e-12)
+    half = (ci['hi'] - ci['lo']).to_numpy() / 2
+    assert (np.abs(lo - ci['lo'].to_numpy()) < 0.1 * half).all()
+    assert (np.abs(hi - ci['hi'].to_numpy()) < 0.1 * half).all()
+
+
+def test_group_ci_methods_agree(bike):
+    t = group_ci(bike, 'season', method='t')
+    boot = group_ci(bike, 'season', method='bootstrap', n_boot=2000, seed=0)
+    assert list(t.index) == list(boot.index)
+    np.testing.assert_array_equal(t['n'], boot['n'])
+    np.testing.assert_allclose(t['mean'], boot['mean'], rtol=1e-12)
+    half = (t['hi'] - t['lo']) / 2
+    assert ((boot['lo'] - t['lo']).abs() < 0.15 * half).all()
+    assert ((boot['hi'] - t['hi']).abs() < 0.15 * half).all()
+
+
+@pytest.mark.parametrize('method', ['t', 'normal', 'bootstrap'])
+def test_single_row_groups(bike, method):
+    # The first 25 hours: hour 0 twice, every other hour once
+    ci = group_ci(bike.iloc[:25], 'hour', method=method, n_boot=200, seed=0)
+    single = ci[ci['n'] == 1]
+    assert len(single) == 23 and ci.loc[0, 'n'] == 2
+    if method == 'bootstrap':
+        # Every resample of one row is that row
+        np.testing.assert_array_equal(single['lo'], single['mean'])
+        np.testing.assert_array_equal(single['hi'], single['mean'])
+    else:
+        # No spread to estimate from a single row
+        assert single[['lo', 'hi']].isna().all().all()
+    assert ci.loc[0, 'lo'] < ci.loc[0, 'mean'] < ci.loc[0, 'hi']
+
+
+@pytest.mark.parametrize('by', ['season', 'is_holiday', ['season', 'is_holiday']])
+def test_bootstrap_skips_missing_keys(bike, by):
+    columns = [by] if isinstance(by, str) else by
+    result = group_ci(bike, by, method='bootstrap', n_boot=200, seed=0)
+    expected = group_ci(bike.dropna(subset=columns), by, method='bootstrap', n_boot=200, seed=0)
+    pd.testing.assert_frame_equal(result, expected)
+    means = bike.groupby(by, observed=True)['count'].mean()
+    np.testing.assert_allclose(result['mean'].to_numpy(), means.to_numpy(), rtol=1e-12)
+    assert (result['lo'] <= result['mean']).all() and (result['mean'] <= result['hi']).all()
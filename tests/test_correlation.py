@@ -0,0 +1,24 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from bikeshare.correlation import group_corr
+
+# Calendar columns are constant within some small groups, where the correlation is undefined
+COLUMNS = ['count', 'temp_real_C', 'humidity_percent', 'wind_speed_kph']
+
+
+@pytest.mark.parametrize('by', ['season', 'is_holiday', ['season', 'is_holiday']])
+def test_group_corr_skips_missing_keys(bike, by):
+    columns = [by] if isinstance(by, str) else by
+    present = bike.dropna(subset=columns)
+    result = group_corr(bike, by, COLUMNS)
+    expected = group_corr(present, by, COLUMNS)
+    pd.testing.assert_frame_equal(result, expected, rtol=1e-10)
+    assert not result.index.to_frame().iloc[:, :-1].isna().any().any()
+
+
+def test_group_corr_matches_pandas(bike):
+    result = group_corr(bike, 'season', COLUMNS)
+    expected = bike.groupby('season', observed=True)[COLUMNS].corr()
+    np.testing.assert_allclose(result.to_numpy(), expected.to_numpy(), rtol=1e-10)
@@ -0,0 +1,47 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from bikeshare.cube import rollup
+from bikeshare.prepare import prepare_bike
+from bikeshare.query import QueryIndex
+from bikeshare.synthetic import synthetic_raw
+
+
+@pytest.fixture(scope='module')
+def bike():
+    # Three weeks of January without holidays: one month, one season
+    bike = prepare_bike(synthetic_raw(24 * 21, start='2015-01-05', seed=3))
+    bike['is_holiday'] = bike['is_holiday'] * 0
+    return bike
+
+
+@pytest.fixture(scope='module')
+def index(bike):
+    return QueryIndex.from_bike(bike, 'test')
+
+
+@pytest.mark.parametrize('filters', [{'month': 12}, {'is_holiday': 1}, {'season': 'summer'},
+                                     {'hour': [3, 4], 'month': 7}])
+def test_valid_values_absent_from_the_data_select_nothing(bike, index, filters):
+    keep = np.logical_and.reduce([bike[name].isin(value if isinstance(value, list) else [value])
+                                  for name, value in filters.items()])
+    assert not keep.any()
+    result = index.query('hour', **filters)
+    assert result.empty
+    assert list(result.columns) == ['n', 'sum', 'sumsq', 'mean', 'std']
+
+
+@pytest.mark.parametrize('filters', [{'hour': 24}, {'month': 0}, {'month': 13}, {'dayofweek': 7},
+                                     {'is_weekend': 2}, {'season': 'monsoon'}, {'weather': 'Fog'},
+                                     {'hour': [5, 25]}, {'hour': '5'}])
+def test_values_outside_the_dimension_are_rejected(index, filters):
+    with pytest.raises(ValueError, match='unknown'):
+        index.query('hour', **filters)
+
+
+@pytest.mark.parametrize('by', ['hour', ['hour', 'season'], ['dayofweek', 'is_weekend']])
+def test_query_matches_rollup(index, by):
+    expected = rollup(index.cube, by, month=1, is_weekend=0)
+    pd.testing.assert_frame_equal(index.query(by, month=[1, 12], is_weekend=0), expected)
+    assert np.isfinite(expected['mean']).all()
@@ -0,0 +1,69 @@
+import os
+
+import pytest
+
+from bikeshare import snapshot
+from bikeshare.colstore import open_bike_store
+from bikeshare.load import load_bike
+from bikeshare.synthetic import synthetic_raw
+
+
+@pytest.fixture
+def csv(tmp_path):
+    path = str(tmp_path / 'bike.csv')
+    synthetic_raw(500, seed=5).to_csv(path, index=False)
+    return path
+
+
+@pytest.fixture
+def digests(monkeypatch):
+    calls = []
+    file_digest = snapshot.file_digest
+
+    def counting(path, *args):
+        calls.append(path)
+        return file_digest(path, *args)
+
+    monkeypatch.setattr(snapshot, 'file_digest', counting)
+    return calls
+
+
+def touch(path):
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+
+
+@pytest.mark.parametrize('load', [load_bike, open_bike_store])
+def test_touch_is_hashed_once(csv, digests, load):
+    load(csv)
+    touch(csv)
+    digests.clear()
+    load(csv)
+    assert digests == [csv]
+    load(csv)
+    load(csv)
+    assert digests == [csv]
+
+
+def test_touched_snapshot_is_reused(csv, digests):
+    bike = load_bike(csv)
+    touch(csv)
+    load_bike(csv)
+    digests.clear()
+    mtime = os.stat(csv).st_mtime_ns
+    assert snapshot.read_snapshot_arrays(csv, snapshot.snapshot_path(csv))['__mtime__'] == mtime
+    assert snapshot.data_version(csv) == snapshot.file_digest(csv)
+    assert load_bike(csv).equals(bike)
+    assert digests == [csv]
+
+
+def test_same_size_edit_is_not_taken_for_a_touch(csv):
+    bike = load_bike(csv)
+    with open(csv, 'rb') as f:
+        header, first, rest = f.read().split(b'\n', 2)
+    # Change the last digit of the first count: same size, different data
+    fields = first.split(b',')
+    fields[1] = fields[1][:-1] + str((int(fields[1][-1:]) + 1) % 10).encode()
+    with open(csv, 'wb') as f:
+        f.write(b'\n'.join([header, b','.join(fields), rest]))
+    assert load_bike(csv)['count'].iloc[0] != bike['count'].iloc[0]
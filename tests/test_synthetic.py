@@ -0,0 +1,27 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from bikeshare.load import load_bike
+from bikeshare.prepare import calendar_parts
+from bikeshare.synthetic import synthetic_raw, write_synthetic_csv
+from bikeshare.validate import check_bike
+
+
+def test_repeated_span_keeps_timestamps_unique_and_loadable(tmp_path):
+    # A 1,000-hour span repeated five times stands in for the 30-year span at 1e8 rows
+    path = write_synthetic_csv(str(tmp_path / 'bike.csv'), 5000, chunksize=1500, span_hours=1000)
+    cache_dir = str(tmp_path / 'cache')
+    first = load_bike(path, cache_dir, validate='strict')
+    again = load_bike(path, cache_dir)
+    pd.testing.assert_frame_equal(again, first)
+    assert first['time'].is_unique and check_bike(first).ok
+    assert first['time'].max() < pd.Timestamp('2016-01-01')
+    hours = first['time'].dt.floor('h').to_numpy()
+    for name, values in calendar_parts(hours).items():
+        np.testing.assert_array_equal(first[name].to_numpy(), values)
+
+
+def test_too_many_repetitions():
+    with pytest.raises(ValueError, match='unique timestamps'):
+        synthetic_raw(10, offset=3600 * 24 - 5, span_hours=24)